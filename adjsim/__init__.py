@@ -1,2 +1,4 @@
-# Import locals
-from . import analysis, callback, color, core, decision, index, utility, visual
\ No newline at end of file
+# Import locals.
+# The visual module is not imported here since it requires PyQt5, an optional dependency.
+# Import it explicitly via 'from adjsim import visual' when needed.
+from . import analysis, callback, color, core, decision, ensemble, index, integration, interaction, lattice, population, profiling, recording, snapshot, utility
\ No newline at end of file
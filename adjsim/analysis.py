@@ -8,7 +8,6 @@ Designed and developed by Sever Topan.
 
 
 # Third Party.
-from matplotlib import pyplot
 import numpy as np
 
 # Local.
@@ -41,7 +40,12 @@ class Tracker(object):
         return NotImplementedError
 
     def plot(self):
-        """Plots the data attribute using pyplot."""
+        """Plots the data attribute using pyplot.
+        
+        Note:
+            matplotlib is imported upon invocation rather than at module load, since it is an optional
+            dependency that headless simulations need not install.
+        """
         return NotImplementedError
 
 
@@ -62,6 +66,8 @@ class AgentCountTracker(Tracker):
 
     def plot(self, block=True):
         """Plots the data attribute using pyplot."""
+        from matplotlib import pyplot
+
         pyplot.style.use('ggplot')
 
         line, = pyplot.plot(self.data, label="Global Agent Count")
@@ -93,17 +99,19 @@ class AgentTypeCountTracker(Tracker):
             while len(agent_type_count) < simulation.time + 1:
                 agent_type_count.append(0)
 
-        for agent in simulation.agents:
+        for agent_type in simulation.agents.types():
             # If type is not present, initialize list entry.
-            if not type(agent) in self.data:
-                self.data[type(agent)] = [0 for i in range(simulation.time + 1)]
+            if not agent_type in self.data:
+                self.data[agent_type] = [0 for i in range(simulation.time + 1)]
 
-            # Increment the counter.
-            self.data[type(agent)][-1] += 1
+            # Set the counter.
+            self.data[agent_type][-1] = simulation.agents.count(agent_type, exact=True)
 
             
     def plot(self, block=True):
         """Plots the data attribute using pyplot."""
+        from matplotlib import pyplot
+
         pyplot.style.use('ggplot')
 
         for agent_type, agent_type_count in self.data.items():
@@ -118,6 +126,38 @@ class AgentTypeCountTracker(Tracker):
 
         pyplot.show(block=block)
 
+class LatticeCountTracker(Tracker):
+    """Counts the number of live lattice cells at each timestep.
+
+    Attributes:
+        data (list): The number of live cells at each timestep.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.data = []
+
+    def __call__(self, simulation):
+        """Tracks the number of live cells in the simulation's lattice."""
+        self.data.append(len(simulation.lattice))
+
+    def plot(self, block=True):
+        """Plots the data attribute using pyplot."""
+        from matplotlib import pyplot
+
+        pyplot.style.use('ggplot')
+
+        line, = pyplot.plot(self.data, label="Live Cell Count")
+        line.set_antialiased(True)
+
+        pyplot.xlabel('Timestep')
+        pyplot.ylabel('Cell Count')
+        pyplot.title('Live Cell Count Over Time')
+        pyplot.legend()
+
+        pyplot.show(block=block)
+
+
 class QLearningHistoryTracker(Tracker):
     """Tracks the loss history of a given QLearningDecision module.
 
@@ -144,7 +184,8 @@ class QLearningHistoryTracker(Tracker):
             
     def plot(self, block=True):
         """Plots the data attribute using pyplot."""
-        
+        from matplotlib import pyplot
+
         pyplot.style.use('ggplot')
 
         for item in self.data:
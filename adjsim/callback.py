@@ -38,6 +38,10 @@ class SingleParameterCallback(Callback):
     """Callback class for a single parameter callback.
     """
 
+    # Set by profiling.Profiler while it is enabled.
+    _profiler = None
+    _profile_name = None
+
     def __init__(self):
         super().__init__()
 
@@ -78,15 +82,74 @@ class SingleParameterCallback(Callback):
         Args:
             parameter (object): the callback parameter.
         """
+        if self._profiler is not None:
+            for callback in list(self.subscriptions):
+                self._profiler._call_callback(self._profile_name, callback, parameter)
+            return
+
         for callback in self.subscriptions:
             callback(parameter)
 
 class AgentChangedCallback(SingleParameterCallback):
     """Callback specialization class for changed agent properties.
+
+    Agents may change in bulk, in which case the callback is invoked once for the whole batch via call_batch.
+    Subscribers registered through register_batch then receive the list of agents in a single call, while
+    other subscribers are called once per agent.
+
+    Attributes:
+        batch_subscriptions (dict): Maps subscribed callables to their batched counterparts.
     """
 
     def __init__(self):
         super().__init__()
+        self.batch_subscriptions = {}
+
+    def register_batch(self, callback, batch_callback):
+        """Registers a callback along with a batched counterpart.
+        
+        Args:
+            callback (callable): the callback, called with a single agent.
+            batch_callback (callable): the batched callback, called with a list of agents.
+        """
+        if not callable(batch_callback):
+            raise utility.InvalidCallbackException
+
+        self.register(callback)
+        self.batch_subscriptions[callback] = batch_callback
+
+    def unregister(self, callback):
+        """Unregisters the callback, along with its batched counterpart.
+        
+        Args:
+            callback (callable): the callback.
+        """
+        super().unregister(callback)
+        self.batch_subscriptions.pop(callback, None)
+
+    def call_batch(self, agents):
+        """Calls all suscribed callables with a batch of agents.
+
+        Subscribers with a batched counterpart are called once with the whole batch.
+        The remaining subscribers are called once per agent.
+        
+        Args:
+            agents (list): the agents.
+        """
+        profiler = self._profiler
+        for callback in list(self.subscriptions):
+            batch_callback = self.batch_subscriptions.get(callback)
+            if batch_callback is not None:
+                if profiler is None:
+                    batch_callback(agents)
+                else:
+                    profiler._call_callback(self._profile_name, batch_callback, agents)
+            else:
+                for agent in agents:
+                    if profiler is None:
+                        callback(agent)
+                    else:
+                        profiler._call_callback(self._profile_name, callback, agent)
 
 
 class SimulationMilestoneCallback(SingleParameterCallback):
@@ -2,23 +2,23 @@
 
 Contains color constants for visual simulations.
 
+Colors are stored as hex strings so that they may be assigned to agents without importing PyQt5.
+They are converted to QtGui.QColor objects by the visual module upon rendering.
+
 Designed and developed by Sever Topan.
 """
 
-# Third party. 
-from PyQt5 import QtGui
-
 # Constants.
-RED_LIGHT = QtGui.QColor('#ff6961')
-RED_DARK = QtGui.QColor('#c23b22')
-BLUE_LIGHT = QtGui.QColor('#aec6cf')
-BLUE_DARK = QtGui.QColor('#779ecb')
-GREEN = QtGui.QColor('#aadd77')
-PINK = QtGui.QColor('#dea5a4')
-WHITE = QtGui.QColor('#f0ead6')
-BROWN_DARK = QtGui.QColor('#64503f')
-BROWN_LIGHT = QtGui.QColor('#a08269')
-GREY = QtGui.QColor('#cfcfc4')
-ORANGE = QtGui.QColor('#ff9447')
+RED_LIGHT = '#ff6961'
+RED_DARK = '#c23b22'
+BLUE_LIGHT = '#aec6cf'
+BLUE_DARK = '#779ecb'
+GREEN = '#aadd77'
+PINK = '#dea5a4'
+WHITE = '#f0ead6'
+BROWN_DARK = '#64503f'
+BROWN_LIGHT = '#a08269'
+GREY = '#cfcfc4'
+ORANGE = '#ff9447'
 
 COLORS = [RED_LIGHT, RED_DARK, BLUE_LIGHT, BLUE_DARK, GREEN, PINK, WHITE]
\ No newline at end of file
@@ -7,23 +7,32 @@ Designed and developed by Sever Topan.
 """
 
 # Standard.
+import os
 import random
 import time
 import sys
 import uuid
-import copy
+import threading
+import pickle
+import bisect
+import itertools
+import collections
+import collections.abc
 
 # Third party.
-from PyQt5 import QtCore, QtGui, QtWidgets
 import numpy as np
 
 # Local.
 from . import utility
 from . import analysis
-from . import visual
 from . import decision
 from . import color
 from . import index
+from . import integration
+from . import interaction
+from . import profiling
+from . import snapshot
+from . import population
 from . import callback
 
 class _ActionSuite(utility.InheritableDict):
@@ -33,48 +42,119 @@ class _ActionSuite(utility.InheritableDict):
     dictionary.
     """
 
+    # Cached (name, action) items. Set at class level so that suites restored from older checkpoints have it.
+    _items = None
+
     def __setitem__(self, key, value):
         """Adds an item to the action suite."""
         if not callable(value):
             raise utility.ActionException
 
         self._data[key] = value
+        self._items = None
+
+    def __delitem__(self, key):
+        """Removes an item from the action suite."""
+        del self._data[key]
+        self._items = None
+
+    def _item_tuple(self):
+        """Obtain a tuple of the (name, action) items, which is cached until the suite changes."""
+        if self._items is None:
+            self._items = tuple(self._data.items())
+
+        return self._items
 
 class Agent(object):
     """The base Agent class. 
     
     All agents added to a simulation must be derived from this.
 
+    The base agent classes declare __slots__, so subclasses that also declare __slots__ carry no
+    instance dictionary. Subclasses that do not declare __slots__ behave as regular python objects.
+
     Attributes:
         actions (_ActionSuite): The _ActionSuite container that holds all actions.
         decision (decision.Decision): The decision object that the agent will use to determine action invocation.
-        order (int): The order in which this agent will take its step relative to others. Equal orders result in
-            no step order guarantee.
+        order (int): The order in which this agent will take its step relative to others. Agents of equal order
+            take their step in the order in which they were added to the simulation.
         step_complete (bool): whether or not the agent has completed its step.
     """
 
+    __slots__ = ("actions", "decision", "step_complete", "_order", "_order_callback", "_exists", "_id",
+                 "__weakref__")
+
     def __init__(self):
-        self.actions = _ActionSuite()
+        self._order_callback = None
+
+        self.actions = self._new_action_suite()
         self.decision = decision.NoCastDecision()
         self.order = 0
         self.step_complete = False
         
         self._exists = True
-        self._id = uuid.uuid4()        
+        self._id = self._new_id()
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+
+        # Decision mutables are registered upon assignment, so that decisions need not scan agents for them.
+        if issubclass(type(value), decision.DecisionMutableValue):
+            decision._register_decision_mutable(type(self), name)
+
+    def __setstate__(self, state):
+        """Restores the state of an unpickled agent, registering the decision mutables it holds."""
+        instance_state, slot_state = state if type(state) is tuple else (state, None)
+        if instance_state:
+            self.__dict__.update(instance_state)
+
+        if slot_state:
+            for name, value in slot_state.items():
+                object.__setattr__(self, name, value)
+
+        decision._register_decision_mutables(self)
+
+    def _new_id(self):
+        """Generates the agent's unique identifier."""
+        return uuid.uuid4()
+
+    def _new_action_suite(self):
+        """Generates the agent's action suite."""
+        return _ActionSuite()
 
     @property
     def id(self):
         """ uuid: A unique identifier for the agent. Read-only."""
         return self._id
 
+    @property
+    def order(self):
+        """int: Obtains the agent's step order."""
+        return self._order
+
+    @order.setter
+    def order(self, value):
+        self._order = value
+
+        # Trigger callback.
+        # This will always be non-None if the agent has been added to a simulation. It may be unset if
+        # a subclass assigns order prior to calling Agent.__init__.
+        order_callback = getattr(self, "_order_callback", None)
+        if order_callback is not None:
+            order_callback(self)
+
 class SpatialAgent(Agent):
     """The Spatial Agent class. 
     
     Builds upon Agent to incorporate 2d spatial coordinates representing the agent's position.
     Any agent that desires to have the movement callback invoked when position is changed should
     inherit from this class.
+
+    If the simulation's population store is initialized, the agent's position is held by the store.
     """
 
+    __slots__ = ("_pos", "_movement_callback", "_store", "_store_slot")
+
     DEFAULT_POS = np.array([0, 0])
 
     def __init__(self, pos=DEFAULT_POS):
@@ -82,13 +162,20 @@ class SpatialAgent(Agent):
         self._pos = None
         self._movement_callback = None
 
+        # Set by population.PopulationStore while the agent is stored.
+        self._store = None
+        self._store_slot = None
+
         # Go through setter so that we do proper type checks.
         self.pos = pos
         
 
     @property
     def pos(self):
-        """np.ndarray: Obtains agent position. The returned array is NOT writeable."""
+        """np.ndarray: Obtains agent position. The returned array is NOT writeable.
+
+        If the agent is held by a population store, the array is a view into the store; see PopulationStore.
+        """
         return self._pos
 
     @pos.setter
@@ -97,10 +184,14 @@ class SpatialAgent(Agent):
         if not type(value) == np.ndarray or value.shape != (2,):
             raise TypeError
         
-        # Make immutable so that we have control over the agent movement callback.
-        value.flags.writeable = False
+        if self._store is not None:
+            # The agent's position is a read-only view into the store, so the value is copied in.
+            self._store._set_position(self, value)
+        else:
+            # Make immutable so that we have control over the agent movement callback.
+            value.flags.writeable = False
 
-        self._pos = value
+            self._pos = value
 
         # Trigger callback.
         # This will always be non-None if the agent has been added to a simulation.
@@ -134,57 +225,516 @@ class VisualAgent(SpatialAgent):
 
     Attributes:
         size (int): The size of the visualized agent.
-        color (QtGui.QColor): The color of the visualized agent.
-        style (QtCore.Qt.Pattern): The pattern of the visualized agent.
+        color (str, QtGui.QColor): The color of the visualized agent. Any value accepted by the QtGui.QColor
+            constructor may be used.
+        style (int, QtCore.Qt.BrushStyle): The pattern of the visualized agent.
     """
 
+    __slots__ = ("_size", "_color", "_style", "_appearance_callback")
+
     DEFAULT_SIZE = 10
     DEFAULT_COLOR = color.BLUE_DARK
-    DEFAULT_STYLE = QtCore.Qt.SolidPattern
+    DEFAULT_STYLE = 1 # QtCore.Qt.SolidPattern, stored as an int so that PyQt5 need not be imported.
 
     def __init__(self, pos=SpatialAgent.DEFAULT_POS, size=DEFAULT_SIZE, color=DEFAULT_COLOR,
                  style=DEFAULT_STYLE):
         super().__init__(pos)
-        self.size = size
-        self.color = color
-        self.style = style
+        self._appearance_callback = None
+        self._size = size
+        self._color = color
+        self._style = style
+
+    def _appearance_changed(self):
+        """Triggers the appearance callback."""
+        # This will always be non-None if the agent has been added to a simulation. It may be unset while
+        # unpickling.
+        appearance_callback = getattr(self, "_appearance_callback", None)
+        if appearance_callback is not None:
+            appearance_callback(self)
+
+    @property
+    def size(self):
+        """int: The size of the visualized agent."""
+        return self._size
+
+    @size.setter
+    def size(self, value):
+        self._size = value
+        self._appearance_changed()
+
+    @property
+    def color(self):
+        """str: The color of the visualized agent."""
+        return self._color
+
+    @color.setter
+    def color(self, value):
+        self._color = value
+        self._appearance_changed()
+
+    @property
+    def style(self):
+        """int: The pattern of the visualized agent."""
+        return self._style
+
+    @style.setter
+    def style(self, value):
+        self._style = value
+        self._appearance_changed()
+
+class _CompactAgentMixin(object):
+    """Mixin that implements the compact agent mode.
+
+    Compact agents are identified by monotonically increasing integers rather than uuids, and share
+    a single _ActionSuite between all agents of the same class within a simulation. Action assignment is
+    therefore class-wide within a simulation: actions set on one agent are set on all agents of its class
+    in the same simulation, but not in others.
+
+    Agents that have not been added to a simulation share a suite per class, typically populated in the
+    class's __init__. Upon being added to a simulation, an agent adopts the suite of its class in that
+    simulation, which is created from the agent's actions if the simulation holds no agents of its class yet.
+    """
+
+    __slots__ = ()
+
+    _id_counter = itertools.count()
+    _class_action_suites = {}
+
+    def _new_id(self):
+        """Generates the agent's unique identifier."""
+        return next(_CompactAgentMixin._id_counter)
+
+    def _new_action_suite(self):
+        """Obtains the action suite shared by the agents of the agent's class outside of simulations."""
+        agent_type = type(self)
+        action_suite = _CompactAgentMixin._class_action_suites.get(agent_type)
+        if action_suite is None:
+            action_suite = _ActionSuite()
+            _CompactAgentMixin._class_action_suites[agent_type] = action_suite
+
+        return action_suite
+
+    @property
+    def id(self):
+        """int: A unique identifier for the agent. Read-only."""
+        return self._id
+
+    @staticmethod
+    def _reserve_ids(max_id):
+        """Ensures that subsequently generated identifiers exceed max_id.
+
+        Args:
+            max_id (int): The largest identifier in use.
+        """
+        next_id = next(_CompactAgentMixin._id_counter)
+        if next_id <= max_id:
+            _CompactAgentMixin._id_counter = itertools.count(max_id + 1)
+        else:
+            _CompactAgentMixin._id_counter = itertools.count(next_id)
+
+class CompactAgent(_CompactAgentMixin, Agent):
+    """The compact Agent class.
+
+    Behaves as Agent, but uses integer identifiers and an action suite shared by all agents of the same class
+    in a simulation. Subclasses should declare __slots__ listing their attributes so that agents carry no
+    instance dictionary.
+    """
+
+    __slots__ = ()
+
+class CompactSpatialAgent(_CompactAgentMixin, SpatialAgent):
+    """The compact Spatial Agent class.
+
+    Behaves as SpatialAgent, but uses integer identifiers and an action suite shared by all agents of the same
+    class in a simulation. Subclasses should declare __slots__ listing their attributes so that agents carry no
+    instance dictionary.
+    """
+
+    __slots__ = ()
+
+class CompactVisualAgent(_CompactAgentMixin, VisualAgent):
+    """The compact Visual Agent class.
+
+    Behaves as VisualAgent, but uses integer identifiers and an action suite shared by all agents of the same
+    class in a simulation. Subclasses should declare __slots__ listing their attributes so that agents carry no
+    instance dictionary.
+    """
+
+    __slots__ = ()
+
+class _AgentTypeView(collections.abc.Set):
+    """A live, read-only view of the agents of a given type in an _AgentSuite.
+
+    This object behaves through the same interface as a python frozenset. Like a set, it may not be
+    iterated over while agents of the given type are being added or removed.
+    """
+
+    def __init__(self, members):
+        self._members = members
+
+    def __contains__(self, value):
+        return value in self._members
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
 
 class _AgentSuite(utility.InheritableSet):
     """Container for agents. May only store objects derived from Agent.
 
     This object behaves through the same interface as a python set. 
-    One additional function is provided to obtain a set copy for use in visualization.
+    Membership is also indexed by agent type, so that agents of a given type may be iterated over
+    or counted without scanning the whole suite.
+
+    Structural changes made during a step may optionally be deferred; see the deferral property.
 
     Attributes:
         callback_suite (_CallbackSuite): Reference to the simulation callback suite.
     """
 
+    DEFER_STEP = "step"
+    DEFER_ORDER = "order"
+
     def __init__(self, callback_suite):
         super().__init__()
 
         # Store references for callbacks
         self.callback_suite = callback_suite
 
+        # Deferred structural changes.
+        self._deferral = None
+        self._deferring = False
+        self._pending_additions = []
+        self._pending_removals = collections.OrderedDict()
+
+        # Type registries, keyed by exact type and by every class in the type's MRO except object, including
+        # mixins that do not derive from Agent.
+        self._exact_types = {}
+        self._types = {}
+
+        # Action suites shared by the compact agents of each class.
+        self._compact_action_suites = {}
+
+    def _registry(self, agent_type, exact):
+        """Obtains the set holding the agents of a given type, creating it if needed."""
+        registry = self._exact_types if exact else self._types
+        members = registry.get(agent_type)
+        if members is None:
+            members = set()
+            registry[agent_type] = members
+
+        return members
+
+    def _adopt_action_suite(self, agent):
+        """Links a compact agent to the action suite shared by its class in the simulation."""
+        agent_type = type(agent)
+        action_suite = self._compact_action_suites.get(agent_type)
+        if action_suite is None:
+            action_suite = _ActionSuite()
+            for name, action in agent.actions.items():
+                action_suite[name] = action
+
+            self._compact_action_suites[agent_type] = action_suite
+
+        agent.actions = action_suite
+
+    def _register_type(self, agent):
+        """Adds an agent to the type registries."""
+        agent_type = type(agent)
+        self._registry(agent_type, True).add(agent)
+
+        for base_type in agent_type.__mro__[:-1]:
+            self._registry(base_type, False).add(agent)
+
+    def _unregister_type(self, agent):
+        """Removes an agent from the type registries."""
+        agent_type = type(agent)
+        self._exact_types[agent_type].discard(agent)
+
+        for base_type in agent_type.__mro__[:-1]:
+            self._types[base_type].discard(agent)
+
+    def of_type(self, agent_type, exact=False):
+        """Obtains a live view of the agents of a given type.
+
+        Args:
+            agent_type (type): The agent type.
+            exact (bool): If True, agents of subclasses of agent_type are excluded.
+
+        Returns:
+            An _AgentTypeView.
+        """
+        return _AgentTypeView(self._registry(agent_type, exact))
+
+    def count(self, agent_type, exact=False):
+        """Obtains the number of agents of a given type in O(1).
+
+        Args:
+            agent_type (type): The agent type.
+            exact (bool): If True, agents of subclasses of agent_type are excluded.
+
+        Returns:
+            An int.
+        """
+        registry = self._exact_types if exact else self._types
+        members = registry.get(agent_type)
+        return 0 if members is None else len(members)
+
+    def types(self):
+        """Obtains the exact types of the agents currently in the suite.
+
+        Returns:
+            A list of types.
+        """
+        return [agent_type for agent_type, members in self._exact_types.items() if members]
+
+    @property
+    def deferral(self):
+        """str: When structural changes made during a step are applied.
+
+        If None (the default), agents are added and removed immediately. If DEFER_STEP, additions and removals
+        requested while a step is in progress are queued and applied in batches once all agents have taken
+        their turn. If DEFER_ORDER, queued changes are applied after each order bucket has taken its turn.
+
+        While deferred, agents remain in the suite until the changes are applied, so actions may iterate over
+        the suite and remove agents without copying it. Removed agents are marked as no longer existing
+        immediately, and so neither take their turn nor appear in index queries. Re-adding an agent whose
+        removal is queued restores it, including in indices.
+        """
+        return self._deferral
+
+    @deferral.setter
+    def deferral(self, value):
+        if not value in (None, _AgentSuite.DEFER_STEP, _AgentSuite.DEFER_ORDER):
+            raise ValueError("Invalid deferral mode.")
+
+        self.apply_deferred()
+        self._deferral = value
+
+    @property
+    def num_pending(self):
+        """int: The number of queued structural changes."""
+        return len(self._pending_additions) + len(self._pending_removals)
+
+    def apply_deferred(self):
+        """Applies all queued structural changes.
+
+        All additions are applied as one batch, followed by all removals, such that the addition and removal
+        callbacks fire once each. Adding an agent whose removal is queued cancels the removal, so the outcome
+        matches applying the changes in the order they were requested. Changes requested by callbacks while
+        applying take effect immediately.
+        """
+        additions = self._pending_additions
+        removals = list(self._pending_removals)
+        self._pending_additions = []
+        self._pending_removals.clear()
+
+        deferring = self._deferring
+        self._deferring = False
+        try:
+            if additions:
+                self.add_many(additions)
+
+            if removals:
+                self.discard_many(removals)
+        finally:
+            self._deferring = deferring
+
+    def _begin_deferral(self):
+        """Starts queueing structural changes if deferral is enabled. Called upon a step starting."""
+        self._deferring = not self._deferral is None
+
+    def _end_deferral(self):
+        """Stops queueing structural changes and applies any that are pending. Called upon a step ending."""
+        self._deferring = False
+        self.apply_deferred()
+
+    def _defer_removal(self, agent):
+        """Queues the removal of an agent, marking it as no longer existing."""
+        if agent in self._pending_removals:
+            return
+
+        agent._exists = False
+        agent.step_complete = True
+        self._pending_removals[agent] = None
+
+    def _defer_addition(self, agent):
+        """Queues the addition of an agent, cancelling its queued removal if there is one."""
+        if agent in self._pending_removals:
+            del self._pending_removals[agent]
+            agent._exists = True
+
+            # The agent never left the suite, but indices may have dropped it upon moving while removed.
+            if agent in self._data:
+                if issubclass(type(agent), SpatialAgent) and agent._movement_callback is not None:
+                    agent._movement_callback(agent)
+                return
+
+        self._pending_additions.append(agent)
+
     def add(self, agent):
         """Adds an item to the agent suite."""
         if not issubclass(type(agent), Agent):
             raise utility.InvalidAgentException
 
+        if self._deferring:
+            self._defer_addition(agent)
+            return
+
         # Add agent.
         self._data.add(agent)
+        self._register_type(agent)
+        if isinstance(agent, _CompactAgentMixin):
+            self._adopt_action_suite(agent)
 
-        # Register movement callback.
+        # Register movement, appearance and order callbacks.
         if issubclass(type(agent), SpatialAgent):
             agent._movement_callback = self.callback_suite.agent_moved
 
+        if issubclass(type(agent), VisualAgent):
+            agent._appearance_callback = self.callback_suite.agent_appearance_changed
+
+        agent._order_callback = self.callback_suite.agent_order_changed
+
         # Trigger addition callback.
         self.callback_suite.agent_added(agent)
 
+    def add_many(self, agents):
+        """Adds multiple items to the agent suite, triggering a single batched addition callback.
+
+        Args:
+            agents (iterable): The agents to add.
+        """
+        agents = list(agents)
+        for agent in agents:
+            if not issubclass(type(agent), Agent):
+                raise utility.InvalidAgentException
+
+        if self._deferring:
+            for agent in agents:
+                self._defer_addition(agent)
+            return
+
+        agents = list(collections.OrderedDict.fromkeys(agents))
+        for agent in agents:
+            # Add agent.
+            self._data.add(agent)
+            self._register_type(agent)
+            if isinstance(agent, _CompactAgentMixin):
+                self._adopt_action_suite(agent)
+
+            # Register movement, appearance and order callbacks.
+            if issubclass(type(agent), SpatialAgent):
+                agent._movement_callback = self.callback_suite.agent_moved
+
+            if issubclass(type(agent), VisualAgent):
+                agent._appearance_callback = self.callback_suite.agent_appearance_changed
+
+            agent._order_callback = self.callback_suite.agent_order_changed
+
+        # Trigger addition callback.
+        self.callback_suite.agent_added.call_batch(agents)
+
+    def discard_many(self, agents):
+        """Discards multiple items from the agent suite, triggering a single batched removal callback.
+
+        Args:
+            agents (iterable): The agents to discard.
+        """
+        if self._deferring:
+            for agent in agents:
+                self._defer_removal(agent)
+            return
+
+        agents = list(collections.OrderedDict.fromkeys(agents))
+        for agent in agents:
+            # 'Euthanize' and remove agent.
+            agent._exists = False
+            agent.step_complete = True
+            if agent in self._data:
+                self._unregister_type(agent)
+                self._data.discard(agent)
+
+        # Trigger callbacks.
+        self.callback_suite.agent_removed.call_batch(agents)
+
+    def discard_where(self, predicate):
+        """Discards all items of the agent suite that satisfy a predicate, triggering a single batched
+        removal callback.
+
+        Args:
+            predicate (callable): Callable that takes an agent and returns a bool.
+
+        Returns:
+            The list of discarded agents.
+        """
+        agents = [agent for agent in self._data if predicate(agent)]
+        self.discard_many(agents)
+
+        return agents
+
+    def move_many(self, agents, positions):
+        """Moves multiple SpatialAgents, triggering a single batched movement callback.
+
+        Args:
+            agents (iterable): The agents to move.
+            positions (np.ndarray): An (n, 2) array of the agents' new positions.
+        """
+        agents = list(agents)
+        for agent in agents:
+            if not issubclass(type(agent), SpatialAgent):
+                raise utility.InvalidAgentException
+
+        # Copy once, so that each agent's position is a read-only row of the copy.
+        values = np.array(positions, dtype=np.float64)
+        if values.shape != (len(agents), 2):
+            raise TypeError
+
+        values.flags.writeable = False
+        for agent, value in zip(agents, values):
+            if agent._store is not None:
+                agent._store._set_position(agent, value)
+            else:
+                agent._pos = value
+
+        # Trigger movement callback.
+        agents = [agent for agent in agents if agent._movement_callback is not None]
+        if agents:
+            self.callback_suite.agent_moved.call_batch(agents)
+
+    def clear(self):
+        """Removes all items from the agent suite, triggering a single batched removal callback."""
+        self.discard_many(list(self._data) + self._pending_additions)
+
+    def pop(self):
+        """Removes and returns an arbitrary item of the agent suite. Raises KeyError if there is none."""
+        for agent in self._data:
+            if not agent in self._pending_removals:
+                self.discard(agent)
+                return agent
+
+        raise KeyError
+
+    def remove(self, value):
+        """Removes an item from the agent suite. Raises KeyError if it is absent, or already queued for removal."""
+        if not value in self._data or value in self._pending_removals:
+            raise KeyError(value)
+
+        self.discard(value)
+
     def discard(self, value):
         """Discards an item to the agent suite."""
+        if self._deferring:
+            self._defer_removal(value)
+            return
+
         # 'Euthanize' and remove agent.
         value._exists = False
         value.step_complete = True
+        if value in self._data:
+            self._unregister_type(value)
         return_val = self._data.discard(value)
 
         # Trigger callbacks.
@@ -192,23 +742,6 @@ class _AgentSuite(utility.InheritableSet):
 
         return return_val
 
-    def visual_snapshot(self):
-        """Obtains a copy of the agent suite for visualization.
-        
-        Returns:
-            A set of VisualAgent objects.
-        """
-        return_set = set()
-
-        for agent in self._data:
-            if issubclass(type(agent), VisualAgent):
-                visual_copy = VisualAgent(pos=copy.copy(agent.pos), size=copy.copy(agent.size), 
-                                          color=copy.copy(agent.color), style=copy.copy(agent.style))
-                visual_copy._id = copy.copy(agent.id)
-                return_set.add(visual_copy)
-
-        return return_set
-
 
 class _TrackerSuite(utility.InheritableDict):
     """Container for trackers. May only store objects derived from Tracker.
@@ -225,6 +758,83 @@ class _TrackerSuite(utility.InheritableDict):
 
         self._data[key] = value
 
+class _InteractionSuite(utility.InheritableDict):
+    """Container for interactions. May only store objects derived from Interaction.
+
+    This object behaves through the same interface as a python dictionary.
+
+    Args:
+        simulation (Simulation): The parent simulation.
+    """
+
+    def __init__(self, simulation):
+        super().__init__()
+        self._simulation = simulation
+
+    def __setitem__(self, key, value):
+        """Adds an item to the interaction suite."""
+        if not issubclass(type(value), interaction.Interaction):
+            raise utility.InteractionException
+
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        """Removes an item from the interaction suite."""
+        del self._data[key]
+
+    def evaluate(self, agents=None, positions=None):
+        """Evaluate and sum all interactions.
+
+        Args:
+            agents (list): The agents to evaluate the interactions for. Defaults to all SpatialAgents.
+            positions (np.ndarray): An (n, 2) array of positions to use for agents instead of their current
+                positions. See interaction.Interaction.evaluate.
+
+        Returns:
+            An (n, 2) np.ndarray of the summed contributions to each agent.
+        """
+        if agents is None:
+            agents = list(self._simulation.agents.of_type(SpatialAgent))
+
+        if positions is None:
+            positions = interaction._positions(agents)
+
+        result = np.zeros((len(agents), 2))
+        for value in self._data.values():
+            result += value.evaluate(self._simulation, agents, positions)
+
+        return result
+
+class _IntegratorSuite(utility.InheritableDict):
+    """Container for integrators. May only store objects derived from Integrator.
+
+    This object behaves through the same interface as a python dictionary. Integrators are stepped in
+    insertion order.
+
+    Args:
+        simulation (Simulation): The parent simulation.
+    """
+
+    def __init__(self, simulation):
+        super().__init__()
+        self._simulation = simulation
+
+    def __setitem__(self, key, value):
+        """Adds an item to the integrator suite."""
+        if not issubclass(type(value), integration.Integrator):
+            raise utility.IntegratorException
+
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        """Removes an item from the integrator suite."""
+        del self._data[key]
+
+    def _step(self):
+        """Advance all integrators by one simulation step."""
+        for value in self._data.values():
+            value.step(self._simulation)
+
 class _CallbackSuite(object):
     """Container for callbacks.
 
@@ -232,11 +842,17 @@ class _CallbackSuite(object):
         agent_added (callback.AgentChangedCallback): Fires when an Agent is added to the agent set.
         agent_removed (callback.AgentChangedCallback): Fires when an Agent is removed from the agent set.
         agent_moved (callback.AgentChangedCallback): Fires when a SpatialAgent's pos attribute is set.
+        agent_order_changed (callback.AgentChangedCallback): Fires when an Agent's order attribute is set.
+        agent_appearance_changed (callback.AgentChangedCallback): Fires when a VisualAgent's size, color or
+            style attribute is set.
         simulation_step_started (callback.SimulationMilestoneCallback): Fires when a Simulation step is started.
         simulation_step_complete (callback.SimulationMilestoneCallback): Fires when a Simulation step is ended.
         simulation_started (callback.SimulationMilestoneCallback): Fires when the Simulation starts.
         simulation_complete (callback.SimulationMilestoneCallback): Fires when the Simulation ends.
-        
+
+    Note:
+        agent_added and agent_removed fire once per batch when agents are added or removed in bulk.
+        See callback.AgentChangedCallback.register_batch.
     """
 
     def __init__(self):
@@ -244,6 +860,8 @@ class _CallbackSuite(object):
         self.agent_added = callback.AgentChangedCallback()
         self.agent_removed = callback.AgentChangedCallback()
         self.agent_moved = callback.AgentChangedCallback()
+        self.agent_order_changed = callback.AgentChangedCallback()
+        self.agent_appearance_changed = callback.AgentChangedCallback()
         
         self.simulation_step_started = callback.SimulationMilestoneCallback()
         self.simulation_step_complete = callback.SimulationMilestoneCallback()
@@ -251,18 +869,139 @@ class _CallbackSuite(object):
         self.simulation_complete = callback.SimulationMilestoneCallback()
 
 
+class _AgentSchedule(object):
+    """Maintains the order in which agents take their step.
+
+    Agents are stored in buckets keyed by their order attribute. Buckets are kept up to date through the
+    agent_added, agent_removed and agent_order_changed callbacks, so that the step order need not be sorted on
+    every step. The flattened step order is cached until agents are added, removed or reordered, so steps in
+    which the schedule does not change allocate nothing. Agents within a bucket retain their insertion order.
+    """
+
+    def __init__(self, callback_suite):
+        self._orders = []
+        self._buckets = {}
+        self._agent_orders = {}
+        self._snapshot = None
+        self._snapshot_buckets = None
+
+        # Init callbacks.
+        callback_suite.agent_added.register(self._on_agent_added)
+        callback_suite.agent_removed.register(self._on_agent_removed)
+        callback_suite.agent_order_changed.register(self._on_agent_order_changed)
+
+    def __len__(self):
+        return len(self._agent_orders)
+
+    def __iter__(self):
+        """Iterates through the scheduled agents in step order."""
+        for order in self._orders:
+            yield from self._buckets[order]
+
+    def snapshot(self):
+        """Obtains the current step order.
+
+        Returns:
+            A tuple of agents, sorted by order. It is shared between calls until the schedule changes.
+        """
+        if self._snapshot is None:
+            self._snapshot = tuple(self)
+
+        return self._snapshot
+
+    def snapshot_buckets(self):
+        """Obtains the current step order, grouped by order.
+
+        Returns:
+            A tuple of tuples of agents, sorted by order. It is shared between calls until the schedule changes.
+        """
+        if self._snapshot_buckets is None:
+            self._snapshot_buckets = tuple(tuple(self._buckets[order]) for order in self._orders)
+
+        return self._snapshot_buckets
+
+    def _invalidate(self):
+        """Discards the cached step order."""
+        self._snapshot = None
+        self._snapshot_buckets = None
+
+    def _insert(self, agent):
+        """Inserts an agent into the bucket corresponding to its order."""
+        order = agent.order
+        bucket = self._buckets.get(order)
+        if bucket is None:
+            bucket = collections.OrderedDict()
+            self._buckets[order] = bucket
+            bisect.insort(self._orders, order)
+
+        bucket[agent] = None
+        self._agent_orders[agent] = order
+        self._invalidate()
+
+    def _remove(self, agent):
+        """Removes an agent from its bucket, discarding the bucket if it is emptied."""
+        order = self._agent_orders.pop(agent)
+        bucket = self._buckets[order]
+        del bucket[agent]
+
+        if not bucket:
+            del self._buckets[order]
+            del self._orders[bisect.bisect_left(self._orders, order)]
+
+        self._invalidate()
+
+    def _on_agent_added(self, agent):
+        """Callback function called upon an agent being added.
+
+        Args:
+            agent (Agent): The agent that was added.
+        """
+        if agent in self._agent_orders:
+            return
+
+        self._insert(agent)
+
+    def _on_agent_removed(self, agent):
+        """Callback function called upon an agent being removed.
+
+        Args:
+            agent (Agent): The agent that was removed.
+        """
+        if agent in self._agent_orders:
+            self._remove(agent)
+
+    def _on_agent_order_changed(self, agent):
+        """Callback function called upon an agent's order being set.
+
+        Args:
+            agent (Agent): The agent whose order was set.
+        """
+        previous_order = self._agent_orders.get(agent)
+        if previous_order is None or previous_order == agent.order:
+            return
+
+        self._remove(agent)
+        self._insert(agent)
+
+
 class _IndexSuite(object):
     """Container for indidces.
     """
 
     def __init__(self, simulation):
         self._grid = index.GridIndex(simulation)
+        self._kdtree = index.KDTreeIndex(simulation)
 
     @property
     def grid(self):
         """Obtain the grid index."""
         return self._grid
 
+    @property
+    def kdtree(self):
+        """Obtain the k-d tree index."""
+        return self._kdtree
+
 
 
 class Simulation(object):
@@ -274,21 +1013,39 @@ class Simulation(object):
         callbacks (_CallbackSuite): The Simulation's callbacks.
         agents (_AgentSuite): The Simulation's agents.
         trackers (_TrackerSuite): The Simulation's trackers.
+        interactions (_InteractionSuite): The Simulation's pairwise interactions.
+        integrators (_IntegratorSuite): The Simulation's time integrators.
         indices (_IndexSuite): The Simulation's indices.
+        population (population.PopulationStore): The Simulation's opt-in struct-of-arrays agent store.
+        profiler (profiling.Profiler): The Simulation's profiler. Disabled by default.
+        snapshots (snapshot.SnapshotEncoder): Encodes the Simulation's visual agents into packed snapshots.
         end_condition (callable): The Simulation's end condition.
         time (int): The current Simulation time. Reflects step count.
     """
 
+    CHECKPOINT_FORMAT_VERSION = 2
+    DEFAULT_CHECKPOINT_KEEP = 3
+
     def __init__(self):
         self.callbacks = _CallbackSuite()
         self.agents = _AgentSuite(self.callbacks)
         self.trackers = _TrackerSuite()
+        self.interactions = _InteractionSuite(self)
+        self.integrators = _IntegratorSuite(self)
+        self._schedule = _AgentSchedule(self.callbacks)
         self.indices = _IndexSuite(self)
+        self.population = population.PopulationStore(self)
+        self.profiler = profiling.Profiler(self)
+        self.snapshots = snapshot.SnapshotEncoder(self)
         self.end_condition = None
         self.time = 0
 
         self._prev_print_str_len = 0
         self._running = False
+        self._checkpoint_path = None
+        self._checkpoint_interval = None
+        self._checkpoint_keep = None
+        self._checkpoint_history = collections.deque()
 
     def start(self):
         """Starts a simulation instance.
@@ -330,6 +1087,10 @@ class Simulation(object):
         
         This is where one iteration of the ABM loop occurs.
         """
+        profiler = self.profiler if self.profiler.enabled else None
+        if profiler is not None:
+            start = time.perf_counter()
+
         # Perform setup in needed.
         if self.time == 0:
             self._track()
@@ -337,19 +1098,40 @@ class Simulation(object):
         # Call milestone callback.
         self.callbacks.simulation_step_started(self)
 
-        # Iterate through agents in sorted order
-        for agent in sorted(self.agents, key=lambda a: a.order):
-            # Check if agent has been removed in previous iteration
-            if not agent._exists:
-                continue
+        # Advance physical agents.
+        if self.integrators:
+            self.integrators._step()
 
-            # Delegate action casting to decision module.
-            try:
-                agent.decision(self, agent)
-            except:
-                raise utility.DecisionException
+        # Group agents such that deferred changes are applied at the end of each group.
+        if self.agents.deferral == _AgentSuite.DEFER_ORDER:
+            groups = self._schedule.snapshot_buckets()
+        else:
+            groups = (self._schedule.snapshot(),)
 
-            agent.step_complete = False
+        # Iterate through agents in order. Snapshots are replaced rather than modified, so agents may be added,
+        # removed or reordered during the step.
+        self.agents._begin_deferral()
+        try:
+            for group in groups:
+                for agent in group:
+                    # Check if agent has been removed in previous iteration
+                    if not agent._exists:
+                        continue
+
+                    # Delegate action casting to decision module.
+                    try:
+                        if profiler is None:
+                            agent.decision(self, agent)
+                        else:
+                            profiler._call_decision(agent)
+                    except:
+                        raise utility.DecisionException
+
+                    agent.step_complete = False
+
+                self.agents.apply_deferred()
+        finally:
+            self.agents._end_deferral()
 
         self.time += 1
 
@@ -358,6 +1140,9 @@ class Simulation(object):
         # Call milestone callback.
         self.callbacks.simulation_step_complete(self)
 
+        if profiler is not None:
+            profiler._record_step(time.perf_counter() - start)
+
 
     def step(self, num_timesteps=1):
         """Performs a given number of simulation steps. 
@@ -400,11 +1185,129 @@ class Simulation(object):
         self.step(num_timesteps)
         self.end()
 
+    def checkpoint(self, path):
+        """Saves the state of the simulation to a file, from which it may be resumed using restore.
+
+        The whole simulation is saved, including agents and their decision-mutable values, time, tracker data,
+        index and population store state, as well as the state of Python's and NumPy's global random number
+        generators. The checkpoint is streamed to disk and written to a temporary file first, so an existing
+        checkpoint at path is only replaced once the new one is complete.
+
+        Note:
+            Callables (actions, decisions' perception and loss, end conditions, callbacks) are stored by
+            reference. They must therefore be defined at module level, and be importable upon restore.
+
+        Args:
+            path (str): The path of the checkpoint file.
+        """
+        temp_path = path + ".tmp"
+
+        try:
+            with open(temp_path, "wb") as checkpoint_file:
+                pickler = pickle.Pickler(checkpoint_file, pickle.HIGHEST_PROTOCOL)
+                pickler.dump(Simulation.CHECKPOINT_FORMAT_VERSION)
+                pickler.dump((random.getstate(), np.random.get_state()))
+                pickler.dump(self)
+        except BaseException as error:
+            # Never leave a partial checkpoint behind, whatever interrupted the write.
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+            if isinstance(error, (pickle.PicklingError, AttributeError, TypeError)):
+                raise utility.CheckpointException from error
+
+            raise
+
+        os.replace(temp_path, path)
+
+    @classmethod
+    def restore(cls, path):
+        """Restores a simulation from a file written by checkpoint.
+
+        A simulation that was running when it was saved remains running; call step to resume it.
+
+        Args:
+            path (str): The path of the checkpoint file.
+
+        Returns:
+            The restored Simulation.
+        """
+        with open(path, "rb") as checkpoint_file:
+            unpickler = pickle.Unpickler(checkpoint_file)
+            if unpickler.load() != Simulation.CHECKPOINT_FORMAT_VERSION:
+                raise utility.CheckpointException
+
+            random_state, numpy_random_state = unpickler.load()
+            simulation = unpickler.load()
+
+        if not isinstance(simulation, cls):
+            raise TypeError("Checkpoint does not contain a {} object.".format(cls.__name__))
+
+        random.setstate(random_state)
+        np.random.set_state(numpy_random_state)
+        simulation.population._rebind()
+
+        # Integer identifiers are only unique within a process, so skip past those in use.
+        compact_ids = [agent.id for agent in simulation.agents if isinstance(agent, _CompactAgentMixin)]
+        if compact_ids:
+            _CompactAgentMixin._reserve_ids(max(compact_ids))
+
+        return simulation
+
+    def checkpoint_periodically(self, path, interval, keep=DEFAULT_CHECKPOINT_KEEP):
+        """Automatically checkpoint the simulation at the end of every interval steps.
+
+        Checkpoints are written to '<path>.<time>'. Only the most recent keep checkpoints are retained;
+        older ones are deleted.
+
+        Args:
+            path (str): The path prefix of the checkpoint files.
+            interval (int): The number of steps between checkpoints. None disables periodic checkpoints.
+            keep (int): The number of checkpoints to retain.
+        """
+        if interval is None:
+            self.callbacks.simulation_step_complete.unregister(self._checkpoint_on_step_complete)
+            self._checkpoint_interval = None
+            return
+
+        if interval <= 0 or keep <= 0:
+            raise ValueError("Checkpoint interval and retention count must be positive.")
+
+        self._checkpoint_path = path
+        self._checkpoint_interval = interval
+        self._checkpoint_keep = keep
+        self.callbacks.simulation_step_complete.register(self._checkpoint_on_step_complete)
+
+    def _checkpoint_on_step_complete(self, simulation):
+        """Callback that writes periodic checkpoints and rotates old ones out.
+
+        Args:
+            simulation (Simulation): The Simulation.
+        """
+        if self.time % self._checkpoint_interval != 0:
+            return
+
+        path = "{}.{}".format(self._checkpoint_path, self.time)
+        if not path in self._checkpoint_history:
+            self._checkpoint_history.append(path)
+
+        # Remove the oldest checkpoints, keeping the one about to be written.
+        while len(self._checkpoint_history) > self._checkpoint_keep:
+            old_path = self._checkpoint_history.popleft()
+            if os.path.isfile(old_path):
+                os.remove(old_path)
+
+        self.checkpoint(path)
+
     def _track(self):
         """Calls the Simulation's trackers."""
+        profiler = self.profiler if self.profiler.enabled else None
         try:
-            for tracker in self.trackers.values():
-                tracker(self)
+            for key, tracker in self.trackers.items():
+                if profiler is None:
+                    tracker(self)
+                else:
+                    profiler._call_tracker(key, tracker)
         except:
             raise utility.TrackerException
 
@@ -432,14 +1335,88 @@ class VisualSimulation(Simulation):
     """The Visual Simulation object.
 
     This derivation of the Simulation object uses PyQt5 to render a visual representation
-    of an active simulation.
+    of an active simulation. PyQt5 is only imported once the simulation is stepped.
+
+    By default, the simulation waits for each frame to finish animating before taking its next step.
+    In decoupled mode, the simulation instead runs at full speed and publishes its latest state every
+    render_interval steps. The view presents the latest published state at up to frame_rate frames per
+    second; states published while a frame is still being presented are dropped.
+
+    Large populations may be drawn by a batched view, which draws every agent in a single paint pass with
+    viewport culling and level of detail, rather than by a graphics item per agent.
+
+    If an output is set, no window is opened. Frames are instead rendered offscreen by the same view and
+    exported as a PNG sequence or a video file (see visual.FrameExporter), so no display is required.
+    Frames are exported every render_interval steps, until the simulation ends.
+
+    Attributes:
+        batched (bool): Whether or not to draw with the batched view. Defaults to False.
+        decoupled (bool): Whether or not stepping is decoupled from rendering. Defaults to False.
+        frame_rate (float): The target number of frames presented per second in decoupled mode, and the
+            frame rate of exported videos.
+        render_interval (int): The number of steps between rendered frames. Defaults to 1.
+        dropped_frames (int): The number of published frames that were never presented.
+        output (str): The directory or video file to export frames to instead of opening a window.
+            Defaults to None.
+        frame_size (tuple): The width and height of exported frames, in pixels.
     """
 
+    DEFAULT_FRAME_RATE = 30
+    DEFAULT_FRAME_SIZE = (1000, 800)
+
     def __init__(self):
         super().__init__()
 
+        self.batched = False
+        self.decoupled = False
+        self.frame_rate = VisualSimulation.DEFAULT_FRAME_RATE
+        self.render_interval = 1
+        self.dropped_frames = 0
+        self.output = None
+        self.frame_size = VisualSimulation.DEFAULT_FRAME_SIZE
+
         self._setup_required = True
         self._wait_on_visual_init = 1
+        self._frame = None
+        self._exporter = None
+
+    def __getstate__(self):
+        """Excludes graphics objects, which only exist while stepping, from pickled state."""
+        state = self.__dict__.copy()
+        for name in ("_q_app", "_view", "_visual_thread", "_update_semaphore", "_presenter", "_frame_lock"):
+            state.pop(name, None)
+
+        state["_setup_required"] = True
+        state["_frame"] = None
+        state["_exporter"] = None
+        return state
+
+    def _publish_frame(self, frame):
+        """Publishes the latest frame for presentation.
+
+        A frame that was not yet presented is merged with the new one, so that no changes are lost.
+
+        Args:
+            frame (snapshot.Snapshot, snapshot.DeltaSnapshot): The frame to present.
+        """
+        with self._frame_lock:
+            if self._frame is not None:
+                self.dropped_frames += 1
+                frame = self._frame.merge(frame)
+
+            self._frame = frame
+
+    def _take_frame(self):
+        """Takes the latest published frame.
+
+        Returns:
+            The frame, or None if no frame was published since the last call.
+        """
+        with self._frame_lock:
+            frame = self._frame
+            self._frame = None
+
+        return frame
 
     def _super_step(self, num_timesteps):
         """Calls the step method on Simulation base.
@@ -449,19 +1426,55 @@ class VisualSimulation(Simulation):
         """
         super().step(num_timesteps)
 
+    def _export_frame(self, frame):
+        """Renders a frame offscreen and queues it for export.
+
+        Args:
+            frame (snapshot.Snapshot, snapshot.DeltaSnapshot): The frame to render.
+        """
+        self._view.update(frame)
+        self._exporter.submit(self._view.grab().toImage())
+
     def _step_single(self):
         """Visual implementation of single step."""
+        if self._exporter is not None:
+            # Export initial frame.
+            if self._setup_required:
+                self._setup_required = False
+                self._export_frame(self.snapshots.full())
+
+            super()._step_single()
+
+            if self.time % self.render_interval == 0:
+                self._export_frame(self.snapshots.delta())
+
+            return
+
+        if self.decoupled:
+            # Publish initial frame.
+            if self._setup_required:
+                self._setup_required = False
+                self._publish_frame(self.snapshots.full())
+
+            super()._step_single()
+
+            if self.time % self.render_interval == 0:
+                self._publish_frame(self.snapshots.delta())
+
+            return
+
         # Paint initial frame.
         if self._setup_required:
             self._setup_required = False
-            self._visual_thread.update_signal.emit(self.agents.visual_snapshot())
+            self._visual_thread.update_signal.emit(self.snapshots.full())
             time.sleep(self._wait_on_visual_init)
 
         super()._step_single()
 
         # Wait for animaiton.
-        self._visual_thread.update_semaphore.acquire(1)
-        self._visual_thread.update_signal.emit(self.agents.visual_snapshot())
+        if self.time % self.render_interval == 0:
+            self._visual_thread.update_semaphore.acquire(1)
+            self._visual_thread.update_signal.emit(self.snapshots.delta())
 
     def step(self, num_timesteps=1):
         """Perform a given number of visual simulation steps.
@@ -473,23 +1486,88 @@ class VisualSimulation(Simulation):
         if not self._running:
             raise utility.SimulatonWorkflowException()
 
+        if self.frame_rate <= 0 or self.render_interval < 1:
+            raise ValueError("Frame rate must be positive, and render interval must be at least 1.")
+
+        # Import graphics libraries lazily so that headless simulations never load them.
+        from PyQt5 import QtCore
+        from . import visual
+
+        if self.output is not None:
+            self._step_offscreen(num_timesteps)
+            return
+
         # Perform threading initialization for graphics.
         self._setup_required = True
         self._update_semaphore = QtCore.QSemaphore(0)
-        self._q_app = QtWidgets.QApplication([]) 
-        self._view = visual.AdjGraphicsView(self._q_app.desktop().screenGeometry(), self._update_semaphore)
+        self._q_app = visual.application()
+        view_type = visual.BatchedView if self.batched else visual.AdjGraphicsView
+        self._view = view_type(self._q_app.desktop().screenGeometry(), self._update_semaphore)
         self._visual_thread = visual.AdjThread(self._q_app, self, num_timesteps)
 
         self._visual_thread.finished.connect(self._q_app.exit)
         self._visual_thread.update_signal.connect(self._view.update)
 
+        # Present published frames from the GUI thread.
+        self._frame_lock = threading.Lock()
+        self._frame = None
+        if self.decoupled:
+            self._presenter = visual.FramePresenter(self._view, self, self.frame_rate)
+
         # Begin simulation.
         self._visual_thread.start()
         self._q_app.exec_()
 
-        # Cleanup variables.
+        # Cleanup variables. Graphics objects are released explicitly rather than left to the garbage collector,
+        # which may otherwise destroy them on another thread or after the application.
         self._visual_thread.quit()
+        self._visual_thread.wait()
+        self._visual_thread.finished.disconnect()
+        self._visual_thread.update_signal.disconnect()
+        self._visual_thread.setParent(None)
+        self._view.clear_items()
+        if self.decoupled:
+            self._presenter.stop()
+            del self._presenter
         del self._visual_thread
         del self._view
         del self._q_app
         del self._update_semaphore
+
+    def _step_offscreen(self, num_timesteps):
+        """Perform a given number of steps, exporting frames rather than presenting them.
+
+        The view and exporter are created upon the first step, and kept until the simulation ends.
+
+        Args:
+            num_timesteps (int): The number of timesteps to simulate.
+        """
+        from . import visual
+
+        if self._exporter is None:
+            self._q_app = visual.application(offscreen=True)
+            self._view = visual.offscreen_view(self.batched, self.frame_size)
+            self._exporter = visual.FrameExporter(self.output, self.frame_rate)
+            self._setup_required = True
+
+        # Frames are rendered on this thread, which owns the view.
+        super().step(num_timesteps)
+
+    def end(self):
+        """Ends a simulation instance, finalizing any exported frames.
+
+        Note:
+            This function triggers the simulation_ended callback.
+        """
+        if self._exporter is not None:
+            exporter = self._exporter
+            self._exporter = None
+
+            self._view.clear_items()
+            self._view.close()
+            del self._view
+            del self._q_app
+
+            exporter.close()
+
+        super().end()
@@ -17,7 +17,6 @@ import copy
 import math
 
 # Third party.
-from matplotlib import pyplot
 import numpy as np
 
 # Local.
@@ -582,6 +581,137 @@ class _ActionPremise(object):
         """Debug printing."""
         return repr(self.iterations)
 
+# The module defining the base agent classes. It is not imported here, since it imports this module.
+_CORE_MODULE_NAME = __package__ + ".core"
+
+class _DecisionMutableSchema(object):
+    """The names of the attributes that may hold decision mutables on the agents of a class.
+
+    Attributes:
+        descriptor_names (frozenset): The names of slots and other data descriptors, whose values must be read
+            from each agent.
+        class_names (tuple): The names of class attributes that are decision mutables.
+        instance_names (set): The names of attributes that have been assigned decision mutables on any agent
+            of the class.
+    """
+
+    def __init__(self, descriptor_names, class_names):
+        self.descriptor_names = descriptor_names
+        self.class_names = class_names
+        self.instance_names = set()
+        self._names = None
+
+    @property
+    def names(self):
+        """tuple: All candidate names, sorted."""
+        if self._names is None:
+            self._names = tuple(sorted(self.descriptor_names.union(self.class_names, self.instance_names)))
+
+        return self._names
+
+    def register(self, name):
+        """Registers the name of an attribute that was assigned a decision mutable."""
+        if not name in self.instance_names and not name in self.descriptor_names:
+            self.instance_names.add(name)
+            self._names = None
+
+# Class-level decision mutable schemas, keyed by agent class.
+_decision_mutable_schemas = {}
+
+def _decision_mutable_schema(agent_type):
+    """Obtain the decision mutable schema of an agent class, scanning the class once.
+
+    Returns:
+        A _DecisionMutableSchema.
+    """
+    schema = _decision_mutable_schemas.get(agent_type)
+    if schema is not None:
+        return schema
+
+    descriptor_names = []
+    class_names = []
+    for name in dir(agent_type):
+        if name.startswith("__") and name.endswith("__"):
+            continue
+
+        # Obtain the attribute as defined on the class, without invoking descriptors.
+        for base_type in agent_type.__mro__:
+            if name in base_type.__dict__:
+                value = base_type.__dict__[name]
+                break
+        else:
+            continue
+
+        # The slots and properties of the base agent classes never hold decision mutables.
+        if issubclass(type(value), DecisionMutableValue):
+            class_names.append(name)
+        elif (hasattr(type(value), "__get__") and hasattr(type(value), "__set__")
+              and base_type.__module__ != _CORE_MODULE_NAME):
+            descriptor_names.append(name)
+
+    schema = _DecisionMutableSchema(frozenset(descriptor_names), tuple(class_names))
+    _decision_mutable_schemas[agent_type] = schema
+
+    return schema
+
+def _register_decision_mutable(agent_type, name):
+    """Registers that an attribute of an agent was assigned a decision mutable. Called by Agent.__setattr__.
+
+    Args:
+        agent_type (type): The class of the agent.
+        name (str): The name of the attribute.
+    """
+    _decision_mutable_schema(agent_type).register(name)
+
+def _register_decision_mutables(agent):
+    """Registers the decision mutables held by an agent's instance dictionary.
+
+    Only needed where attributes are set without Agent.__setattr__, such as upon unpickling.
+
+    Args:
+        agent (Agent): The agent.
+    """
+    schema = _decision_mutable_schema(type(agent))
+    for name, value in getattr(agent, "__dict__", {}).items():
+        if issubclass(type(value), DecisionMutableValue):
+            schema.register(name)
+
+def _decision_mutables(source):
+    """Obtain an agent's decision mutable values.
+
+    The class of the agent is scanned once for slots, other data descriptors and class attributes that are
+    decision mutables. Agents register the names of attributes they assign decision mutables to. Every call
+    then reads only those names, so its cost does not depend on the agent's other attributes, while agents of
+    the same class may hold different decision mutables, and attributes may be replaced at any time.
+    Attributes that raise AttributeError, such as unset slots, are skipped.
+
+    Args:
+        source (Agent): The agent.
+
+    Returns:
+        A list of (name, DecisionMutableValue) tuples, ordered by name.
+    """
+    mutables = []
+    for name in _decision_mutable_schema(type(source)).names:
+        try:
+            value = getattr(source, name)
+        except AttributeError:
+            continue
+
+        if issubclass(type(value), DecisionMutableValue):
+            mutables.append((name, value))
+
+    return mutables
+
+def _action_items(source):
+    """Obtain a sequence of an agent's (name, action) items, cached by the action suite where possible."""
+    actions = source.actions
+    item_tuple = getattr(actions, "_item_tuple", None)
+    if item_tuple is not None:
+        return item_tuple()
+
+    return list(actions.items())
+
 class Decision(object):
     """The base decision class.
 
@@ -611,14 +741,12 @@ class RandomSingleCastDecision(Decision):
             return
 
         # Set decision mutable values to random values.
-        decision_mutable_names = [d for d in dir(source) if issubclass(type(getattr(source, d)), DecisionMutableValue)]
-        for decision_mutable_name in decision_mutable_names:
-            decision_mutable = getattr(source, decision_mutable_name)
+        for _, decision_mutable in _decision_mutables(source):
             decision_mutable._set_value_random()
 
         # Randomly execute an action.
         try:
-            action = random.choice(list(source.actions.values()))
+            _, action = random.choice(_action_items(source))
             action(simulation, source)
         except:
             raise utility.ActionException
@@ -637,13 +765,11 @@ class RandomRepeatedCastDecision(Decision):
         # Randomly execute an action while the agent has not completed their timestep.
         while not source.step_complete:
             # Set decision mutable values to random values.
-            decision_mutable_names = [d for d in dir(source) if issubclass(type(getattr(source, d)), DecisionMutableValue)]
-            for decision_mutable_name in decision_mutable_names:
-                decision_mutable = getattr(source, decision_mutable_name)
+            for _, decision_mutable in _decision_mutables(source):
                 decision_mutable._set_value_random()
 
             try:
-                action = random.choice(list(source.actions.values()))
+                _, action = random.choice(_action_items(source))
                 action(simulation, source)
             except:
                 raise utility.ActionException
@@ -844,16 +970,14 @@ class QLearningDecision(FunctionalDecision):
             action_premise_iteration = _ActionPremiseIteration()
 
             # Set decision mutable values to random values, save to action premise.
-            decision_mutable_names = [d for d in dir(source) if issubclass(type(getattr(source, d)), DecisionMutableValue)]
-            for decision_mutable_name in decision_mutable_names:
-                decision_mutable = getattr(source, decision_mutable_name)
+            for decision_mutable_name, decision_mutable in _decision_mutables(source):
                 decision_mutable._set_value_random()
 
                 action_premise_iteration.decision_mutables.append(_DecisionMutablePremise(decision_mutable_name, decision_mutable.value))
 
             # Cast fallback decision, save to action premise.
             try:
-                identifier, action = random.choice(list(source.actions.items()))
+                identifier, action = random.choice(_action_items(source))
                 action(self._simulation, source)
                 action_premise_iteration.action_name = identifier
             except:
@@ -1110,9 +1234,7 @@ class PerturbativeQLearningDecision(QLearningDecision):
         while not source.step_complete and iteration_index < len(action_premise.iterations):
             # Set and locally perturb decision mutables.
             action_premise.iterations[iteration_index].set_mutables(source)
-            decision_mutable_names = [d for d in dir(source) if issubclass(type(getattr(source, d)), DecisionMutableValue)]
-            for decision_mutable_name in decision_mutable_names:
-                decision_mutable = getattr(source, decision_mutable_name)
+            for _, decision_mutable in _decision_mutables(source):
                 decision_mutable._perturb_locally()
 
             # Invoke action.
@@ -1125,16 +1247,14 @@ class PerturbativeQLearningDecision(QLearningDecision):
             action_premise_iteration = _ActionPremiseIteration()
 
             # Set decision mutable values to random values, save to action premise.
-            decision_mutable_names = [d for d in dir(source) if issubclass(type(getattr(source, d)), DecisionMutableValue)]
-            for decision_mutable_name in decision_mutable_names:
-                decision_mutable = getattr(source, decision_mutable_name)
+            for decision_mutable_name, decision_mutable in _decision_mutables(source):
                 decision_mutable._set_value_random()
 
                 action_premise_iteration.decision_mutables.append(_DecisionMutablePremise(decision_mutable_name, decision_mutable.value))
 
             # Cast fallback decision, save to action premise.
             try:
-                identifier, action = random.choice(list(source.actions.items()))
+                identifier, action = random.choice(_action_items(source))
                 action(self._simulation, source)
                 action_premise_iteration.action_name = identifier
             except:
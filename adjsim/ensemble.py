@@ -0,0 +1,151 @@
+"""Ensemble module.
+
+This module runs independent replicas of a simulation across worker processes, and merges the data
+collected by their trackers.
+
+Designed and developed by Sever Topan.
+"""
+
+# Standard.
+import os
+import sys
+import random
+import functools
+import contextlib
+import multiprocessing
+
+# Third party.
+import numpy as np
+
+# Local.
+from . import core
+
+def headless(simulation):
+    """Make a simulation step without creating a GUI.
+
+    VisualSimulations are stepped through the base Simulation implementation. Other simulations are
+    returned unchanged.
+
+    Args:
+        simulation (Simulation): The simulation.
+
+    Returns:
+        The simulation.
+    """
+    if isinstance(simulation, core.VisualSimulation):
+        simulation.step = functools.partial(core.Simulation.step, simulation)
+        simulation._step_single = functools.partial(core.Simulation._step_single, simulation)
+
+    return simulation
+
+def _run_replica(factory, num_timesteps, quiet, seed):
+    """Build, seed and simulate a single replica.
+
+    Args:
+        factory (callable): Callable that takes no arguments and returns a Simulation.
+        num_timesteps (int): The number of timesteps to simulate.
+        quiet (bool): Whether or not to silence the replica's standard output.
+        seed (int): The seed for the replica's random number generators.
+
+    Returns:
+        A dictionary mapping tracker keys to tracker data.
+    """
+    # Seed before construction, since factories commonly randomize agent attributes.
+    random.seed(seed)
+    np.random.seed(seed)
+
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+            simulation = headless(factory())
+            simulation.simulate(num_timesteps)
+
+    return {key: tracker.data for key, tracker in simulation.trackers.items()}
+
+def _stack(values):
+    """Merge per-replica tracker data.
+
+    Dictionaries are merged key-wise. Numeric sequences are stacked into an array with one row per
+    replica; replicas whose data is shorter (for example, due to an end condition) are padded with NaN.
+    Anything else is returned as a list with one entry per replica.
+
+    Args:
+        values (list): The tracker data of each replica.
+
+    Returns:
+        The merged data.
+    """
+    if all(isinstance(value, dict) for value in values):
+        keys = []
+        for value in values:
+            keys += [key for key in value if not key in keys]
+
+        return {key: _stack([value.get(key, []) for value in values]) for key in keys}
+
+    try:
+        arrays = [np.asarray(value) for value in values]
+    except Exception:
+        return list(values)
+
+    if not all(array.dtype.kind in "biuf" for array in arrays if array.size) or \
+            any(array.ndim == 0 for array in arrays):
+        return list(values)
+
+    shapes = set(array.shape for array in arrays)
+    if len(shapes) == 1:
+        return np.stack(arrays)
+
+    if not all(array.ndim == 1 for array in arrays):
+        return list(values)
+
+    stacked = np.full((len(arrays), max(array.shape[0] for array in arrays)), np.nan)
+    for i, array in enumerate(arrays):
+        stacked[i, :array.shape[0]] = array
+
+    return stacked
+
+def run(factory, num_timesteps, seeds, workers=None, quiet=True):
+    """Simulate independent replicas of a simulation in worker processes.
+
+    Each replica is built by calling factory in a worker process, after Python's random module and
+    NumPy's global generator have been seeded with the replica's seed. Only tracker data is sent back
+    to the calling process. VisualSimulations are stepped headlessly.
+
+    Note:
+        factory must be picklable, for example a module-level function or Simulation class. Tracker data
+        must also be picklable; since AgentTypeCountTracker keys its data by type, agent classes must be
+        defined at module level. Replicas that save files upon completion (such as QLearningDecision
+        modules) should be given distinct file names.
+
+    Args:
+        factory (callable): Callable that takes no arguments and returns a Simulation.
+        num_timesteps (int): The number of timesteps to simulate each replica for.
+        seeds (iterable): The seed of each replica. One replica is run per seed.
+        workers (int): The number of worker processes. Defaults to the number of CPUs.
+            If 1, replicas are run in the calling process.
+        quiet (bool): Whether or not to silence replica standard output. Defaults to True.
+
+    Returns:
+        A dictionary mapping tracker keys to the tracker data of all replicas, merged such that the
+        first axis of numeric data indexes replicas in the order of seeds.
+    """
+    seeds = list(seeds)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 0:
+        raise ValueError("Ensemble must be run with a positive number of workers.")
+
+    task = functools.partial(_run_replica, factory, num_timesteps, quiet)
+
+    if workers == 1:
+        results = [task(seed) for seed in seeds]
+    else:
+        with multiprocessing.Pool(min(workers, max(len(seeds), 1))) as pool:
+            results = pool.map(task, seeds, chunksize=1)
+
+    # Merge tracker data.
+    keys = []
+    for result in results:
+        keys += [key for key in result if not key in keys]
+
+    return {key: _stack([result.get(key, []) for result in results]) for key in keys}
@@ -5,6 +5,11 @@ This module contains indices for fast lookup of agents given certain properties.
 Designed and developed by Sever Topan.
 """
 
+# Standard.
+import math
+import heapq
+import collections
+
 # Third party.
 import numpy as np
 
@@ -16,6 +21,165 @@ class Index(object):
     """Base index object."""
     pass
 
+class Stencil(object):
+    """A neighbourhood, as a set of integer cell offsets relative to a query cell.
+
+    Offsets are computed once upon construction, so stencils should be created once and reused across queries.
+    MOORE and VON_NEUMANN hold the radius 1 neighbourhoods, which exclude the query cell itself.
+
+    Args:
+        offsets (iterable): The (x, y) integer cell offsets of the neighbourhood.
+    """
+
+    def __init__(self, offsets):
+        self.offsets = tuple((int(x), int(y)) for x, y in offsets)
+
+    @staticmethod
+    def moore(radius=1, include_center=False):
+        """Obtain a Moore neighbourhood: every cell within a square of the given radius.
+
+        Args:
+            radius (int): The neighbourhood radius, in cells.
+            include_center (bool): Whether or not the query cell is part of the neighbourhood.
+
+        Returns:
+            A Stencil.
+        """
+        return Stencil((x, y) for x in range(-radius, radius + 1) for y in range(-radius, radius + 1)
+                       if include_center or (x, y) != (0, 0))
+
+    @staticmethod
+    def von_neumann(radius=1, include_center=False):
+        """Obtain a von Neumann neighbourhood: every cell within the given Manhattan distance.
+
+        Args:
+            radius (int): The neighbourhood radius, in cells.
+            include_center (bool): Whether or not the query cell is part of the neighbourhood.
+
+        Returns:
+            A Stencil.
+        """
+        return Stencil((x, y) for x in range(-radius, radius + 1) for y in range(-radius, radius + 1)
+                       if abs(x) + abs(y) <= radius and (include_center or (x, y) != (0, 0)))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+MOORE = Stencil.moore()
+VON_NEUMANN = Stencil.von_neumann()
+
+def _pairs_within(positions, radius, partner_positions=None):
+    """Find all pairs of points within a given distance of one another in a single cell list sweep.
+
+    Points are bucketed into cells of the given radius, so the partners of a point can only lie in its own
+    or the 8 surrounding cells. The candidates of every point are found at once through binary searches into
+    the sorted cell keys, and are then filtered by exact distance.
+
+    Args:
+        positions (np.ndarray): An (n, 2) array of positions.
+        radius (float): The distance. Pairs at exactly this distance are included.
+        partner_positions (np.ndarray): An (m, 2) array of partner positions. If None, pairs are found within
+            positions, each unordered pair is obtained once and points are not paired with themselves.
+
+    Returns:
+        A tuple of index arrays (i, j), such that positions[i[k]] lies within radius of partner_positions[j[k]].
+    """
+    same = partner_positions is None
+    if same:
+        partner_positions = positions
+
+    empty = np.zeros((0,), dtype=np.intp)
+    if not len(positions) or not len(partner_positions):
+        return empty, empty
+
+    if radius <= 0:
+        raise ValueError("Radius must be positive.")
+
+    cells = np.floor(positions/radius).astype(np.int64)
+    partner_cells = np.floor(partner_positions/radius).astype(np.int64)
+
+    # Pack cell coordinates into keys, leaving a border so that neighbouring cells never alias.
+    lower = np.minimum(cells.min(axis=0), partner_cells.min(axis=0)) - 1
+    height = max(cells[:, 1].max(), partner_cells[:, 1].max()) - lower[1] + 2
+    keys = (cells[:, 0] - lower[0])*height + (cells[:, 1] - lower[1])
+    partner_keys = (partner_cells[:, 0] - lower[0])*height + (partner_cells[:, 1] - lower[1])
+
+    partner_order = np.argsort(partner_keys, kind="mergesort")
+    sorted_keys = partner_keys[partner_order]
+
+    # Queries are made in key order, which keeps the binary searches cache friendly.
+    order = partner_order if same else np.argsort(keys, kind="mergesort")
+    keys = keys[order]
+
+    # Within a single set, each pair of cells only needs to be visited once.
+    stencil = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)) if same else MOORE.offsets + ((0, 0),)
+
+    found_i = []
+    found_j = []
+    for x, y in stencil:
+        neighbour_keys = keys + (x*height + y)
+        start = np.searchsorted(sorted_keys, neighbour_keys, side="left")
+        counts = np.searchsorted(sorted_keys, neighbour_keys, side="right") - start
+
+        # Expand each point's range of candidates into explicit pairs.
+        total = counts.sum()
+        if not total:
+            continue
+
+        i = np.repeat(order, counts)
+        j = partner_order[np.repeat(start, counts) + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)]
+
+        # Pairs within a cell are found in both orders, and points are paired with themselves.
+        if same and (x, y) == (0, 0):
+            keep = i < j
+            i, j = i[keep], j[keep]
+
+        found_i.append(i)
+        found_j.append(j)
+
+    if not found_i:
+        return empty, empty
+
+    i = np.concatenate(found_i)
+    j = np.concatenate(found_j)
+
+    inside = np.sum((positions[i] - partner_positions[j])**2, axis=1) <= radius*radius
+    return i[inside], j[inside]
+
+class Pairs(object):
+    """Pairs of agents, held as index arrays into lists of agents.
+
+    Attributes:
+        agents (list): The first agent of each pair is taken from this list.
+        partners (list): The second agent of each pair is taken from this list. May be agents itself.
+        i (np.ndarray): The index into agents of the first agent of each pair.
+        j (np.ndarray): The index into partners of the second agent of each pair.
+
+    Args:
+        agents (list): The agents.
+        partners (list): The partners.
+        i (np.ndarray): The agent indices.
+        j (np.ndarray): The partner indices.
+    """
+
+    def __init__(self, agents, partners, i, j):
+        self.agents = agents
+        self.partners = partners
+        self.i = i
+        self.j = j
+
+    def __len__(self):
+        return len(self.i)
+
+    def __iter__(self):
+        """Iterate over the pairs as (agent, partner) tuples."""
+        agents = self.agents
+        partners = self.partners
+        return ((agents[i], partners[j]) for i, j in zip(self.i.tolist(), self.j.tolist()))
+
 class GridIndex(Index):
     """An Index that stores agent location based on discrete entries within a grid.
 
@@ -26,6 +190,8 @@ class GridIndex(Index):
     # Constants.
     NEIGHBOUR_ITERATION_LIST = [[1,0], [1,1], [0,1], [-1,1], [-1,0], [-1,-1], [0,-1], [1,-1]]
     NEIGHBOUR_ITERATION_ARRAYS = [np.array(i) for i in NEIGHBOUR_ITERATION_LIST]
+    ENGINE_DICT = "dict"
+    ENGINE_CELL_LIST = "cell_list"
 
     def __init__(self, simulation):
         super().__init__()
@@ -35,19 +201,42 @@ class GridIndex(Index):
         self._simulation = simulation
         self._grid_size = 1
         self._initialized = False
+        self._cell_list = None
         
 
-    def initialize(self, grid_size):
+    def initialize(self, grid_size, engine=ENGINE_DICT, rebuild_per_step=False):
         """Initialize the index with the given grid size.
 
+        Two engines are available. The dict engine keeps a set of agents per cell, and updates it upon every
+        movement. The cell list engine only marks itself dirty upon movement, and rebuilds flat arrays of all
+        cells with a counting sort upon the first query after a change. Both engines' queries reflect current
+        positions.
+
+        Rebuilding costs O(N), so where agents move and query in turn, the cell list engine may instead be
+        rebuilt at most once per step by setting rebuild_per_step. Queries then reflect positions as of the
+        first query of the step, and agents added or moved later in the step are not found until the next
+        step. This suits models where most agents move every step, and where agents observe the state of the
+        previous step.
+
         Args:
             grid_size (int): The size of the grid.
+            engine (str): GridIndex.ENGINE_DICT or GridIndex.ENGINE_CELL_LIST.
+            rebuild_per_step (bool): If True, the cell list engine is rebuilt at most once per step. Only
+                applies to the cell list engine.
         """
         if grid_size <= 0:
             raise ValueError("Grid must be initialized with a positive value.")
+
+        if not engine in (GridIndex.ENGINE_DICT, GridIndex.ENGINE_CELL_LIST):
+            raise ValueError("Unknown grid engine '{}'.".format(engine))
             
         self._grid_size = grid_size
 
+        if engine == GridIndex.ENGINE_CELL_LIST:
+            self._cell_list = _CellList(self._simulation, grid_size, rebuild_per_step)
+            self._initialized = True
+            return
+
         for agent in self._simulation.agents:
             # Only iterate over derived of SpatialAgent
             if not issubclass(type(agent), core.SpatialAgent):
@@ -64,9 +253,9 @@ class GridIndex(Index):
             self._agent_mapping[agent] = inquiry_array
 
         # Init callbacks.
-        self._simulation.callbacks.agent_added.register(self._update)
-        self._simulation.callbacks.agent_moved.register(self._update)
-        self._simulation.callbacks.agent_removed.register(self._update)
+        self._simulation.callbacks.agent_added.register_batch(self._update, self._update_many)
+        self._simulation.callbacks.agent_moved.register_batch(self._update, self._update_many)
+        self._simulation.callbacks.agent_removed.register_batch(self._update, self._update_many)
 
         # Set flag.
         self._initialized = True
@@ -157,8 +346,22 @@ class GridIndex(Index):
             if type(pos) == np.ndarray:
                 raise TypeError
         except TypeError:
-           return self._get_inhabitants_single(pos)
+            if type(pos) != np.ndarray or pos.shape != (2,):
+                raise TypeError
+
+            if self._cell_list is not None:
+                return self._cell_list.inhabitants([pos])
+
+            return self._get_inhabitants_single(pos)
         else:
+            if self._cell_list is not None:
+                pos = list(pos)
+                for array in pos:
+                    if type(array) != np.ndarray or array.shape != (2,):
+                        raise TypeError
+
+                return self._cell_list.inhabitants(pos)
+
             return self._get_inhabitants_list(pos)
 
 
@@ -178,9 +381,195 @@ class GridIndex(Index):
         # Check type.
         if type(pos) != np.ndarray or pos.shape != (2,):
             raise TypeError
+
+        if self._cell_list is not None:
+            return self._cell_list.neighbours(pos)
         
         return self.get_inhabitants(self.get_neighbour_coordinates(pos))
 
+    def _stencil_cells(self, pos, stencil):
+        """Obtain the cells of a stencil around a given position, as lists of agents or sets.
+
+        Args:
+            pos (np.ndarray): The query position.
+            stencil (Stencil): The neighbourhood. Defaults to MOORE.
+
+        Returns:
+            An iterable of containers of agents.
+        """
+        # Check flag.
+        if not self._initialized:
+            raise utility.IndexInitializationException()
+
+        # Check type.
+        if not isinstance(pos, np.ndarray) or pos.shape != (2,):
+            raise TypeError
+
+        if stencil is None:
+            stencil = MOORE
+
+        cell_x = math.floor(float(pos[0])/self._grid_size)
+        cell_y = math.floor(float(pos[1])/self._grid_size)
+
+        if self._cell_list is not None:
+            return self._cell_list.cells(cell_x, cell_y, stencil)
+
+        # Keys are computed as in initialize, so that they compare equal to the stored keys.
+        cells = (self._grid.get(((cell_x + x)*self._grid_size, (cell_y + y)*self._grid_size))
+                 for x, y in stencil.offsets)
+        return (cell for cell in cells if cell)
+
+    def count_neighbours(self, pos, stencil=None, type=None):
+        """Count the agents inhabiting the cells of a neighbourhood around a given position.
+
+        No list of agents is built, so this is preferable to get_neighbours where only the count is needed.
+
+        Args:
+            pos (np.ndarray): The query position.
+            stencil (Stencil): The neighbourhood. Defaults to MOORE, the 8 cells surrounding the query cell.
+            type (type): If given, only agents of this type (including subclasses) are counted.
+
+        Returns:
+            An int.
+        """
+        cells = self._stencil_cells(pos, stencil)
+        if type is None:
+            return sum(len(cell) for cell in cells)
+
+        return sum(isinstance(agent, type) for cell in cells for agent in cell)
+
+    def iter_neighbours(self, pos, stencil=None, type=None):
+        """Iterate over the agents inhabiting the cells of a neighbourhood around a given position.
+
+        The index must not change while iterating.
+
+        Args:
+            pos (np.ndarray): The query position.
+            stencil (Stencil): The neighbourhood. Defaults to MOORE, the 8 cells surrounding the query cell.
+            type (type): If given, only agents of this type (including subclasses) are obtained.
+
+        Returns:
+            An iterator of agents.
+        """
+        cells = self._stencil_cells(pos, stencil)
+        if type is None:
+            return (agent for cell in cells for agent in cell)
+
+        return (agent for cell in cells for agent in cell if isinstance(agent, type))
+
+    def get_within(self, pos, radius, type=None):
+        """Obtain a list of all agents within a given distance of a position.
+
+        Only the cells overlapped by the query circle are visited, including the cell containing the query
+        position. The exact distance of every candidate is then checked in a single vectorized pass.
+
+        Args:
+            pos (np.ndarray): The query position.
+            radius (float): The distance. Agents at exactly this distance are included.
+            type (type): If given, only agents of this type (including subclasses) are obtained.
+
+        Returns:
+            A list of agents.
+        """
+        # Check flag.
+        if not self._initialized:
+            raise utility.IndexInitializationException()
+
+        # Check type. The builtin type is shadowed by the agent type argument.
+        if not isinstance(pos, np.ndarray) or pos.shape != (2,):
+            raise TypeError
+
+        if radius < 0:
+            raise ValueError("Radius must not be negative.")
+
+        if self._cell_list is not None:
+            return self._cell_list.within(pos, radius, type)
+
+        # Cell keys are computed as in initialize, so that they compare equal to the stored keys.
+        lower = np.floor((pos - radius)/self._grid_size)
+        upper = np.floor((pos + radius)/self._grid_size)
+        radius_square = radius*radius
+
+        # Visit the overlapped cells, or the occupied cells if there are fewer of those.
+        if (upper[0] - lower[0] + 1)*(upper[1] - lower[1] + 1) > len(self._grid):
+            keys = list(self._grid)
+        else:
+            keys = [(cell_x*self._grid_size, cell_y*self._grid_size)
+                    for cell_x in np.arange(lower[0], upper[0] + 1) for cell_y in np.arange(lower[1], upper[1] + 1)]
+
+        candidates = []
+        for key in keys:
+            found = self._grid.get(key)
+            if found is None:
+                continue
+
+            # Skip cells that the circle does not reach.
+            dx = max(key[0] - pos[0], 0., pos[0] - key[0] - self._grid_size)
+            dy = max(key[1] - pos[1], 0., pos[1] - key[1] - self._grid_size)
+            if dx*dx + dy*dy > radius_square:
+                continue
+
+            candidates += found
+
+        if not type is None:
+            candidates = [agent for agent in candidates if isinstance(agent, type)]
+
+        if not candidates:
+            return []
+
+        distances = np.sum((np.array([agent.pos for agent in candidates]) - pos)**2, axis=1)
+        return [agent for agent, inside in zip(candidates, distances <= radius_square) if inside]
+
+
+    def pairs_within(self, radius, type_a=None, type_b=None):
+        """Obtain all pairs of agents within a given distance of one another, in a single cell list sweep.
+
+        This is a broad phase for contact-driven models: all candidate contacts of a step are found at once,
+        in roughly linear time, rather than through a query per agent. The sweep uses cells of the given
+        radius, so the grid need not be initialized.
+
+        Args:
+            radius (float): The distance. Pairs at exactly this distance are included.
+            type_a (type): The type of the first agent of each pair (including subclasses). Defaults to
+                SpatialAgent.
+            type_b (type): The type of the second agent of each pair (including subclasses). If None, pairs are
+                found among agents of type_a, and each unordered pair is obtained once.
+
+        Returns:
+            A Pairs object. Agents are never paired with themselves.
+        """
+        if radius <= 0:
+            raise ValueError("Radius must be positive.")
+
+        agents, positions = self._gather(type_a)
+        if type_b is None:
+            i, j = _pairs_within(positions, radius)
+            return Pairs(agents, agents, i, j)
+
+        partners, partner_positions = self._gather(type_b)
+        i, j = _pairs_within(positions, radius, partner_positions)
+
+        # Agents of both types would otherwise be paired with themselves.
+        rows = {agent: row for row, agent in enumerate(agents)}
+        partner_rows = np.array([rows.get(partner, -1) for partner in partners], dtype=np.intp).reshape(-1)
+        keep = partner_rows[j] != i
+
+        return Pairs(agents, partners, i[keep], j[keep])
+
+    def _gather(self, agent_type):
+        """Obtain the existing spatial agents of a given type, and an (n, 2) array of their positions."""
+        population = self._simulation.population
+        agent_type = core.SpatialAgent if agent_type is None else agent_type
+
+        # Stored positions are read in one go.
+        if population.initialized:
+            stored = population.agents
+            mask = np.array([isinstance(agent, agent_type) and agent._exists for agent in stored], dtype=bool)
+            agents = [agent for agent, inside in zip(stored, mask.tolist()) if inside]
+            return agents, population.positions[mask]
+
+        agents = [agent for agent in self._simulation.agents.of_type(agent_type) if agent._exists]
+        return agents, np.array([agent.pos for agent in agents], dtype=np.float64).reshape(-1, 2)
 
     def _update(self, agent):
         """Callback function called upon an agent moving.
@@ -192,8 +581,35 @@ class GridIndex(Index):
         if not issubclass(type(agent), core.SpatialAgent):
             return
 
+        self._update_entry(agent, np.floor(agent.pos/self._grid_size)*self._grid_size)
+
+    def _update_many(self, agents):
+        """Callback function called upon a batch of agents changing.
+
+        Cell coordinates of the whole batch are computed in a single vectorized pass.
+
+        Args:
+            agents (list): The agents that changed.
+        """
+        # We only care if the agent is spatial.
+        agents = [agent for agent in agents if issubclass(type(agent), core.SpatialAgent)]
+        if not agents:
+            return
+
+        positions = np.array([agent.pos for agent in agents])
+        new_arrays = np.floor(positions/self._grid_size)*self._grid_size
+
+        for agent, new_array in zip(agents, new_arrays):
+            self._update_entry(agent, new_array)
+
+    def _update_entry(self, agent, new_array):
+        """Moves an agent's grid entry to the given cell, or removes it if the agent no longer exists.
+
+        Args:
+            agent (SpatialAgent): The agent.
+            new_array (np.ndarray): The agent's new cell coordinates.
+        """
         inquiry_array = self._agent_mapping.get(agent)
-        new_array = np.floor(agent.pos/self._grid_size)*self._grid_size
 
         # Check if entry exists.
         if not inquiry_array is None:
@@ -217,5 +633,753 @@ class GridIndex(Index):
                 entry.add(agent)
 
             self._agent_mapping[agent] = new_array
+        elif not inquiry_array is None:
+            del self._agent_mapping[agent]
+
+
+def _counting_sort(keys, num_keys):
+    """Obtain the stable sorting order of non-negative integer keys in O(n) time.
+
+    Keys are sorted by 16 bit digits, least significant first. NumPy sorts 16 bit integers stably with a
+    counting (radix) sort, so each pass is linear.
+
+    Args:
+        keys (np.ndarray): The keys, all less than num_keys.
+        num_keys (int): An upper bound on the keys.
+
+    Returns:
+        An array of indices that sorts keys.
+    """
+    order = np.argsort((keys & 0xFFFF).astype(np.uint16), kind="mergesort")
+
+    shift = 16
+    while num_keys > 1 << shift:
+        digits = ((keys[order] >> shift) & 0xFFFF).astype(np.uint16)
+        order = order[np.argsort(digits, kind="mergesort")]
+        shift += 16
+
+    return order
+
+
+class _Slice(object):
+    """A read-only view of a range of a list."""
+
+    __slots__ = ("items", "start", "stop")
+
+    def __init__(self, items, start, stop):
+        self.items = items
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        items = self.items
+        return (items[i] for i in range(self.start, self.stop))
+
+
+class _CellList(object):
+    """The cell list engine of GridIndex.
+
+    Agents are bucketed by packed integer cell coordinates. Rather than being updated upon every movement, the
+    engine is rebuilt in bulk: agents are counted per cell and counting sorted by cell, yielding a flat
+    cell_agents array in which the agents of cell i occupy the range cell_start[i]:cell_start[i + 1]. Cells
+    are numbered densely over the bounding box of all agents, or through a mapping of occupied cells if the
+    agents are sparse. Agents and positions are stored in cell order, so the contents of a cell are a single
+    slice. Radius queries check distances in buffers that are reused between queries.
+
+    Queries use the positions as of the last rebuild. See GridIndex.initialize for when rebuilds occur.
+    """
+
+    # Constants.
+    DENSE_CELLS_PER_AGENT = 4
+    DENSE_CELLS_MINIMUM = 4096
+    NEIGHBOUR_OFFSETS = [tuple(offset) for offset in GridIndex.NEIGHBOUR_ITERATION_LIST]
+
+    def __init__(self, simulation, grid_size, rebuild_per_step=False):
+        self.simulation = simulation
+        self.grid_size = grid_size
+        self.rebuild_per_step = rebuild_per_step
+        self.members = collections.OrderedDict()
+        self.dirty = True
+        self.removed = False
+        self.stepping = False
+        self.step_built = False
+
+        self.cell_start = np.zeros((1,), dtype=np.intp)
+        self.cell_agents = np.zeros((0,), dtype=np.intp)
+        self.cell_mapping = None
+        self.lower = (0, 0)
+        self.extent = (0, 0)
+        self.ordered_agents = []
+        self.ordered_positions = np.zeros((0, 2))
+        self._starts = [0]
+
+        # Query buffers.
+        self._position_buffer = np.zeros((0, 2))
+        self._distance_buffer = np.zeros((0,))
+        self._inside_buffer = np.zeros((0,), dtype=bool)
+
+        for agent in simulation.agents:
+            if issubclass(type(agent), core.SpatialAgent):
+                self.members[agent] = None
+
+        # Init callbacks.
+        callbacks = simulation.callbacks
+        callbacks.agent_added.register_batch(self._on_added, self._on_added_many)
+        callbacks.agent_moved.register_batch(self._on_moved, self._on_moved_many)
+        callbacks.agent_removed.register_batch(self._on_removed, self._on_removed_many)
+        callbacks.simulation_step_started.register(self._on_step_started)
+        callbacks.simulation_step_complete.register(self._on_step_complete)
+
+    def rebuild(self):
+        """Rebuild the cell arrays from the current agent positions."""
+        store = self.simulation.population
+        if store.initialized:
+            agents = store.agents
+            positions = np.array(store.positions, dtype=np.float64)
+        else:
+            agents = list(self.members)
+            positions = np.array([agent._pos for agent in agents], dtype=np.float64).reshape(-1, 2)
+
+        self.dirty = False
+        self.removed = False
+
+        if not agents:
+            self.cell_start = np.zeros((1,), dtype=np.intp)
+            self.cell_agents = np.zeros((0,), dtype=np.intp)
+            self.cell_mapping = None
+            self.lower = (0, 0)
+            self.extent = (0, 0)
+            self.ordered_agents = []
+            self.ordered_positions = positions
+            self._starts = [0]
+            return
+
+        cells = np.floor(positions/self.grid_size).astype(np.int64)
+        lower = cells.min(axis=0)
+        extent = cells.max(axis=0) - lower + 1
+        keys = (cells[:, 0] - lower[0])*extent[1] + (cells[:, 1] - lower[1])
+
+        self.lower = (int(lower[0]), int(lower[1]))
+        self.extent = (int(extent[0]), int(extent[1]))
+
+        # Number cells over the bounding box, unless it is mostly empty.
+        num_cells = self.extent[0]*self.extent[1]
+        if num_cells <= max(_CellList.DENSE_CELLS_MINIMUM, _CellList.DENSE_CELLS_PER_AGENT*len(agents)):
+            self.cell_mapping = None
+        else:
+            occupied, keys = np.unique(keys, return_inverse=True)
+            self.cell_mapping = dict(zip(occupied.tolist(), range(len(occupied))))
+            num_cells = len(occupied)
+
+        # Count agents per cell, then order agents by cell.
+        self.cell_start = np.zeros((num_cells + 1,), dtype=np.intp)
+        np.cumsum(np.bincount(keys, minlength=num_cells), out=self.cell_start[1:])
+        self.cell_agents = _counting_sort(keys, num_cells)
+
+        self.ordered_agents = [agents[slot] for slot in self.cell_agents.tolist()]
+        self.ordered_positions = positions[self.cell_agents]
+        self._starts = self.cell_start.tolist()
+
+        # Grow the query buffers to hold every agent.
+        if len(self._distance_buffer) < len(agents):
+            self._position_buffer = np.zeros((len(agents), 2))
+            self._distance_buffer = np.zeros((len(agents),))
+            self._inside_buffer = np.zeros((len(agents),), dtype=bool)
+
+    def _ensure_built(self):
+        """Rebuild if agents changed, and if rebuilding per step, at most once per step."""
+        if self.dirty and not (self.rebuild_per_step and self.stepping and self.step_built):
+            self.rebuild()
+            self.step_built = self.stepping
+
+    def _cell_range(self, cell_x, cell_y):
+        """Obtain the range of an integer cell within the ordered agents. Empty if the cell is unoccupied."""
+        x = cell_x - self.lower[0]
+        y = cell_y - self.lower[1]
+        if x < 0 or y < 0 or x >= self.extent[0] or y >= self.extent[1]:
+            return 0, 0
+
+        index = x*self.extent[1] + y
+        if self.cell_mapping is not None:
+            index = self.cell_mapping.get(index)
+            if index is None:
+                return 0, 0
+
+        return self._starts[index], self._starts[index + 1]
+
+    def _query_cell(self, pos):
+        """Obtain the integer cell of a query position.
+
+        Query positions are typically cell coordinates, so values within rounding error of a cell boundary
+        are snapped to it.
+        """
+        cell = []
+        for value in (float(pos[0])/self.grid_size, float(pos[1])/self.grid_size):
+            nearest = round(value)
+            cell.append(int(nearest) if abs(value - nearest) < 1e-9 else int(math.floor(value)))
+
+        return cell
+
+    def _existing(self, agents):
+        """Filter out agents removed since the last rebuild."""
+        if self.removed:
+            return [agent for agent in agents if agent._exists]
+
+        return agents
+
+    def inhabitants(self, positions):
+        """Obtain a list of all agents inhabiting a list of cells.
+
+        Args:
+            positions (list): A list of the positions to query.
+
+        Returns:
+            A list of agents.
+        """
+        self._ensure_built()
+
+        found = []
+        for pos in positions:
+            start, stop = self._cell_range(*self._query_cell(pos))
+            found += self.ordered_agents[start:stop]
+
+        return self._existing(found)
+
+    def neighbours(self, pos):
+        """Obtain a list of all agents inhabiting the cells neighbouring a given position.
+
+        Args:
+            pos (np.ndarray): The query position.
+
+        Returns:
+            A list of agents.
+        """
+        self._ensure_built()
+
+        cell_x = int(math.floor(float(pos[0])/self.grid_size))
+        cell_y = int(math.floor(float(pos[1])/self.grid_size))
+
+        found = []
+        for offset_x, offset_y in _CellList.NEIGHBOUR_OFFSETS:
+            start, stop = self._cell_range(cell_x + offset_x, cell_y + offset_y)
+            found += self.ordered_agents[start:stop]
+
+        return self._existing(found)
+
+    def cells(self, cell_x, cell_y, stencil):
+        """Obtain the contents of the cells of a stencil around an integer cell.
+
+        Args:
+            cell_x (int): The x coordinate of the query cell.
+            cell_y (int): The y coordinate of the query cell.
+            stencil (Stencil): The neighbourhood.
+
+        Returns:
+            An iterable of sequences of agents.
+        """
+        self._ensure_built()
+
+        cells = (self._cell_range(cell_x + x, cell_y + y) for x, y in stencil.offsets)
+        if self.removed:
+            return (self._existing(self.ordered_agents[start:stop]) for start, stop in cells if start != stop)
+
+        # Slices of the ordered agents are only taken where the agents themselves are needed.
+        return (_Slice(self.ordered_agents, start, stop) for start, stop in cells if start != stop)
+
+    def within(self, pos, radius, agent_type=None):
+        """Obtain a list of all agents within a given distance of a position.
+
+        Args:
+            pos (np.ndarray): The query position.
+            radius (float): The distance.
+            agent_type (type): If given, only agents of this type (including subclasses) are obtained.
+
+        Returns:
+            A list of agents.
+        """
+        self._ensure_built()
+
+        x, y = float(pos[0]), float(pos[1])
+        radius_square = radius*radius
+
+        # Only cells within the bounding box of all agents are visited.
+        lower_x = max(int(math.floor((x - radius)/self.grid_size)), self.lower[0])
+        lower_y = max(int(math.floor((y - radius)/self.grid_size)), self.lower[1])
+        upper_x = min(int(math.floor((x + radius)/self.grid_size)), self.lower[0] + self.extent[0] - 1)
+        upper_y = min(int(math.floor((y + radius)/self.grid_size)), self.lower[1] + self.extent[1] - 1)
+
+        ranges = []
+        for cell_x in range(lower_x, upper_x + 1):
+            column_x = cell_x*self.grid_size
+            dx = max(column_x - x, 0., x - column_x - self.grid_size)
+
+            for cell_y in range(lower_y, upper_y + 1):
+                # Skip cells that the circle does not reach.
+                row_y = cell_y*self.grid_size
+                dy = max(row_y - y, 0., y - row_y - self.grid_size)
+                if dx*dx + dy*dy > radius_square:
+                    continue
+
+                start, stop = self._cell_range(cell_x, cell_y)
+                if start != stop:
+                    ranges.append((start, stop))
+
+        if not ranges:
+            return []
+
+        # Check the exact distance of all candidates at once, within the query buffers.
+        agents = []
+        offset = 0
+        positions = self._position_buffer
+        for start, stop in ranges:
+            agents += self.ordered_agents[start:stop]
+            positions[offset:offset + stop - start] = self.ordered_positions[start:stop]
+            offset += stop - start
+
+        positions = positions[:offset]
+        distances = self._distance_buffer[:offset]
+        inside = self._inside_buffer[:offset]
+
+        positions[:, 0] -= x
+        positions[:, 1] -= y
+        np.multiply(positions, positions, out=positions)
+        np.add(positions[:, 0], positions[:, 1], out=distances)
+        np.less_equal(distances, radius_square, out=inside)
+        found = [agent for agent, is_inside in zip(agents, inside.tolist()) if is_inside]
+
+        if not agent_type is None:
+            found = [agent for agent in found if isinstance(agent, agent_type)]
+
+        return self._existing(found)
+
+    def _on_added(self, agent):
+        """Callback function called upon an agent being added.
+
+        Args:
+            agent (Agent): The agent that was added.
+        """
+        if issubclass(type(agent), core.SpatialAgent):
+            self.members[agent] = None
+            self.dirty = True
+
+    def _on_added_many(self, agents):
+        """Callback function called upon a batch of agents being added.
+
+        Args:
+            agents (list): The agents that were added.
+        """
+        for agent in agents:
+            self._on_added(agent)
+
+    def _on_moved(self, agent):
+        """Callback function called upon an agent moving.
+
+        Args:
+            agent (Agent): The agent that moved.
+        """
+        self.dirty = True
+
+    def _on_moved_many(self, agents):
+        """Callback function called upon a batch of agents moving.
+
+        Args:
+            agents (list): The agents that moved.
+        """
+        self.dirty = True
+
+    def _on_removed(self, agent):
+        """Callback function called upon an agent being removed.
+
+        Args:
+            agent (Agent): The agent that was removed.
+        """
+        if self.members.pop(agent, 0) is None:
+            self.dirty = True
+            self.removed = True
+
+    def _on_removed_many(self, agents):
+        """Callback function called upon a batch of agents being removed.
+
+        Args:
+            agents (list): The agents that were removed.
+        """
+        for agent in agents:
+            self._on_removed(agent)
+
+    def _on_step_started(self, simulation):
+        self.stepping = True
+        self.step_built = False
+
+    def _on_step_complete(self, simulation):
+        self.stepping = False
+
+
+class _KDTree(object):
+    """A static 2d k-d tree with a bounding box per node.
+
+    Nodes are stored in a flat list. Leaves hold up to LEAF_SIZE points as a range of the permuted slot
+    array, which is scanned in a single vectorized pass.
+    """
+
+    LEAF_SIZE = 16
+
+    def __init__(self, points):
+        self.points = points
+        self.slots = np.arange(len(points))
+        self.nodes = []
+
+        if len(points):
+            self._build(0, len(points))
+
+    def _build(self, start, stop):
+        """Build the subtree over slots[start:stop], returning its node index."""
+        node = len(self.nodes)
+        self.nodes.append(None)
+
+        slots = self.slots[start:stop]
+        points = self.points[slots]
+        lower = points.min(axis=0)
+        upper = points.max(axis=0)
+
+        if stop - start <= _KDTree.LEAF_SIZE:
+            left = right = -1
+        else:
+            # Split at the median of the widest dimension.
+            middle = (start + stop)//2
+            dimension = np.argmax(upper - lower)
+            self.slots[start:stop] = slots[np.argpartition(points[:, dimension], middle - start)]
+
+            left = self._build(start, middle)
+            right = self._build(middle, stop)
+
+        self.nodes[node] = (start, stop, left, right, float(lower[0]), float(lower[1]), float(upper[0]),
+                            float(upper[1]))
+        return node
+
+    def nearest(self, pos, k, valid, bound=float("inf")):
+        """Obtain the k nearest valid points, searching nodes in order of distance.
+
+        Args:
+            pos (np.ndarray): The query position.
+            k (int): The number of points.
+            valid (callable): Takes an array of slots and returns a mask of the valid ones.
+            bound (float): The squared distance beyond which points are not sought.
+
+        Returns:
+            A list of (squared distance, slot) tuples, nearest first.
+        """
+        if not self.nodes:
+            return []
+
+        x, y = float(pos[0]), float(pos[1])
+
+        # Best holds the k nearest points found so far, as a max-heap of negated distances.
+        best = []
+        queue = [(0., 0)]
+        while queue:
+            distance, node = heapq.heappop(queue)
+            if distance > bound or (len(best) == k and distance > -best[0][0]):
+                break
+
+            start, stop, left, right = self.nodes[node][:4]
+            if left < 0:
+                slots = self.slots[start:stop]
+                mask = valid(slots)
+                slots = slots[mask]
+                distances = np.sum((self.points[slots] - (x, y))**2, axis=1)
+
+                for distance, slot in zip(distances.tolist(), slots.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, slot))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, slot))
+                continue
+
+            for child in (left, right):
+                _, _, _, _, lower_x, lower_y, upper_x, upper_y = self.nodes[child]
+                dx = max(lower_x - x, 0., x - upper_x)
+                dy = max(lower_y - y, 0., y - upper_y)
+                heapq.heappush(queue, (dx*dx + dy*dy, child))
+
+        return sorted((-distance, slot) for distance, slot in best)
 
+    def within(self, pos, radius):
+        """Obtain the slots of all points within a radius.
 
+        Args:
+            pos (np.ndarray): The query position.
+            radius (float): The radius.
+
+        Returns:
+            An array of slots.
+        """
+        if not self.nodes:
+            return np.zeros((0,), dtype=np.intp)
+
+        x, y = float(pos[0]), float(pos[1])
+        radius_square = radius*radius
+
+        found = [np.zeros((0,), dtype=np.intp)]
+        stack = [0]
+        while stack:
+            start, stop, left, right, lower_x, lower_y, upper_x, upper_y = self.nodes[stack.pop()]
+
+            dx = max(lower_x - x, 0., x - upper_x)
+            dy = max(lower_y - y, 0., y - upper_y)
+            if dx*dx + dy*dy > radius_square:
+                continue
+
+            # Nodes entirely within the circle need no distance checks.
+            dx = max(abs(lower_x - x), abs(upper_x - x))
+            dy = max(abs(lower_y - y), abs(upper_y - y))
+            if dx*dx + dy*dy <= radius_square:
+                found.append(self.slots[start:stop])
+            elif left < 0:
+                slots = self.slots[start:stop]
+                distances = np.sum((self.points[slots] - (x, y))**2, axis=1)
+                found.append(slots[distances <= radius_square])
+            else:
+                stack.append(left)
+                stack.append(right)
+
+        return np.concatenate(found)
+
+
+class _KDTreeLevel(object):
+    """A k-d tree over a fixed list of agents. Slots of agents that changed since it was built are stale."""
+
+    def __init__(self, agents):
+        self.agents = agents
+        self.tree = _KDTree(np.array([agent.pos for agent in agents], dtype=np.float64).reshape(-1, 2))
+        self.stale = np.zeros((len(agents),), dtype=bool)
+
+
+class _KDTreeEntry(object):
+    """A k-d tree over the agents of a given type, along with the agents that changed since it was built.
+
+    Changed agents are kept in a secondary structure: a short buffer that is scanned linearly, and a list of
+    smaller k-d trees (levels) of decreasing size. Once the buffer fills up, it is merged with all levels no
+    larger than it into a new level, as a carry propagates through a binary counter. Each change is therefore
+    built into O(log n) trees, and queries visit O(log n) trees.
+
+    Attributes:
+        step (int): The step during which the entry was built.
+    """
+
+    BUFFER_SIZE = 64
+
+    def __init__(self, agents, step):
+        self.step = step
+        self.levels = []
+        self.locations = {}
+        self.buffer = collections.OrderedDict()
+
+        self._add_level(agents)
+
+    @property
+    def changed(self):
+        """bool: Whether or not any agent changed since the entry was built."""
+        return len(self.levels) > 1 or len(self.buffer) > 0
+
+    def _add_level(self, agents):
+        """Build a level over the given agents."""
+        level = _KDTreeLevel(agents)
+        self.levels.append(level)
+
+        for slot, agent in enumerate(agents):
+            self.locations[agent] = (level, slot)
+
+    def invalidate(self, agent):
+        """Marks an agent as changed."""
+        location = self.locations.pop(agent, None)
+        if location is not None:
+            level, slot = location
+            level.stale[slot] = True
+
+        self.buffer[agent] = None
+        if len(self.buffer) > _KDTreeEntry.BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """Merge the buffer, and all levels no larger than it, into a new level. The main tree is kept.
+
+        Removed agents are dropped; should they be added again, they are invalidated once more.
+        """
+        agents = [agent for agent in self.buffer if agent._exists]
+        self.buffer.clear()
+
+        while len(self.levels) > 1 and len(self.levels[-1].agents) <= len(agents):
+            level = self.levels.pop()
+            agents += [agent for agent, stale in zip(level.agents, level.stale.tolist()) if not stale]
+
+        self._add_level(agents)
+
+
+class KDTreeIndex(Index):
+    """An Index that answers nearest neighbour and radius queries using k-d trees.
+
+    A tree is built upon the first query for each agent type, and is kept up to date through the
+    agent_added, agent_moved and agent_removed callbacks. Agents that changed since a tree was built are
+    held in a secondary structure of smaller trees, so queries always reflect current positions in
+    logarithmic time. The tree is rebuilt at most once per step, upon the first query of a step, and only
+    if agents changed since it was built.
+
+    The index requires no initialization. Its callbacks are only registered upon its first query.
+    """
+
+    def __init__(self, simulation):
+        super().__init__()
+
+        self._simulation = simulation
+        self._entries = {}
+        self._initialized = False
+        self._step = 0
+
+    def _initialize(self):
+        """Register the callbacks used to keep trees up to date."""
+        self._initialized = True
+
+        self._simulation.callbacks.agent_added.register_batch(self._update, self._update_many)
+        self._simulation.callbacks.agent_moved.register_batch(self._update, self._update_many)
+        self._simulation.callbacks.agent_removed.register_batch(self._update, self._update_many)
+        self._simulation.callbacks.simulation_step_started.register(self._on_step_started)
+
+    def _entry(self, agent_type):
+        """Obtain an up to date tree over the spatial agents of a given type."""
+        if not self._initialized:
+            self._initialize()
+
+        entry = self._entries.get(agent_type)
+        if entry is None or (entry.step != self._step and entry.changed):
+            agents = self._simulation.agents.of_type(core.SpatialAgent if agent_type is None else agent_type)
+            entry = _KDTreeEntry(list(agents), self._step)
+            self._entries[agent_type] = entry
+
+        return entry
+
+    @staticmethod
+    def _exclusions(exclude):
+        """Obtain the set of excluded agents."""
+        if exclude is None:
+            return frozenset()
+
+        if issubclass(type(exclude), core.Agent):
+            return {exclude}
+
+        return set(exclude)
+
+    @staticmethod
+    def _check_pos(pos):
+        if type(pos) != np.ndarray or pos.shape != (2,):
+            raise TypeError
+
+    def nearest(self, pos, k=1, type=None, exclude=None):
+        """Obtain the agents nearest to a given position.
+
+        Args:
+            pos (np.ndarray): The query position.
+            k (int): The maximum number of agents to obtain.
+            type (type): If given, only agents of this type (including subclasses) are considered.
+            exclude (Agent, iterable): An agent, or agents, not to consider. Typically the querying agent.
+
+        Returns:
+            A list of up to k agents, nearest first.
+        """
+        self._check_pos(pos)
+        if k < 1:
+            raise ValueError("At least one agent must be queried.")
+
+        entry = self._entry(type)
+        exclusions = self._exclusions(exclude)
+
+        # Agents that changed since the last level was built.
+        found = []
+        changed = [agent for agent in entry.buffer if agent._exists and not agent in exclusions]
+        if changed:
+            distances = np.sum((np.array([agent.pos for agent in changed]) - pos)**2, axis=1)
+            found += zip(distances.tolist(), changed)
+
+        # The newest levels are searched first, as they are smallest, and their agents bound the search of the
+        # mostly stale main tree.
+        for level in reversed(entry.levels):
+            agents = level.agents
+
+            # Excluded agents and agents removed while removals are deferred are skipped.
+            def valid(slots):
+                return ~level.stale[slots] & np.array([agents[slot]._exists and not agents[slot] in exclusions
+                                                       for slot in slots.tolist()], dtype=bool)
+
+            found.sort(key=lambda item: item[0])
+            del found[k:]
+            bound = found[-1][0] if len(found) == k else float("inf")
+            found += [(distance, agents[slot]) for distance, slot in level.tree.nearest(pos, k, valid, bound)]
+
+        found.sort(key=lambda item: item[0])
+        return [agent for _, agent in found[:k]]
+
+    def within(self, pos, radius, type=None, exclude=None):
+        """Obtain the agents within a given distance of a position.
+
+        Args:
+            pos (np.ndarray): The query position.
+            radius (float): The distance. Agents at exactly this distance are included.
+            type (type): If given, only agents of this type (including subclasses) are considered.
+            exclude (Agent, iterable): An agent, or agents, not to consider. Typically the querying agent.
+
+        Returns:
+            A list of agents.
+        """
+        self._check_pos(pos)
+        if radius < 0:
+            raise ValueError("Radius must not be negative.")
+
+        entry = self._entry(type)
+        exclusions = self._exclusions(exclude)
+
+        found = []
+        for level in entry.levels:
+            slots = level.tree.within(pos, radius)
+            slots = slots[~level.stale[slots]]
+            found += [level.agents[slot] for slot in slots.tolist()]
+
+        # Agents that changed since the last level was built.
+        changed = list(entry.buffer)
+        if changed:
+            distances = np.sum((np.array([agent.pos for agent in changed]) - pos)**2, axis=1)
+            found += [agent for agent, distance in zip(changed, distances.tolist()) if distance <= radius*radius]
+
+        return [agent for agent in found if agent._exists and not agent in exclusions]
+
+    def _update(self, agent):
+        """Callback function called upon an agent being added, moving or being removed.
+
+        Args:
+            agent (Agent): The agent that changed.
+        """
+        # We only care if the agent is spatial.
+        if not issubclass(type(agent), core.SpatialAgent):
+            return
+
+        for agent_type, entry in self._entries.items():
+            if agent_type is None or isinstance(agent, agent_type):
+                entry.invalidate(agent)
+
+    def _update_many(self, agents):
+        """Callback function called upon a batch of agents changing.
+
+        Args:
+            agents (list): The agents that changed.
+        """
+        for agent in agents:
+            self._update(agent)
+
+    def _on_step_started(self, simulation):
+        """Callback function called upon a step starting, allowing trees to be rebuilt once more.
+
+        Args:
+            simulation (Simulation): The simulation.
+        """
+        self._step += 1
@@ -0,0 +1,144 @@
+"""Integration module.
+
+This module contains time integrators for physical agent models. An integrator advances the positions and
+velocities of all agents of a given type at once, on contiguous arrays, and moves the agents with a single
+batched movement callback per simulation step.
+
+Accelerations are obtained from the simulation's interactions by default. Each step may be split into
+substeps, trading cost for accuracy.
+
+Designed and developed by Sever Topan.
+"""
+
+# Third party.
+import numpy as np
+
+# Local.
+from . import core
+
+
+class Integrator(object):
+    """The base integrator object.
+
+    Integrators are stored in Simulation.integrators, and advance their agents once per simulation step,
+    after the simulation_step_started callback and before agents act. Agents must carry a velocity attribute
+    holding a np.ndarray of shape (2,).
+
+    Attributes:
+        timestep (float): The time elapsed per simulation step.
+        substeps (int): The number of substeps each simulation step is divided into.
+        agent_type (type): The type of agents the integrator advances (including subclasses).
+        acceleration (callable): Callable that takes the simulation, the list of agents and (n, 2) arrays of
+            their positions and velocities, and returns an (n, 2) array of their accelerations. If None, the sum
+            of the simulation's interactions is used.
+        velocity_attribute (str): The name of the agents' velocity attribute.
+
+    Args:
+        timestep (float): The time elapsed per simulation step.
+        substeps (int): The number of substeps each simulation step is divided into.
+        agent_type (type): The type of agents the integrator advances. Defaults to SpatialAgent.
+        acceleration (callable): The acceleration function.
+        velocity_attribute (str): The name of the agents' velocity attribute.
+    """
+
+    def __init__(self, timestep=1., substeps=1, agent_type=None, acceleration=None, velocity_attribute="vel"):
+        if timestep <= 0 or substeps < 1:
+            raise ValueError("Timestep must be positive, and there must be at least one substep.")
+
+        # The core module may not be loaded yet, since it imports this one.
+        if agent_type is None:
+            agent_type = core.SpatialAgent
+
+        self.timestep = timestep
+        self.substeps = substeps
+        self.agent_type = agent_type
+        self.acceleration = acceleration
+        self.velocity_attribute = velocity_attribute
+
+    def step(self, simulation):
+        """Advance the integrator's agents by one simulation step.
+
+        Args:
+            simulation (Simulation): The simulation.
+        """
+        # Positions are gathered in the population store's order where possible, so they are read in one go.
+        if simulation.population.initialized:
+            agents = [agent for agent in simulation.population.agents if isinstance(agent, self.agent_type)]
+        else:
+            agents = list(simulation.agents.of_type(self.agent_type))
+
+        if not agents:
+            return
+
+        positions = np.array([agent.pos for agent in agents], dtype=np.float64)
+        velocities = np.array([getattr(agent, self.velocity_attribute) for agent in agents], dtype=np.float64)
+
+        dt = self.timestep/self.substeps
+        self._integrate(simulation, agents, positions, velocities, dt)
+
+        # Each agent's velocity is a row of the integrated array.
+        for agent, velocity in zip(agents, velocities):
+            setattr(agent, self.velocity_attribute, velocity)
+
+        simulation.agents.move_many(agents, positions)
+
+    def _accelerate(self, simulation, agents, positions, velocities):
+        """Obtain the accelerations of agents at the given state."""
+        if self.acceleration is None:
+            return simulation.interactions.evaluate(agents, positions)
+
+        return self.acceleration(simulation, agents, positions, velocities)
+
+    def _integrate(self, simulation, agents, positions, velocities, dt):
+        """Advance positions and velocities in place through all substeps.
+
+        Args:
+            simulation (Simulation): The simulation.
+            agents (list): The agents.
+            positions (np.ndarray): An (n, 2) array of positions.
+            velocities (np.ndarray): An (n, 2) array of velocities.
+            dt (float): The length of a substep.
+        """
+        raise NotImplementedError
+
+class ExplicitEuler(Integrator):
+    """The explicit (forward) Euler method.
+
+    Positions advance by the velocities at the start of each substep. This is first order accurate, and
+    does not conserve energy: orbits spiral outwards.
+    """
+
+    def _integrate(self, simulation, agents, positions, velocities, dt):
+        for _ in range(self.substeps):
+            acceleration = self._accelerate(simulation, agents, positions, velocities)
+            positions += velocities*dt
+            velocities += acceleration*dt
+
+class SemiImplicitEuler(Integrator):
+    """The semi-implicit (symplectic) Euler method.
+
+    Positions advance by the velocities at the end of each substep. This is first order accurate, but keeps
+    the energy of conservative systems bounded.
+    """
+
+    def _integrate(self, simulation, agents, positions, velocities, dt):
+        for _ in range(self.substeps):
+            velocities += self._accelerate(simulation, agents, positions, velocities)*dt
+            positions += velocities*dt
+
+class VelocityVerlet(Integrator):
+    """The velocity Verlet method, equivalent to leapfrog integration.
+
+    This is second order accurate and symplectic. Accelerations must not depend on velocities. Accelerations
+    are reused between substeps, so a step of s substeps costs s + 1 acceleration evaluations.
+    """
+
+    def _integrate(self, simulation, agents, positions, velocities, dt):
+        acceleration = self._accelerate(simulation, agents, positions, velocities)
+        for _ in range(self.substeps):
+            velocities += acceleration*(dt/2)
+            positions += velocities*dt
+            acceleration = self._accelerate(simulation, agents, positions, velocities)
+            velocities += acceleration*(dt/2)
+
+Leapfrog = VelocityVerlet
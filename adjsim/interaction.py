@@ -0,0 +1,246 @@
+"""Interaction module.
+
+This module contains pairwise interactions for force-based models. An interaction evaluates a kernel, such
+as an inverse square law, a spring or a repulsion, between every pair of agents of the selected types, and
+sums the result per agent. Kernels operate on arrays of pairs, so no Python code runs per pair.
+
+Without a cutoff, all pairs are evaluated through NumPy broadcasting. With a cutoff, only pairs within it are
+found, through a cell list sweep, which scales to large populations of short-ranged interactions.
+
+Designed and developed by Sever Topan.
+"""
+
+# Third party.
+import numpy as np
+
+# Local.
+from . import core
+from . import index
+
+
+class Kernel(object):
+    """The base pairwise kernel object.
+
+    Kernels compute the contribution of a partner to an agent, for many pairs at once. Contributions are
+    summed per agent, so kernels typically return forces or accelerations.
+
+    Attributes:
+        attributes (tuple): The names of the per-agent numeric attributes used by the kernel, such as mass.
+    """
+
+    attributes = ()
+
+    def __call__(self, delta, distance, agent, partner):
+        """Compute the contribution of each partner to each agent.
+
+        Args:
+            delta (np.ndarray): An (m, 2) array of the displacements from each agent to its partner.
+            distance (np.ndarray): The m distances between each agent and its partner. Never zero.
+            agent (dict): Maps each name in attributes to the m values of each agent.
+            partner (dict): Maps each name in attributes to the m values of each partner.
+
+        Returns:
+            An (m, 2) np.ndarray.
+        """
+        raise NotImplementedError
+
+
+class InverseSquare(Kernel):
+    """An inverse square law attraction, such as gravity.
+
+    Agents accelerate towards partners by strength*partner_attribute/distance**2. A negative strength repels.
+
+    Args:
+        strength (float): The constant of proportionality, such as the gravitational constant.
+        attribute (str): The partner attribute the acceleration is proportional to, such as mass. If None, all
+            partners contribute equally.
+        softening (float): A length added in quadrature to distances, which bounds the acceleration of close
+            encounters.
+    """
+
+    def __init__(self, strength=1., attribute="mass", softening=0.):
+        self.strength = strength
+        self.attribute = attribute
+        self.softening = softening
+        self.attributes = () if attribute is None else (attribute,)
+
+    def __call__(self, delta, distance, agent, partner):
+        scale = self.strength/(distance**2 + self.softening**2)**1.5
+        if self.attribute is not None:
+            scale = scale*partner[self.attribute]
+
+        return delta*scale[:, np.newaxis]
+
+
+class Spring(Kernel):
+    """A linear spring between agents.
+
+    Agents are pulled towards partners further than rest_length away, and pushed away from closer partners,
+    by stiffness*(distance - rest_length).
+
+    Args:
+        stiffness (float): The spring constant.
+        rest_length (float): The distance at which the spring exerts no force.
+    """
+
+    def __init__(self, stiffness=1., rest_length=0.):
+        self.stiffness = stiffness
+        self.rest_length = rest_length
+
+    def __call__(self, delta, distance, agent, partner):
+        scale = self.stiffness*(distance - self.rest_length)/distance
+        return delta*scale[:, np.newaxis]
+
+
+class Repulsion(Kernel):
+    """A power law repulsion between agents, of strength/distance**exponent.
+
+    Args:
+        strength (float): The constant of proportionality.
+        exponent (float): The power of the distance the repulsion is inversely proportional to.
+    """
+
+    def __init__(self, strength=1., exponent=2.):
+        self.strength = strength
+        self.exponent = exponent
+
+    def __call__(self, delta, distance, agent, partner):
+        scale = -self.strength/distance**(self.exponent + 1)
+        return delta*scale[:, np.newaxis]
+
+
+class Interaction(object):
+    """A pairwise kernel evaluated between agents of a given type and their partners.
+
+    Attributes:
+        kernel (Kernel): The kernel.
+        agent_type (type): The type of agents the interaction acts upon (including subclasses).
+        partner_type (type): The type of agents that act upon them (including subclasses).
+        cutoff (float): If given, only partners within this distance interact.
+
+    Args:
+        kernel (Kernel): The kernel.
+        agent_type (type): The type of agents the interaction acts upon. Defaults to SpatialAgent.
+        partner_type (type): The type of agents that act upon them. Defaults to agent_type.
+        cutoff (float): The interaction range.
+    """
+
+    # Constants.
+    BROADCAST_CHUNK = 1 << 20
+
+    def __init__(self, kernel, agent_type=None, partner_type=None, cutoff=None):
+        if cutoff is not None and cutoff <= 0:
+            raise ValueError("Cutoff must be positive.")
+
+        # The core module may not be loaded yet, since it imports this one.
+        if agent_type is None:
+            agent_type = core.SpatialAgent
+
+        self.kernel = kernel
+        self.agent_type = agent_type
+        self.partner_type = agent_type if partner_type is None else partner_type
+        self.cutoff = cutoff
+
+    def evaluate(self, simulation, agents=None, positions=None):
+        """Evaluate the interaction.
+
+        Args:
+            simulation (Simulation): The simulation, from which partners are obtained.
+            agents (list): The agents to evaluate the interaction for. Defaults to all agents of agent_type.
+                Agents that are not of agent_type are unaffected.
+            positions (np.ndarray): An (n, 2) array of positions to use for agents instead of their current
+                positions, for example when integrating. Partners among agents also take these positions.
+
+        Returns:
+            An (n, 2) np.ndarray of the summed contributions to each agent.
+        """
+        if agents is None:
+            agents = list(simulation.agents.of_type(self.agent_type))
+
+        if positions is None:
+            positions = _positions(agents)
+
+        result = np.zeros((len(agents), 2))
+        rows = np.array([isinstance(agent, self.agent_type) for agent in agents], dtype=bool)
+        rows = np.nonzero(rows)[0]
+
+        # Partners are taken from agents where possible, so that they use the given positions.
+        row_mapping = {agent: row for row, agent in enumerate(agents)}
+        partners = list(simulation.agents.of_type(self.partner_type))
+        partner_rows = [row_mapping.get(partner, -1) for partner in partners]
+        partner_positions = np.array([positions[row] if row >= 0 else partner.pos
+                                      for partner, row in zip(partners, partner_rows)],
+                                     dtype=np.float64).reshape(-1, 2)
+
+        if not len(rows) or not partners:
+            return result
+
+        # Agents are never their own partners.
+        partner_rows = np.array(partner_rows, dtype=np.intp)
+        agent_attributes = {name: _attribute([agents[row] for row in rows], name) for name in self.kernel.attributes}
+        partner_attributes = {name: _attribute(partners, name) for name in self.kernel.attributes}
+
+        if self.cutoff is None:
+            self._evaluate_all(result, rows, positions[rows], partner_rows, partner_positions, agent_attributes,
+                               partner_attributes)
+        elif len(partners) == len(rows) and np.array_equal(np.sort(partner_rows), rows):
+            # Agents interact among themselves, so each pair is found once and evaluated both ways.
+            a, b = index._pairs_within(partner_positions, self.cutoff)
+            partner_rows_index = np.searchsorted(rows, partner_rows)
+            i = np.concatenate((partner_rows_index[a], partner_rows_index[b]))
+            j = np.concatenate((b, a))
+            self._evaluate_pairs(result, rows, positions[rows], partner_rows, partner_positions,
+                                 agent_attributes, partner_attributes, i, j)
+        else:
+            i, j = index._pairs_within(positions[rows], self.cutoff, partner_positions)
+            self._evaluate_pairs(result, rows, positions[rows], partner_rows, partner_positions,
+                                 agent_attributes, partner_attributes, i, j)
+
+        return result
+
+    def _evaluate_all(self, result, rows, positions, partner_rows, partner_positions, agent_attributes,
+                      partner_attributes):
+        """Evaluate every pair through broadcasting, a bounded number of pairs at a time."""
+        chunk = max(1, Interaction.BROADCAST_CHUNK//len(partner_positions))
+        num_partners = len(partner_positions)
+
+        for start in range(0, len(rows), chunk):
+            stop = min(start + chunk, len(rows))
+            i = np.repeat(np.arange(start, stop), num_partners)
+            j = np.tile(np.arange(num_partners), stop - start)
+            self._evaluate_pairs(result, rows, positions, partner_rows, partner_positions, agent_attributes,
+                                 partner_attributes, i, j)
+
+    def _evaluate_pairs(self, result, rows, positions, partner_rows, partner_positions, agent_attributes,
+                        partner_attributes, i, j):
+        """Evaluate the given pairs, and sum the contributions into result.
+
+        Args:
+            i (np.ndarray): Indices into rows of the agent of each pair.
+            j (np.ndarray): Indices into partners of the partner of each pair.
+        """
+        # Drop agents paired with themselves.
+        keep = partner_rows[j] != rows[i]
+        i, j = i[keep], j[keep]
+
+        delta = partner_positions[j] - positions[i]
+        distance = np.sqrt(np.sum(delta**2, axis=1))
+
+        # Coincident agents exert no force upon one another.
+        keep = distance > 0
+        i, j, delta, distance = i[keep], j[keep], delta[keep], distance[keep]
+
+        values = self.kernel(delta, distance, {name: values[i] for name, values in agent_attributes.items()},
+                             {name: values[j] for name, values in partner_attributes.items()})
+
+        for dimension in range(2):
+            result[:, dimension] += np.bincount(rows[i], weights=values[:, dimension], minlength=len(result))
+
+
+def _positions(agents):
+    """Obtain the positions of agents as an (n, 2) array."""
+    return np.array([agent.pos for agent in agents], dtype=np.float64).reshape(-1, 2)
+
+def _attribute(agents, name):
+    """Obtain a numeric attribute of agents as an array."""
+    return np.array([getattr(agent, name) for agent in agents], dtype=np.float64)
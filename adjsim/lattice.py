@@ -0,0 +1,387 @@
+"""Lattice module.
+
+This module contains a dense lattice engine for grid-aligned models such as cellular automata. Cell states are
+held in a NumPy array and updated by rules applied to vectorized neighbour counts, rather than by agents
+querying a GridIndex every step. A lattice is attached to a simulation, so that it is stepped, tracked and
+rendered through the same interfaces as agents.
+
+Designed and developed by Sever Topan.
+"""
+
+# Third party.
+import numpy as np
+
+# Local.
+from . import core
+from . import index
+from . import snapshot
+
+BOUNDARY_GROW = "grow"
+BOUNDARY_WRAP = "wrap"
+BOUNDARY_FIXED = "fixed"
+
+
+class LifeRule(object):
+    """A life-like cellular automaton rule.
+
+    Cells are either dead (0) or alive (1). Dead cells with a number of live neighbours in birth come alive,
+    and live cells with a number of live neighbours in survive stay alive.
+
+    Args:
+        birth (iterable): The neighbour counts upon which dead cells come alive.
+        survive (iterable): The neighbour counts upon which live cells stay alive.
+    """
+
+    def __init__(self, birth=(3,), survive=(2, 3)):
+        self.birth = frozenset(birth)
+        self.survive = frozenset(survive)
+        self._table = np.zeros((2, 0), dtype=np.uint8)
+
+    @staticmethod
+    def from_string(rule):
+        """Obtain a rule from its B/S notation, such as "B3/S23" for Conway's Game of Life.
+
+        Args:
+            rule (str): The rule string.
+
+        Returns:
+            A LifeRule.
+        """
+        parts = {}
+        for part in rule.upper().split("/"):
+            if not part or not part[0] in "BS" or (part[1:] and not part[1:].isdigit()):
+                raise ValueError("Invalid rule string '{}'.".format(rule))
+
+            parts[part[0]] = [int(digit) for digit in part[1:]]
+
+        if set(parts) != {"B", "S"}:
+            raise ValueError("Invalid rule string '{}'.".format(rule))
+
+        return LifeRule(parts["B"], parts["S"])
+
+    def __call__(self, state, counts, max_count):
+        """Obtain the next state of every cell.
+
+        Args:
+            state (np.ndarray): The current state of every cell.
+            counts (np.ndarray): The number of live neighbours of every cell.
+            max_count (int): The largest possible neighbour count.
+
+        Returns:
+            An np.ndarray of the next states.
+        """
+        # Transitions are looked up in a table indexed by state and count.
+        if self._table.shape[1] <= max_count:
+            self._table = np.zeros((2, max_count + 1), dtype=np.uint8)
+            self._table[0, [count for count in self.birth if count <= max_count]] = 1
+            self._table[1, [count for count in self.survive if count <= max_count]] = 1
+
+        return self._table[state, counts]
+
+
+GAME_OF_LIFE = LifeRule()
+
+
+class Lattice(object):
+    """A dense 2d lattice of cell states.
+
+    Cell states are held in an array covering a window of the lattice, whose world cell coordinates start at
+    origin. How cells beyond the window are treated depends on the boundary:
+
+    - BOUNDARY_GROW: the lattice is unbounded. The window is grown and trimmed each step such that it covers
+      every live cell along with its neighbourhood, and all cells outside of it are dead.
+    - BOUNDARY_WRAP: the window is the whole lattice, with opposite edges adjacent to one another.
+    - BOUNDARY_FIXED: the window is the whole lattice, and cells beyond its edges are dead.
+
+    Each step, the number of live neighbours of every cell is computed at once by summing shifted copies of the
+    lattice, one per stencil offset, and the rule maps states and counts to the next states.
+
+    Attributes:
+        state (np.ndarray): The state of every cell in the window, indexed by x then y. Zero is dead.
+        origin (tuple): The cell coordinates of state[0, 0].
+        rule (callable): Takes the states, live neighbour counts and largest possible count of every cell and
+            returns their next states, such as a LifeRule.
+        stencil (index.Stencil): The neighbourhood of each cell.
+        boundary (str): The boundary condition.
+        cell_size (float): The world size of a cell. Cell (i, j) is centered at (i, j)*cell_size.
+        size (float): The visualized size of a live cell.
+        color (str): The visualized color of a live cell.
+        style (int): The visualized pattern of a live cell.
+        time (int): The number of steps taken.
+
+    Args:
+        rule (callable): The rule. Defaults to Conway's Game of Life.
+        stencil (index.Stencil): The neighbourhood. Defaults to the Moore neighbourhood.
+        boundary (str): The boundary condition. Defaults to BOUNDARY_GROW.
+        shape (tuple): The width and height of the lattice. Required for wrapped and fixed boundaries.
+        cell_size (float): The world size of a cell.
+    """
+
+    # Constants.
+    GROWTH_MARGIN = 16
+
+    def __init__(self, rule=GAME_OF_LIFE, stencil=index.MOORE, boundary=BOUNDARY_GROW, shape=None, cell_size=1):
+        if not boundary in (BOUNDARY_GROW, BOUNDARY_WRAP, BOUNDARY_FIXED):
+            raise ValueError("Unknown boundary '{}'.".format(boundary))
+
+        if boundary != BOUNDARY_GROW and shape is None:
+            raise ValueError("Wrapped and fixed lattices require a shape.")
+
+        if cell_size <= 0:
+            raise ValueError("Cell size must be positive.")
+
+        self.rule = rule
+        self.stencil = stencil
+        self.boundary = boundary
+        self.cell_size = cell_size
+        self.size = cell_size
+        self.color = core.VisualAgent.DEFAULT_COLOR
+        self.style = core.VisualAgent.DEFAULT_STYLE
+        self.time = 0
+
+        self.state = np.zeros((0, 0) if shape is None else shape, dtype=np.uint8)
+        self.origin = (0, 0)
+
+        self._radius = max([max(abs(x), abs(y)) for x, y in stencil.offsets] + [0])
+
+    def __len__(self):
+        return int(np.count_nonzero(self.state))
+
+    def set(self, cells, value=1):
+        """Set the state of a collection of cells.
+
+        Args:
+            cells (np.ndarray, list): The (x, y) integer coordinates of the cells.
+            value (int): The state.
+        """
+        cells = np.array(cells, dtype=np.int64).reshape(-1, 2)
+        if not len(cells):
+            return
+
+        if self.boundary == BOUNDARY_GROW:
+            self._fit(cells)
+
+        local = cells - self.origin
+        if self.boundary == BOUNDARY_WRAP:
+            local %= self.state.shape
+        elif np.any(local < 0) or np.any(local >= self.state.shape):
+            raise IndexError("Cells lie outside of the lattice.")
+
+        self.state[local[:, 0], local[:, 1]] = value
+
+    def get(self, cell):
+        """Obtain the state of a cell.
+
+        Args:
+            cell (tuple): The (x, y) integer coordinates of the cell.
+
+        Returns:
+            An int.
+        """
+        x, y = int(cell[0]) - self.origin[0], int(cell[1]) - self.origin[1]
+        if self.boundary == BOUNDARY_WRAP:
+            x, y = x % self.state.shape[0], y % self.state.shape[1]
+        elif x < 0 or y < 0 or x >= self.state.shape[0] or y >= self.state.shape[1]:
+            return 0
+
+        return int(self.state[x, y])
+
+    def cells(self):
+        """Obtain the coordinates of every live cell.
+
+        Returns:
+            An (n, 2) np.ndarray of integer cell coordinates.
+        """
+        return np.column_stack(np.nonzero(self.state)).astype(np.int64) + self.origin
+
+    def neighbour_counts(self):
+        """Count the live neighbours of every cell in the window.
+
+        Returns:
+            An np.ndarray shaped like state.
+        """
+        radius = self._radius
+        live = (self.state != 0).view(np.uint8)
+        padded = np.pad(live, radius, mode="wrap" if self.boundary == BOUNDARY_WRAP else "constant")
+
+        dtype = np.uint8 if len(self.stencil) < 256 else np.int32
+        counts = np.zeros(self.state.shape, dtype=dtype)
+        width, height = self.state.shape
+        for x, y in self.stencil.offsets:
+            counts += padded[radius + x:radius + x + width, radius + y:radius + y + height]
+
+        return counts
+
+    def step(self):
+        """Advance every cell by one step."""
+        if self.boundary == BOUNDARY_GROW:
+            self._fit()
+
+        self.state = self.rule(self.state, self.neighbour_counts(), len(self.stencil)).astype(np.uint8, copy=False)
+        self.time += 1
+
+    def _fit(self, cells=None):
+        """Reallocate the window of a growing lattice if it does not cover the live cells and their
+        neighbourhoods, or if it is far larger than needed.
+
+        Args:
+            cells (np.ndarray): The coordinates of additional cells to cover.
+        """
+        live = np.nonzero(self.state)
+        covered = [cells] if cells is not None else []
+        if len(live[0]):
+            covered.append(np.array([[live[0].min(), live[1].min()], [live[0].max(), live[1].max()]]) + self.origin)
+
+        if not covered:
+            return
+
+        covered = np.concatenate(covered)
+        lower = covered.min(axis=0)
+        upper = covered.max(axis=0)
+
+        # Cells within the neighbourhood radius of the edge may come alive.
+        required_lower = lower - self._radius
+        required_upper = upper + self._radius
+
+        window_lower = np.array(self.origin)
+        window_upper = window_lower + self.state.shape - 1
+        slack = np.concatenate((required_lower - window_lower, window_upper - required_upper))
+        if self.state.size and np.all(slack >= 0) and np.all(slack <= 4*Lattice.GROWTH_MARGIN):
+            return
+
+        # Leave a margin, so that the window is not reallocated every step.
+        new_lower = required_lower - Lattice.GROWTH_MARGIN
+        new_upper = required_upper + Lattice.GROWTH_MARGIN
+        state = np.zeros(new_upper - new_lower + 1, dtype=np.uint8)
+
+        if len(live[0]):
+            state[live[0] + self.origin[0] - new_lower[0], live[1] + self.origin[1] - new_lower[1]] = \
+                self.state[live]
+
+        self.state = state
+        self.origin = (int(new_lower[0]), int(new_lower[1]))
+
+
+def _cell_ids(cells):
+    """Obtain the snapshot record ids of lattice cells.
+
+    Ids are negative, so that they never collide with the non-negative record ids of agents. Cell coordinates
+    must lie within +/-2**30.
+    """
+    offset = np.int64(1 << 30)
+    return -1 - (((cells[:, 0] + offset) << np.int64(31)) | (cells[:, 1] + offset))
+
+
+class LatticeSnapshotEncoder(snapshot.SnapshotEncoder):
+    """Encodes the visual agents and the live lattice cells of a simulation into packed snapshots.
+
+    Live cells are encoded as records with the lattice's appearance. Cells that come alive are reported as
+    changed, and cells that die are reported as removed.
+    """
+
+    def __init__(self, simulation):
+        super().__init__(simulation)
+        self._previous_ids = None
+
+    def full(self):
+        """Encode every visual agent and live cell, and start tracking changes from this frame.
+
+        Returns:
+            A snapshot.Snapshot.
+        """
+        frame = super().full()
+
+        cells = self._simulation.lattice.cells()
+        self._previous_ids = np.sort(_cell_ids(cells))
+        records = np.concatenate((frame.records, self._encode_cells(cells)))
+
+        return snapshot.Snapshot(records, self._palette)
+
+    def delta(self):
+        """Encode the visual agents and cells that changed since the previous frame.
+
+        Returns:
+            A snapshot.DeltaSnapshot.
+        """
+        if self._previous_ids is None:
+            self._previous_ids = np.zeros((0,), dtype=np.int64)
+
+        frame = super().delta()
+
+        cells = self._simulation.lattice.cells()
+        ids = _cell_ids(cells)
+        born = ~np.in1d(ids, self._previous_ids, assume_unique=True)
+        died = np.setdiff1d(self._previous_ids, ids, assume_unique=True)
+        self._previous_ids = np.sort(ids)
+
+        records = np.concatenate((frame.records, self._encode_cells(cells[born])))
+        return snapshot.DeltaSnapshot(records, np.concatenate((frame.removed, died)), self._palette)
+
+    def close(self):
+        """Stop tracking changes."""
+        super().close()
+        self._previous_ids = None
+
+    def _encode_cells(self, cells):
+        """Pack live cells into a record array."""
+        lattice = self._simulation.lattice
+
+        records = np.zeros((len(cells),), dtype=snapshot.RECORD_DTYPE)
+        records["id"] = _cell_ids(cells)
+        records["x"] = cells[:, 0]*lattice.cell_size
+        records["y"] = cells[:, 1]*lattice.cell_size
+        records["size"] = lattice.size
+        records["color"] = self._color_index(lattice.color)
+        records["style"] = lattice.style
+
+        return records
+
+
+def _attach(simulation, lattice):
+    """Attach a lattice to a simulation, such that it is stepped and rendered with the simulation."""
+    simulation.lattice = lattice
+    simulation.snapshots = LatticeSnapshotEncoder(simulation)
+    simulation.callbacks.simulation_step_started.register(_step_lattice)
+
+def _step_lattice(simulation):
+    """Callback function called upon a simulation step starting. Agents observe the updated lattice.
+
+    Args:
+        simulation (Simulation): The simulation.
+    """
+    simulation.lattice.step()
+
+
+class LatticeSimulation(core.Simulation):
+    """A Simulation holding a lattice, which is stepped at the start of every simulation step.
+
+    Agents may be added alongside the lattice, and observe it through the lattice attribute.
+
+    Attributes:
+        lattice (Lattice): The simulation's lattice.
+
+    Args:
+        lattice (Lattice): The lattice. Defaults to an unbounded Game of Life lattice.
+    """
+
+    def __init__(self, lattice=None):
+        super().__init__()
+        _attach(self, Lattice() if lattice is None else lattice)
+
+
+class VisualLatticeSimulation(core.VisualSimulation):
+    """A VisualSimulation holding a lattice, which is stepped at the start of every simulation step.
+
+    Live cells are rendered alongside visual agents, with the lattice's size, color and style. Large
+    lattices are best rendered with the batched view.
+
+    Attributes:
+        lattice (Lattice): The simulation's lattice.
+
+    Args:
+        lattice (Lattice): The lattice. Defaults to an unbounded Game of Life lattice.
+    """
+
+    def __init__(self, lattice=None):
+        super().__init__()
+        _attach(self, Lattice() if lattice is None else lattice)
@@ -0,0 +1,469 @@
+"""Population module.
+
+This module contains the population store, which keeps the positions and registered numeric attributes
+of all spatial agents in contiguous arrays so that population-wide computation may be vectorized.
+
+Designed and developed by Sever Topan.
+"""
+
+# Third party.
+import numpy as np
+
+# Local.
+from . import core
+
+class _StoredAttribute(object):
+    """Descriptor that redirects an agent attribute to a PopulationStore.
+
+    The descriptor is installed on an agent class only while a store holds agents of that exact class which
+    have the attribute, and is removed once no store does. Agents that are not stored in a PopulationStore
+    that registers the attribute fall back to their instance dictionary, so the descriptor is transparent to
+    agents that belong to any other simulation.
+
+    Attributes:
+        stores (int): The number of stores using the descriptor.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stores = 0
+
+    def __get__(self, agent, owner):
+        if agent is None:
+            return self
+
+        store = agent._store
+        if store is not None and self.name in store._attributes:
+            return store._get_attribute(agent, self.name)
+
+        try:
+            return agent.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+    def __set__(self, agent, value):
+        store = agent._store
+        if store is not None and self.name in store._attributes:
+            store._set_attribute(agent, self.name, value)
+        else:
+            agent.__dict__[self.name] = value
+
+    def __delete__(self, agent):
+        store = agent._store
+        if store is not None and self.name in store._attributes:
+            store._delete_attribute(agent, self.name)
+        else:
+            try:
+                del agent.__dict__[self.name]
+            except KeyError:
+                raise AttributeError(self.name)
+
+
+class PopulationStore(object):
+    """A struct-of-arrays store for the positions and numeric attributes of SpatialAgents.
+
+    When initialized, the position of every SpatialAgent in the simulation is kept in a single contiguous
+    (N, 2) array, and agent.pos becomes a read-only view into this array. Numeric attributes may be registered
+    with register_attribute, after which they are also backed by contiguous arrays. Rows are kept dense:
+    removing an agent moves the last row into its place.
+
+    Note:
+        agent.pos views the agent's current row, so a view that is held reflects the agent's later moves.
+        Once agents are removed or the store grows, a held view may instead refer to another agent's row, or
+        to storage that is no longer used. Obtain agent.pos anew after such changes, or copy it to keep it.
+
+    The store is opt-in, and must be initialized before it is used in a simulation.
+    """
+
+    DEFAULT_CAPACITY = 16
+
+    def __init__(self, simulation):
+        super().__init__()
+
+        self._simulation = simulation
+        self._agents = []
+        self._positions = np.zeros((0, 2))
+        self._attributes = {}
+        self._attribute_masks = {}
+        self._fixed_dtypes = set()
+        self._fitted_types = {}
+        self._type_counts = {}
+        self._descriptors = set()
+        self._size = 0
+        self._initialized = False
+
+    @property
+    def initialized(self):
+        """bool: Whether or not the store has been initialized."""
+        return self._initialized
+
+    def initialize(self, capacity=DEFAULT_CAPACITY):
+        """Initialize the store, moving the data of all current SpatialAgents into it.
+
+        Args:
+            capacity (int): The number of agents to allocate space for. The store grows as needed.
+        """
+        if capacity <= 0:
+            raise ValueError("Store must be initialized with a positive capacity.")
+
+        if self._initialized:
+            raise Exception("Store already initialized.")
+
+        self._positions = np.zeros((capacity, 2))
+        for name, array in self._attributes.items():
+            self._attributes[name] = np.zeros((capacity,), dtype=array.dtype)
+            self._attribute_masks[name] = np.zeros((capacity,), dtype=np.bool_)
+
+        self._initialized = True
+
+        for agent in self._simulation.agents:
+            self._insert(agent)
+
+        # Init callbacks.
+        self._simulation.callbacks.agent_added.register_batch(self._insert, self._insert_many)
+        self._simulation.callbacks.agent_removed.register(self._remove)
+
+    def register_attribute(self, name, dtype=None):
+        """Back a numeric agent attribute with a contiguous array.
+
+        The attribute may then be read and written through the agents as usual, and obtained
+        population-wide via the attribute method.
+
+        By default, the array takes the type of the values stored in it, and is widened as needed to hold new
+        values exactly: an attribute holding ints reads back as ints until a float is assigned. If a dtype is
+        given, it is kept, and values are converted to it as NumPy assignment does.
+
+        Args:
+            name (str): The attribute name.
+            dtype (np.dtype): The type of the array holding the attribute. Defaults to the values' type.
+
+        Raises:
+            TypeError: If a value stored in an attribute without a given dtype is not numeric.
+        """
+        if name in self._attributes:
+            raise ValueError("Attribute already registered.")
+
+        if dtype is None:
+            dtype = np.bool_
+        else:
+            self._fixed_dtypes.add(name)
+
+        capacity = len(self._positions)
+        self._attributes[name] = np.zeros((capacity,), dtype=dtype)
+        self._attribute_masks[name] = np.zeros((capacity,), dtype=np.bool_)
+        self._fitted_types[name] = set()
+
+        # Migrate the attribute of agents already stored.
+        for agent in self._agents[:self._size]:
+            self._adopt_attribute(agent, name)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, agent):
+        return getattr(agent, '_store', None) is self
+
+    @property
+    def positions(self):
+        """np.ndarray: A read-only (N, 2) view of all stored agent positions. Rows are ordered by slot."""
+        view = self._positions[:self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def agents(self):
+        """list: The stored agents, ordered by slot."""
+        return self._agents[:self._size]
+
+    def attribute(self, name):
+        """Obtain a read-only (N,) view of a registered attribute. Rows are ordered by slot.
+
+        Entries corresponding to agents that do not have the attribute are undefined; see attribute_mask.
+
+        Args:
+            name (str): The attribute name.
+
+        Returns:
+            A np.ndarray.
+        """
+        view = self._attributes[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def attribute_mask(self, name):
+        """Obtain a read-only (N,) boolean view marking which agents have a given registered attribute.
+
+        Args:
+            name (str): The attribute name.
+
+        Returns:
+            A np.ndarray.
+        """
+        view = self._attribute_masks[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def slot(self, agent):
+        """Obtain the row of a stored agent in the store's arrays.
+
+        Args:
+            agent (SpatialAgent): The agent.
+
+        Returns:
+            An int.
+        """
+        if not agent in self:
+            raise KeyError(agent)
+
+        return agent._store_slot
+
+    def _grow(self):
+        """Double the capacity of the store, refreshing the position views held by agents."""
+        capacity = max(2*len(self._positions), PopulationStore.DEFAULT_CAPACITY)
+
+        positions = np.zeros((capacity, 2))
+        positions[:self._size] = self._positions[:self._size]
+        self._positions = positions
+
+        for name, array in self._attributes.items():
+            grown = np.zeros((capacity,), dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            self._attributes[name] = grown
+
+            grown_mask = np.zeros((capacity,), dtype=np.bool_)
+            grown_mask[:self._size] = self._attribute_masks[name][:self._size]
+            self._attribute_masks[name] = grown_mask
+
+        for agent in self._agents[:self._size]:
+            self._refresh_view(agent)
+
+    def _refresh_view(self, agent):
+        """Point an agent's position at its row in the store."""
+        view = self._positions[agent._store_slot]
+        view.flags.writeable = False
+        agent._pos = view
+
+    def _acquire_descriptor(self, agent_type, name):
+        """Redirect an attribute of an agent type to the store, installing the descriptor if needed.
+
+        The descriptor is installed on the exact type, so that it does not outlive the stored agents of a
+        base type.
+        """
+        if (agent_type, name) in self._descriptors:
+            return
+
+        descriptor = agent_type.__dict__.get(name)
+        if not isinstance(descriptor, _StoredAttribute):
+            existing = getattr(agent_type, name, None)
+            if existing is not None and not isinstance(existing, _StoredAttribute):
+                raise ValueError("Registered attribute '{}' conflicts with an attribute of {}."
+                                 .format(name, agent_type.__name__))
+
+            descriptor = _StoredAttribute(name)
+            setattr(agent_type, name, descriptor)
+
+        descriptor.stores += 1
+        self._descriptors.add((agent_type, name))
+
+    def _release_descriptors(self, agent_type):
+        """Stop redirecting the attributes of an agent type of which the store holds no more agents.
+
+        Descriptors no longer used by any store are removed from the type.
+        """
+        for name in self._attributes:
+            if not (agent_type, name) in self._descriptors:
+                continue
+
+            self._descriptors.discard((agent_type, name))
+            descriptor = agent_type.__dict__[name]
+            descriptor.stores -= 1
+            if descriptor.stores == 0:
+                delattr(agent_type, name)
+
+    def _rebind(self):
+        """Re-establish agent position views and attribute descriptors after the store has been unpickled.
+
+        Pickling does not preserve views, nor descriptors installed on agent types.
+        """
+        for agent in self._agents[:self._size]:
+            self._refresh_view(agent)
+
+        descriptors = self._descriptors
+        self._descriptors = set()
+        for agent_type, name in descriptors:
+            self._acquire_descriptor(agent_type, name)
+
+    def _fit(self, name, value):
+        """Widen the array of a registered attribute to hold a value exactly, unless its dtype was given."""
+        fitted_types = self._fitted_types[name]
+        if type(value) in fitted_types or name in self._fixed_dtypes:
+            return
+
+        dtype = np.result_type(value)
+        if not dtype.kind in "biufc":
+            raise TypeError("Registered attribute '{}' must be numeric.".format(name))
+
+        array = self._attributes[name]
+        if not np.can_cast(dtype, array.dtype, casting="safe"):
+            self._attributes[name] = array.astype(np.promote_types(array.dtype, dtype))
+
+        fitted_types.add(type(value))
+
+    def _adopt_attribute(self, agent, name):
+        """Move a registered attribute from an agent's instance dictionary into the store.
+
+        The redirecting descriptor is only installed on agent types whose instances have the attribute.
+        Attributes declared in __slots__ are not moved into the store.
+        """
+        slot = agent._store_slot
+        instance_dict = getattr(agent, "__dict__", {})
+        if not name in instance_dict:
+            self._attribute_masks[name][slot] = False
+            return
+
+        self._fit(name, instance_dict[name])
+        self._acquire_descriptor(type(agent), name)
+        self._attributes[name][slot] = instance_dict.pop(name)
+        self._attribute_masks[name][slot] = True
+
+    def _count_type(self, agent_type, count):
+        """Track the number of stored agents of an exact type."""
+        self._type_counts[agent_type] = self._type_counts.get(agent_type, 0) + count
+
+    def _insert(self, agent):
+        """Callback function called upon an agent being added.
+
+        Args:
+            agent (Agent): The agent that was added.
+        """
+        # We only care if the agent is spatial.
+        if not issubclass(type(agent), core.SpatialAgent) or agent in self:
+            return
+
+        if self._size == len(self._positions):
+            self._grow()
+
+        slot = self._size
+        self._size += 1
+
+        if slot < len(self._agents):
+            self._agents[slot] = agent
+        else:
+            self._agents.append(agent)
+
+        self._positions[slot] = agent._pos
+        agent._store = self
+        agent._store_slot = slot
+        self._refresh_view(agent)
+        self._count_type(type(agent), 1)
+
+        for name in self._attributes:
+            self._adopt_attribute(agent, name)
+
+    def _insert_many(self, agents):
+        """Callback function called upon a batch of agents being added.
+
+        Storage is grown at most once, and positions are copied into the store in a single pass.
+
+        Args:
+            agents (list): The agents that were added.
+        """
+        # We only care if the agent is spatial.
+        agents = [agent for agent in agents if issubclass(type(agent), core.SpatialAgent) and not agent in self]
+        if not agents:
+            return
+
+        start = self._size
+        end = start + len(agents)
+        while end > len(self._positions):
+            self._grow()
+
+        self._positions[start:end] = [agent._pos for agent in agents]
+        self._agents[start:] = agents
+        self._size = end
+
+        for slot, agent in enumerate(agents, start):
+            agent._store = self
+            agent._store_slot = slot
+            self._refresh_view(agent)
+            self._count_type(type(agent), 1)
+
+            for name in self._attributes:
+                self._adopt_attribute(agent, name)
+
+    def _remove(self, agent):
+        """Callback function called upon an agent being removed.
+
+        The agent's data is moved back onto the agent so that it remains usable after removal.
+
+        Args:
+            agent (Agent): The agent that was removed.
+        """
+        if not agent in self:
+            return
+
+        slot = agent._store_slot
+        last = self._size - 1
+
+        # Restore agent data.
+        position = self._positions[slot].copy()
+        position.flags.writeable = False
+        agent._pos = position
+
+        for name, array in self._attributes.items():
+            if self._attribute_masks[name][slot]:
+                agent.__dict__[name] = array[slot].item()
+
+        agent._store = None
+        agent._store_slot = None
+
+        self._count_type(type(agent), -1)
+        if self._type_counts[type(agent)] == 0:
+            del self._type_counts[type(agent)]
+            self._release_descriptors(type(agent))
+
+        # Move the last row into the vacated slot to keep the arrays dense.
+        if slot != last:
+            moved_agent = self._agents[last]
+            self._positions[slot] = self._positions[last]
+            for name, array in self._attributes.items():
+                array[slot] = array[last]
+                self._attribute_masks[name][slot] = self._attribute_masks[name][last]
+
+            self._agents[slot] = moved_agent
+            moved_agent._store_slot = slot
+            self._refresh_view(moved_agent)
+
+        self._agents[last] = None
+        self._size -= 1
+
+    def _set_position(self, agent, value):
+        """Write a position into an agent's row."""
+        self._positions[agent._store_slot] = value
+
+    def _get_attribute(self, agent, name):
+        """Read a registered attribute from an agent's row."""
+        slot = agent._store_slot
+        if not self._attribute_masks[name][slot]:
+            raise AttributeError(name)
+
+        return self._attributes[name][slot].item()
+
+    def _set_attribute(self, agent, name, value):
+        """Write a registered attribute into an agent's row."""
+        slot = agent._store_slot
+        self._fit(name, value)
+        self._attributes[name][slot] = value
+
+        # The descriptor may have been installed by another store.
+        if not self._attribute_masks[name][slot]:
+            self._acquire_descriptor(type(agent), name)
+            self._attribute_masks[name][slot] = True
+
+    def _delete_attribute(self, agent, name):
+        """Remove a registered attribute from an agent's row."""
+        slot = agent._store_slot
+        if not self._attribute_masks[name][slot]:
+            raise AttributeError(name)
+
+        self._attribute_masks[name][slot] = False
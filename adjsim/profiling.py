@@ -0,0 +1,280 @@
+"""Profiling module.
+
+This module contains the simulation profiler, which records where wall time is spent during a simulation:
+in decision modules, actions, perception and loss callables, trackers and callbacks.
+
+Designed and developed by Sever Topan.
+"""
+
+# Standard.
+import time
+
+# Local.
+from . import callback
+from . import decision
+
+class Timing(object):
+    """Accumulated wall time of a profiled callable.
+
+    Attributes:
+        calls (int): The number of recorded calls.
+        total (float): The total wall time of the recorded calls, in seconds.
+    """
+
+    __slots__ = ("calls", "total")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.
+
+    @property
+    def mean(self):
+        """float: The mean wall time per call, in seconds."""
+        return self.total/self.calls if self.calls else 0.
+
+    def as_dict(self):
+        """Obtain the timing as a dictionary.
+
+        Returns:
+            A dictionary with calls, total and mean entries.
+        """
+        return {"calls": self.calls, "total": self.total, "mean": self.mean}
+
+
+class _ProfiledCallable(object):
+    """Wraps a callable, recording its wall time into a Timing."""
+
+    __slots__ = ("function", "timing")
+
+    def __init__(self, function, timing):
+        self.function = function
+        self.timing = timing
+
+    def __call__(self, *args):
+        start = time.perf_counter()
+        try:
+            return self.function(*args)
+        finally:
+            self.timing.total += time.perf_counter() - start
+            self.timing.calls += 1
+
+
+class Profiler(object):
+    """Records wall time and call counts of the callables invoked during a simulation.
+
+    Timings are grouped into the following categories:
+        decision: Keyed by decision class name. Includes the time spent in the actions it casts.
+        action: Keyed by action name.
+        perception: Keyed by the class name of the decision module calling the perception callable.
+        loss: Keyed by the class name of the decision module calling the loss callable.
+        tracker: Keyed by tracker key.
+        callback: Keyed by callback name and callable name, for example 'agent_moved: GridIndex._update'.
+
+    The duration and agent count of every step are also recorded.
+
+    The profiler is disabled by default, in which case it adds no overhead. While enabled, the actions of
+    every agent in the simulation are wrapped, as are the perception and loss callables of functional
+    decision modules. They are unwrapped upon being disabled. Actions set on agents after they have been
+    added to the simulation are not recorded.
+
+    Attributes:
+        steps (list): One dictionary per recorded step, with time, duration and agents entries.
+    """
+
+    CATEGORIES = ("decision", "action", "perception", "loss", "tracker", "callback")
+
+    def __init__(self, simulation):
+        self._simulation = simulation
+        self._enabled = False
+        self._timings = {category: {} for category in Profiler.CATEGORIES}
+        self._callback_keys = {}
+        self._action_suites = {}
+        self.steps = []
+
+    @property
+    def enabled(self):
+        """bool: Whether or not the profiler is recording."""
+        return self._enabled
+
+    def enable(self):
+        """Starts recording."""
+        if self._enabled:
+            return
+
+        self._enabled = True
+
+        for name, agent_callback in self._callbacks():
+            agent_callback._profiler = self
+            agent_callback._profile_name = name
+
+        for agent in self._simulation.agents:
+            self._wrap_agent(agent)
+
+        self._simulation.callbacks.agent_added.register(self._wrap_agent)
+
+    def disable(self):
+        """Stops recording. Recorded data is retained."""
+        if not self._enabled:
+            return
+
+        self._enabled = False
+
+        self._simulation.callbacks.agent_added.unregister(self._wrap_agent)
+
+        for _, agent_callback in self._callbacks():
+            agent_callback._profiler = None
+
+        for actions in self._action_suites.values():
+            for name, action in list(actions.items()):
+                if isinstance(action, _ProfiledCallable):
+                    actions[name] = action.function
+
+        for agent in self._simulation.agents:
+            self._unwrap_decision(agent.decision)
+
+        self._action_suites = {}
+
+    def reset(self):
+        """Discards all recorded data."""
+        # Timings are zeroed rather than discarded, since wrapped callables hold references to them.
+        for timings in self._timings.values():
+            for timing in timings.values():
+                timing.calls = 0
+                timing.total = 0.
+
+        self.steps = []
+
+    def timings(self, category):
+        """Obtain the timings of a category.
+
+        Args:
+            category (str): One of Profiler.CATEGORIES.
+
+        Returns:
+            A dictionary mapping keys to Timing objects.
+        """
+        return {key: timing for key, timing in self._timings[category].items() if timing.calls}
+
+    def as_dict(self):
+        """Obtain all recorded data as plain python types.
+
+        Returns:
+            A dictionary mapping each category to a dictionary of key to timing dictionaries, as well as a
+            'steps' entry holding the per-step records.
+        """
+        data = {category: {key: timing.as_dict() for key, timing in timings.items() if timing.calls}
+                for category, timings in self._timings.items()}
+        data["steps"] = [dict(step) for step in self.steps]
+
+        return data
+
+    def report(self):
+        """Obtain a human-readable report of the recorded data.
+
+        Entries are sorted by total time within each category.
+
+        Returns:
+            A string.
+        """
+        lines = []
+
+        if self.steps:
+            total = sum(step["duration"] for step in self.steps)
+            lines.append("steps: {}, total {:.6f}s, mean {:.6f}s, mean agents {:.1f}".format(
+                len(self.steps), total, total/len(self.steps),
+                sum(step["agents"] for step in self.steps)/len(self.steps)))
+
+        for category in Profiler.CATEGORIES:
+            timings = {key: timing for key, timing in self._timings[category].items() if timing.calls}
+            if not timings:
+                continue
+
+            lines.append("")
+            lines.append(category)
+
+            key_width = max(len(str(key)) for key in timings)
+            for key, timing in sorted(timings.items(), key=lambda item: -item[1].total):
+                lines.append("  {:<{}}  calls {:>9}  total {:.6f}s  mean {:.9f}s".format(
+                    str(key), key_width, timing.calls, timing.total, timing.mean))
+
+        return "\n".join(lines)
+
+    def _timing(self, category, key):
+        """Obtains the Timing of a given key, creating it if needed."""
+        timings = self._timings[category]
+        timing = timings.get(key)
+        if timing is None:
+            timing = Timing()
+            timings[key] = timing
+
+        return timing
+
+    def _time(self, category, key, function, *args):
+        """Calls a function, recording its wall time."""
+        timing = self._timing(category, key)
+
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            timing.total += time.perf_counter() - start
+            timing.calls += 1
+
+    def _call_decision(self, agent):
+        """Calls an agent's decision module, recording its wall time."""
+        agent_decision = agent.decision
+        return self._time("decision", type(agent_decision).__name__, agent_decision, self._simulation, agent)
+
+    def _call_tracker(self, key, tracker):
+        """Calls a tracker, recording its wall time."""
+        return self._time("tracker", key, tracker, self._simulation)
+
+    def _call_callback(self, callback_name, function, parameter):
+        """Calls a callback subscriber, recording its wall time."""
+        # The profiler's own subscriber is not recorded.
+        if function == self._wrap_agent:
+            return function(parameter)
+
+        key = self._callback_keys.get((callback_name, function))
+        if key is None:
+            function_name = getattr(function, "__qualname__", type(function).__name__)
+            key = "{}: {}".format(callback_name, function_name)
+            self._callback_keys[(callback_name, function)] = key
+
+        return self._time("callback", key, function, parameter)
+
+    def _record_step(self, duration):
+        """Records the duration of a completed step."""
+        self.steps.append({"time": self._simulation.time, "duration": duration,
+                           "agents": len(self._simulation.agents)})
+
+    def _callbacks(self):
+        """Obtains the simulation's callbacks along with their names."""
+        return [(name, value) for name, value in vars(self._simulation.callbacks).items()
+                if isinstance(value, callback.SingleParameterCallback)]
+
+    def _wrap_agent(self, agent):
+        """Wraps the actions and decision callables of an agent."""
+        actions = agent.actions
+        if not id(actions) in self._action_suites:
+            self._action_suites[id(actions)] = actions
+            for name, action in list(actions.items()):
+                if not isinstance(action, _ProfiledCallable):
+                    actions[name] = _ProfiledCallable(action, self._timing("action", name))
+
+        agent_decision = agent.decision
+        if isinstance(agent_decision, decision.FunctionalDecision):
+            decision_name = type(agent_decision).__name__
+            if not isinstance(agent_decision.perception, _ProfiledCallable):
+                agent_decision.perception = _ProfiledCallable(agent_decision.perception,
+                                                              self._timing("perception", decision_name))
+            if not isinstance(agent_decision.loss, _ProfiledCallable):
+                agent_decision.loss = _ProfiledCallable(agent_decision.loss, self._timing("loss", decision_name))
+
+    def _unwrap_decision(self, agent_decision):
+        """Restores the perception and loss callables of a decision module."""
+        if isinstance(agent_decision, decision.FunctionalDecision):
+            if isinstance(agent_decision.perception, _ProfiledCallable):
+                agent_decision.perception = agent_decision.perception.function
+            if isinstance(agent_decision.loss, _ProfiledCallable):
+                agent_decision.loss = agent_decision.loss.function
@@ -0,0 +1,416 @@
+"""Recording module.
+
+This module contains the trajectory recorder, which streams the visual state of a simulation to disk as it
+runs, and the Recording object, which reads it back without the model code. Recordings may be replayed
+through the visual module (see visual.replay), or from the command line:
+
+    python -m adjsim.recording path [--speed steps_per_sec] [--start step] [--output frames_or_video]
+
+Designed and developed by Sever Topan.
+"""
+
+# Standard.
+import os
+import sys
+import json
+import argparse
+
+# Third party.
+import numpy as np
+
+# Local.
+from . import snapshot
+from . import utility
+
+FORMAT_VERSION = 1
+META_FILE_NAME = "meta.json"
+AGENTS_FILE_NAME = "agents.jsonl"
+
+STEP_DTYPE = np.dtype([("time", np.int64), ("record_start", np.int64), ("record_count", np.int64),
+                       ("removed_start", np.int64), ("removed_count", np.int64), ("keyframe", np.bool_)])
+
+class _ChunkedArray(object):
+    """A one-dimensional array stored across fixed-size memory-mapped chunk files.
+
+    Chunks are mapped upon first access. While writing, completed chunks are flushed and unmapped, so that
+    memory use does not grow with the length of the array.
+    """
+
+    def __init__(self, directory, name, dtype, chunk_size, length=0, writable=False):
+        self.directory = directory
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+
+        self._length = length
+        self._writable = writable
+        self._chunks = {}
+
+    def __len__(self):
+        return self._length
+
+    def _chunk(self, index):
+        """Obtain the memory map of a chunk, creating its file if needed."""
+        chunk = self._chunks.get(index)
+        if chunk is None:
+            path = os.path.join(self.directory, "{}_{:06d}.dat".format(self.name, index))
+            if not self._writable:
+                mode = "r"
+            else:
+                mode = "r+" if os.path.exists(path) else "w+"
+
+            chunk = np.memmap(path, dtype=self.dtype, mode=mode, shape=(self.chunk_size,))
+            self._chunks[index] = chunk
+
+        return chunk
+
+    def append(self, values):
+        """Append values to the end of the array.
+
+        Args:
+            values (np.ndarray): The values.
+        """
+        values = np.asarray(values, dtype=self.dtype)
+
+        offset = 0
+        while offset < len(values):
+            index, position = divmod(self._length, self.chunk_size)
+            count = min(self.chunk_size - position, len(values) - offset)
+
+            self._chunk(index)[position:position + count] = values[offset:offset + count]
+            self._length += count
+            offset += count
+
+            if position + count == self.chunk_size:
+                self._chunks.pop(index).flush()
+
+    def read(self, start, stop):
+        """Read a range of the array into memory.
+
+        Args:
+            start (int): The first index.
+            stop (int): The index past the last.
+
+        Returns:
+            An np.ndarray.
+        """
+        pieces = [np.zeros((0,), dtype=self.dtype)]
+        while start < stop:
+            index, position = divmod(start, self.chunk_size)
+            count = min(self.chunk_size - position, stop - start)
+
+            pieces.append(np.array(self._chunk(index)[position:position + count]))
+            start += count
+
+        return np.concatenate(pieces)
+
+    def flush(self):
+        """Write mapped chunks to disk."""
+        for chunk in self._chunks.values():
+            chunk.flush()
+
+    def close(self):
+        """Flush and unmap all chunks."""
+        if self._writable:
+            self.flush()
+
+        self._chunks = {}
+
+
+class _RecordingEncoder(snapshot.SnapshotEncoder):
+    """A snapshot encoder that also logs the agent id of every record id it assigns."""
+
+    def __init__(self, simulation, agents_file):
+        super().__init__(simulation)
+        self._agents_file = agents_file
+
+    def _key(self, agent):
+        """Obtains the stable record id of an agent, logging newly assigned ones."""
+        is_new = not agent in self._keys
+        key = super()._key(agent)
+
+        if is_new:
+            self._agents_file.write(json.dumps([key, str(agent.id)]) + "\n")
+
+        return key
+
+
+class Recorder(object):
+    """Records the visual state of a simulation to disk.
+
+    Once attached, the recorder stores the current state and then the state after every step. Steps are
+    stored as deltas of the visual agents that changed, with a keyframe holding every visual agent each
+    keyframe_interval steps, so recording costs little per step while recordings may still be seeked quickly.
+    Records are written to chunked memory-mapped files, so memory use does not grow with the recording.
+
+    Only VisualAgents are recorded. The recorder holds open files, so it should be detached before the
+    simulation is checkpointed.
+
+    Attributes:
+        path (str): The directory of the recording.
+        keyframe_interval (int): The number of steps between keyframes.
+    """
+
+    DEFAULT_KEYFRAME_INTERVAL = 100
+    DEFAULT_CHUNK_SIZE = 1 << 16
+
+    def __init__(self, path, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL, chunk_size=DEFAULT_CHUNK_SIZE):
+        if keyframe_interval < 1 or chunk_size < 1:
+            raise ValueError("Keyframe interval and chunk size must be at least 1.")
+
+        # Recordings are never overwritten.
+        if os.path.exists(os.path.join(path, META_FILE_NAME)):
+            raise utility.RecordingException
+
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+
+        self._chunk_size = chunk_size
+        self._records = _ChunkedArray(path, "records", snapshot.RECORD_DTYPE, chunk_size, writable=True)
+        self._removed = _ChunkedArray(path, "removed", np.int64, chunk_size, writable=True)
+        self._steps = _ChunkedArray(path, "steps", STEP_DTYPE, chunk_size, writable=True)
+        self._agents_file = open(os.path.join(path, AGENTS_FILE_NAME), "w")
+        self._simulation = None
+        self._encoder = None
+        self._palette = ()
+
+        self._write_meta()
+
+    @property
+    def num_steps(self):
+        """int: The number of recorded steps."""
+        return len(self._steps)
+
+    @property
+    def attached(self):
+        """bool: Whether or not the recorder is attached to a simulation."""
+        return self._simulation is not None
+
+    def attach(self, simulation):
+        """Begin recording a simulation. The current state is recorded immediately.
+
+        A recorder may only record a single simulation.
+
+        Args:
+            simulation (Simulation): The simulation.
+        """
+        if self._encoder is not None:
+            raise ValueError("A recorder may only record a single simulation.")
+
+        self._simulation = simulation
+        self._encoder = _RecordingEncoder(simulation, self._agents_file)
+        simulation.callbacks.simulation_step_complete.register(self._on_step_complete)
+
+        self.record()
+
+    def detach(self):
+        """Stop recording, and write all recorded steps to disk."""
+        if self._simulation is None:
+            return
+
+        self._simulation.callbacks.simulation_step_complete.unregister(self._on_step_complete)
+        self._simulation = None
+        self._encoder.close()
+        self.flush()
+
+    def record(self):
+        """Record the current state of the attached simulation as a step."""
+        delta = self._encoder.delta()
+
+        keyframe = self.num_steps % self.keyframe_interval == 0
+        current = self._encoder.full() if keyframe else delta
+        records = current.records
+        self._palette = current.palette
+
+        step = np.array([(self._simulation.time, len(self._records), len(records), len(self._removed),
+                          len(delta.removed), keyframe)], dtype=STEP_DTYPE)
+        self._records.append(records)
+        self._removed.append(delta.removed)
+        self._steps.append(step)
+
+        # Keep the recording readable up to the last keyframe should the process end abruptly.
+        if keyframe:
+            self.flush()
+
+    def flush(self):
+        """Write all recorded steps to disk."""
+        self._records.flush()
+        self._removed.flush()
+        self._steps.flush()
+        self._agents_file.flush()
+        self._write_meta()
+
+    def close(self):
+        """Stop recording and close the recording's files."""
+        self.detach()
+        self.flush()
+
+        self._records.close()
+        self._removed.close()
+        self._steps.close()
+        self._agents_file.close()
+
+    def _on_step_complete(self, simulation):
+        """Callback function called upon the completion of a simulation step.
+
+        Args:
+            simulation (Simulation): The simulation.
+        """
+        self.record()
+
+    def _write_meta(self):
+        """Atomically write the recording's metadata."""
+        # Colors are stored in the form used by snapshots, so QColor objects become '#aarrggbb' strings.
+        # Any other colors that are not strings or integers are stored by their string form.
+        palette = [snapshot._color_key(color) for color in self._palette]
+        palette = [color if isinstance(color, (str, int)) else str(color) for color in palette]
+
+        meta = {
+            "format_version": FORMAT_VERSION,
+            "chunk_size": self._chunk_size,
+            "keyframe_interval": self.keyframe_interval,
+            "num_steps": len(self._steps),
+            "num_records": len(self._records),
+            "num_removed": len(self._removed),
+            "palette": palette,
+        }
+
+        path = os.path.join(self.path, META_FILE_NAME)
+        with open(path + ".tmp", "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(path + ".tmp", path)
+
+
+class Recording(object):
+    """A recording written by a Recorder. Reading a recording does not require the model code.
+
+    Steps are indexed from zero in the order they were recorded. Record ids are stable across steps;
+    agent_ids maps them to the ids of the recorded agents.
+
+    Attributes:
+        path (str): The directory of the recording.
+        times (np.ndarray): The simulation time of each step.
+        palette (tuple): The colors referred to by records.
+    """
+
+    def __init__(self, path):
+        try:
+            with open(os.path.join(path, META_FILE_NAME), "r") as meta_file:
+                meta = json.load(meta_file)
+        except (IOError, ValueError):
+            raise utility.RecordingException
+
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise utility.RecordingException
+
+        self.path = path
+        self.palette = tuple(meta["palette"])
+
+        chunk_size = meta["chunk_size"]
+        self._records = _ChunkedArray(path, "records", snapshot.RECORD_DTYPE, chunk_size, meta["num_records"])
+        self._removed = _ChunkedArray(path, "removed", np.int64, chunk_size, meta["num_removed"])
+        steps = _ChunkedArray(path, "steps", STEP_DTYPE, chunk_size, meta["num_steps"])
+        self._steps = steps.read(0, len(steps))
+        self._keyframes = np.flatnonzero(self._steps["keyframe"])
+        self._agent_ids = None
+
+        self.times = self._steps["time"]
+
+    def __len__(self):
+        return len(self._steps)
+
+    @property
+    def agent_ids(self):
+        """dict: Maps record ids to the string form of the recorded agents' ids."""
+        if self._agent_ids is None:
+            with open(os.path.join(self.path, AGENTS_FILE_NAME), "r") as agents_file:
+                self._agent_ids = dict(json.loads(line) for line in agents_file if line.strip())
+
+        return self._agent_ids
+
+    def _check_index(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError("Step {} is not in a recording of {} steps.".format(index, len(self)))
+
+    def _changes(self, start, stop):
+        """Obtain the records and removed ids of the steps in [start, stop), merged."""
+        first, last = self._steps[start], self._steps[stop - 1]
+
+        records = self._records.read(first["record_start"], last["record_start"] + last["record_count"])
+        removed = np.unique(self._removed.read(first["removed_start"], last["removed_start"] + last["removed_count"]))
+
+        # Ids are never reused, so removed agents never reappear.
+        records = snapshot._last_per_id(records)
+        return records[~np.isin(records["id"], removed)], removed
+
+    def frame(self, index):
+        """Obtain the full state at a step, reconstructed from the preceding keyframe.
+
+        Args:
+            index (int): The step.
+
+        Returns:
+            A snapshot.Snapshot.
+        """
+        self._check_index(index)
+
+        keyframe = self._keyframes[np.searchsorted(self._keyframes, index, side="right") - 1]
+        keyframe_step = self._steps[keyframe]
+        records = self._records.read(keyframe_step["record_start"],
+                                     keyframe_step["record_start"] + keyframe_step["record_count"])
+
+        if index > keyframe:
+            changes, removed = self._changes(keyframe + 1, index + 1)
+            records = snapshot._last_per_id(np.concatenate((records, changes)))
+            records = records[~np.isin(records["id"], removed)]
+
+        return snapshot.Snapshot(records, self.palette)
+
+    def delta(self, index, since=None):
+        """Obtain the changes between two steps.
+
+        Args:
+            index (int): The later step.
+            since (int): The earlier step. Defaults to the step preceding index.
+
+        Returns:
+            A snapshot.DeltaSnapshot.
+        """
+        self._check_index(index)
+        if since is None:
+            since = index - 1
+
+        if not -1 <= since < index:
+            raise IndexError("Step {} does not precede step {}.".format(since, index))
+
+        records, removed = self._changes(since + 1, index + 1)
+        return snapshot.DeltaSnapshot(records, removed, self.palette)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay an adjsim recording.")
+    parser.add_argument("path", help="The directory of the recording.")
+    parser.add_argument("--speed", type=float, default=None, help="Steps replayed per second.")
+    parser.add_argument("--start", type=int, default=0, help="The step to start from.")
+    parser.add_argument("--stop", type=int, default=None, help="The step to stop before.")
+    parser.add_argument("--batched", action="store_true", help="Draw with the batched view.")
+    parser.add_argument("--output", help="A directory or video file to export frames to instead of opening a window.")
+    parser.add_argument("--frame-size", type=int, nargs=2, default=None, metavar=("WIDTH", "HEIGHT"),
+                        help="The size of exported frames.")
+    args = parser.parse_args(argv)
+
+    # Import graphics libraries lazily so that recordings may be read without them.
+    from . import visual
+
+    recording = Recording(args.path)
+    options = {name: value for name, value in [("speed", args.speed), ("frame_size", args.frame_size)]
+               if value is not None}
+    visual.replay(recording, start=args.start, stop=args.stop, batched=args.batched, output=args.output,
+                  **options)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""Snapshot module.
+
+This module contains packed snapshots of the visual state of a simulation, used to hand frames from the
+simulation to the renderer. Snapshots hold NumPy record arrays rather than agent copies, and delta snapshots
+hold only the agents that changed since the previous frame. Frames may be accumulated into arrays by the
+FrameInterpolator, for renderers that draw the whole population at once.
+
+Designed and developed by Sever Topan.
+"""
+
+# Standard.
+import sys
+import collections
+
+# Third party.
+import numpy as np
+
+# Local.
+from . import core
+
+RECORD_DTYPE = np.dtype([("id", np.int64), ("x", np.float64), ("y", np.float64), ("size", np.float64),
+                         ("color", np.int32), ("style", np.int32)])
+
+def _color_key(color):
+    """Obtain a hashable and serializable form of a color.
+
+    QtGui.QColor objects are converted to '#aarrggbb' strings, which QtGui.QColor accepts back. Other colors,
+    such as hex strings, are returned as is.
+
+    Args:
+        color (str, QtGui.QColor): The color.
+
+    Returns:
+        The color key.
+    """
+    # QColor objects can only exist if PyQt5 has been imported, so it is never imported here.
+    qt_gui = sys.modules.get("PyQt5.QtGui")
+    if qt_gui is not None and isinstance(color, qt_gui.QColor):
+        return color.name(qt_gui.QColor.HexArgb)
+
+    return color
+
+def _empty_records():
+    """Obtain an empty record array."""
+    return np.zeros((0,), dtype=RECORD_DTYPE)
+
+def _last_per_id(records):
+    """Keep the last record of each id, preserving the order of first appearance."""
+    if len(records) == 0:
+        return records
+
+    # np.unique returns the first occurrence, so search the reversed records.
+    _, reversed_indices = np.unique(records["id"][::-1], return_index=True)
+    indices = np.sort(len(records) - 1 - reversed_indices)
+    return records[indices]
+
+
+class Snapshot(object):
+    """A packed snapshot of every visual agent in a simulation.
+
+    Attributes:
+        records (np.ndarray): A structured array with one record per agent, with id, x, y, size, color and
+            style fields. Ids are stable across frames, but are not agent ids. Colors are indices into palette.
+        palette (tuple): The colors referred to by records.
+    """
+
+    def __init__(self, records, palette):
+        self.records = records
+        self.palette = palette
+
+    def __len__(self):
+        return len(self.records)
+
+    def merge(self, delta):
+        """Apply a later snapshot.
+
+        Args:
+            delta (Snapshot, DeltaSnapshot): The later snapshot. A full snapshot supersedes this one.
+
+        Returns:
+            A Snapshot.
+        """
+        if isinstance(delta, Snapshot):
+            return delta
+
+        records = np.concatenate((self.records, delta.records))
+        records = _last_per_id(records)
+        records = records[~np.isin(records["id"], delta.removed)]
+
+        return Snapshot(records, delta.palette)
+
+
+class DeltaSnapshot(object):
+    """A packed snapshot of the visual agents that changed since the previous frame.
+
+    Attributes:
+        records (np.ndarray): One record per agent that was added, moved or changed appearance. See Snapshot.
+        removed (np.ndarray): The ids of agents that were removed.
+        palette (tuple): The colors referred to by records.
+    """
+
+    def __init__(self, records, removed, palette):
+        self.records = records
+        self.removed = removed
+        self.palette = palette
+
+    def __len__(self):
+        return len(self.records) + len(self.removed)
+
+    def merge(self, delta):
+        """Combine with a later delta snapshot, such that applying the result is equivalent to applying both.
+
+        Args:
+            delta (Snapshot, DeltaSnapshot): The later snapshot. A full snapshot supersedes this one.
+
+        Returns:
+            A DeltaSnapshot, or the later snapshot if it is a full snapshot.
+        """
+        if isinstance(delta, Snapshot):
+            return delta
+
+        records = np.concatenate((self.records, delta.records))
+        records = _last_per_id(records)
+        records = records[~np.isin(records["id"], delta.removed)]
+
+        # Ids are never reused, so removals may simply be accumulated.
+        removed = np.union1d(self.removed, delta.removed)
+
+        return DeltaSnapshot(records, removed, delta.palette)
+
+
+class SnapshotEncoder(object):
+    """Encodes the visual agents of a simulation into packed snapshots.
+
+    The encoder tracks agent additions, removals, movement and appearance changes through the simulation's
+    callbacks. It is initialized upon first use, so simulations that are never rendered do not pay for this.
+    """
+
+    def __init__(self, simulation):
+        self._simulation = simulation
+        self._initialized = False
+        self._keys = {}
+        self._next_key = 0
+        self._dirty = collections.OrderedDict()
+        self._removed = []
+        self._colors = {}
+        self._palette = ()
+
+    def full(self):
+        """Encode every visual agent, and start tracking changes from this frame.
+
+        Returns:
+            A Snapshot.
+        """
+        if not self._initialized:
+            self._initialize()
+
+        self._dirty.clear()
+        self._removed = []
+
+        return Snapshot(self._encode(self._simulation.agents.of_type(core.VisualAgent)), self._palette)
+
+    def delta(self):
+        """Encode the visual agents that changed since the previous frame.
+
+        Returns:
+            A DeltaSnapshot.
+        """
+        if not self._initialized:
+            self._initialize()
+
+        dirty = list(self._dirty)
+        removed = np.array(self._removed, dtype=np.int64)
+        self._dirty.clear()
+        self._removed = []
+
+        return DeltaSnapshot(self._encode(dirty), removed, self._palette)
+
+    def close(self):
+        """Stop tracking changes. Record ids are reassigned if the encoder is used again."""
+        if not self._initialized:
+            return
+
+        self._initialized = False
+
+        callbacks = self._simulation.callbacks
+        callbacks.agent_added.unregister(self._on_changed)
+        callbacks.agent_moved.unregister(self._on_changed)
+        callbacks.agent_appearance_changed.unregister(self._on_changed)
+        callbacks.agent_removed.unregister(self._on_removed)
+
+        self._keys = {}
+        self._dirty.clear()
+        self._removed = []
+
+    def _initialize(self):
+        """Register the callbacks used to track changes."""
+        self._initialized = True
+
+        callbacks = self._simulation.callbacks
+        callbacks.agent_added.register_batch(self._on_changed, self._on_changed_many)
+        callbacks.agent_moved.register_batch(self._on_changed, self._on_changed_many)
+        callbacks.agent_appearance_changed.register(self._on_changed)
+        callbacks.agent_removed.register_batch(self._on_removed, self._on_removed_many)
+
+    def _encode(self, agents):
+        """Pack agents into a record array."""
+        rows = [(self._key(agent), agent._pos[0], agent._pos[1], agent._size, self._color_index(agent._color),
+                 agent._style) for agent in agents]
+        if not rows:
+            return _empty_records()
+
+        return np.array(rows, dtype=RECORD_DTYPE)
+
+    def _key(self, agent):
+        """Obtains the stable record id of an agent, assigning one if needed."""
+        key = self._keys.get(agent)
+        if key is None:
+            key = self._next_key
+            self._next_key += 1
+            self._keys[agent] = key
+
+        return key
+
+    def _color_index(self, color):
+        """Obtains the palette index of a color, adding it to the palette if needed."""
+        color = _color_key(color)
+        index = self._colors.get(color)
+        if index is None:
+            index = len(self._palette)
+            self._colors[color] = index
+            self._palette = self._palette + (color,)
+
+        return index
+
+    def _on_changed(self, agent):
+        """Callback function called upon an agent being added, moving or changing appearance.
+
+        Args:
+            agent (Agent): The agent that changed.
+        """
+        # We only care if the agent is visual.
+        if issubclass(type(agent), core.VisualAgent):
+            self._dirty[agent] = None
+
+    def _on_changed_many(self, agents):
+        """Callback function called upon a batch of agents being added or moving.
+
+        Args:
+            agents (list): The agents that changed.
+        """
+        for agent in agents:
+            self._on_changed(agent)
+
+    def _on_removed(self, agent):
+        """Callback function called upon an agent being removed.
+
+        Args:
+            agent (Agent): The agent that was removed.
+        """
+        self._dirty.pop(agent, None)
+
+        key = self._keys.pop(agent, None)
+        if key is not None:
+            self._removed.append(key)
+
+    def _on_removed_many(self, agents):
+        """Callback function called upon a batch of agents being removed.
+
+        Args:
+            agents (list): The agents that were removed.
+        """
+        for agent in agents:
+            self._on_removed(agent)
+
+
+class FrameInterpolator(object):
+    """Holds the presented state of every agent as arrays, for renderers that interpolate between frames in a
+    single vectorized pass rather than animating agents individually.
+
+    Each applied frame becomes the end state of a transition that starts from the state interpolated at the
+    time it was applied. Added agents grow from a size of zero, and removed agents shrink to a size of zero
+    before being dropped upon the next frame.
+
+    Attributes:
+        ids (np.ndarray): The sorted record ids of the presented agents.
+        start (np.ndarray): An (n, 3) array of the x, y and size of each agent at the start of the transition.
+        end (np.ndarray): An (n, 3) array of the x, y and size of each agent at the end of the transition.
+        color (np.ndarray): The palette index of each agent.
+        style (np.ndarray): The style of each agent.
+        exiting (np.ndarray): Whether or not each agent is being removed.
+        palette (tuple): The colors referred to by color.
+    """
+
+    def __init__(self):
+        self.ids = np.zeros((0,), dtype=np.int64)
+        self.start = np.zeros((0, 3))
+        self.end = np.zeros((0, 3))
+        self.color = np.zeros((0,), dtype=np.int32)
+        self.style = np.zeros((0,), dtype=np.int32)
+        self.exiting = np.zeros((0,), dtype=bool)
+        self.palette = ()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def interpolate(self, alpha):
+        """Obtain the state of every agent part way through the transition.
+
+        Args:
+            alpha (float): The fraction of the transition that is complete, between 0 and 1.
+
+        Returns:
+            An (n, 3) array of the x, y and size of each agent.
+        """
+        return self.start + (self.end - self.start)*alpha
+
+    def apply(self, frame, alpha=1.):
+        """Begin a transition to a new frame.
+
+        Args:
+            frame (Snapshot, DeltaSnapshot): The frame. Agents absent from a full snapshot are removed.
+            alpha (float): The fraction of the current transition that was complete when the frame arrived.
+        """
+        # Start from the presented state, dropping agents whose exit began upon the previous frame.
+        keep = ~self.exiting
+        self.start = self.interpolate(alpha)[keep]
+        self.ids = self.ids[keep]
+        self.end = self.end[keep]
+        self.color = self.color[keep]
+        self.style = self.style[keep]
+        self.palette = frame.palette
+
+        records = frame.records
+        values = np.column_stack((records["x"], records["y"], records["size"])).astype(np.float64)
+
+        # Locate records of agents that are already presented.
+        if len(self.ids):
+            positions = np.searchsorted(self.ids, records["id"])
+            found = self.ids[np.minimum(positions, len(self.ids) - 1)] == records["id"]
+        else:
+            positions = np.zeros((len(records),), dtype=np.intp)
+            found = np.zeros((len(records),), dtype=bool)
+
+        rows = positions[found]
+        self.end[rows] = values[found]
+        self.color[rows] = records["color"][found]
+        self.style[rows] = records["style"][found]
+
+        # Mark removed agents.
+        if isinstance(frame, DeltaSnapshot):
+            exiting = np.isin(self.ids, frame.removed)
+        else:
+            exiting = ~np.isin(self.ids, records["id"])
+        self.end[exiting, 2] = 0.
+
+        # Append added agents, which grow in place.
+        added = ~found
+        added_start = values[added].copy()
+        added_start[:, 2] = 0.
+
+        ids = np.concatenate((self.ids, records["id"][added]))
+        order = np.argsort(ids, kind="stable")
+        self.ids = ids[order]
+        self.start = np.concatenate((self.start, added_start))[order]
+        self.end = np.concatenate((self.end, values[added]))[order]
+        self.color = np.concatenate((self.color, records["color"][added]))[order]
+        self.style = np.concatenate((self.style, records["style"][added]))[order]
+        self.exiting = np.concatenate((exiting, np.zeros((np.count_nonzero(added),), dtype=bool)))[order]
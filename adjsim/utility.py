@@ -90,6 +90,26 @@ class TrackerException(Exception):
     def __init__(self):
         super().__init__(TrackerException.MESSAGE)
 
+class InteractionException(Exception):
+
+    MESSAGE = """An Exception has occurred while registering an Interaction.
+
+    Simulation.interactions may only store objects that inherit from Interaction.
+    """
+
+    def __init__(self):
+        super().__init__(InteractionException.MESSAGE)
+
+class IntegratorException(Exception):
+
+    MESSAGE = """An Exception has occurred while registering an Integrator.
+
+    Simulation.integrators may only store objects that inherit from Integrator.
+    """
+
+    def __init__(self):
+        super().__init__(IntegratorException.MESSAGE)
+
 
 class InvalidAgentException(Exception):
 
@@ -178,6 +198,40 @@ class IndexInitializationException(Exception):
 
     def __init__(self):
         super().__init__(IndexInitializationException.MESSAGE)
+
+class CheckpointException(Exception):
+
+    MESSAGE = """An error has occurred while writing or reading a simulation checkpoint.
+
+    Checkpoints store callables (actions, perception, loss, end conditions, callbacks) by reference.
+    They must be defined at module level; lambdas and nested functions can not be checkpointed.
+    Checkpoints must have been written by a compatible version of adjsim.
+    """
+
+    def __init__(self):
+        super().__init__(CheckpointException.MESSAGE)
+
+class ExportException(Exception):
+
+    MESSAGE = """An error has occurred while exporting frames.
+
+    Frames are exported as a PNG sequence into a directory, or as a video file if the output path has a
+    video extension. Video export requires the ffmpeg executable to be on the PATH.
+    """
+
+    def __init__(self):
+        super().__init__(ExportException.MESSAGE)
+
+class RecordingException(Exception):
+
+    MESSAGE = """An error has occurred while writing or reading a recording.
+
+    Recordings are never overwritten, so a recorder must be given a path that does not hold a recording.
+    Recordings must have been written by a compatible version of adjsim.
+    """
+
+    def __init__(self):
+        super().__init__(RecordingException.MESSAGE)
 #-------------------------------------------------------------------------------
 # Exposed Functions
 #-------------------------------------------------------------------------------
@@ -7,9 +7,14 @@ Designed and developed by Sever Topan.
 """
 
 # Standard.
+import os
 import sys
 import time
 import random
+import shutil
+import subprocess
+import collections
+import concurrent.futures
 
 # Third party.
 from PyQt5 import QtGui, QtCore, QtWidgets
@@ -18,8 +23,46 @@ import numpy as np
 # Local.
 from . import core
 from . import analysis
+from . import snapshot
+from . import utility
 
 ANIMATION_DURATION = 200
+DEFAULT_REPLAY_SPEED = 5
+
+# The process-wide application. Qt does not support destroying and recreating it, so it is reused across steps.
+_application = None
+
+def application(offscreen=False):
+    """Obtain the process-wide QApplication, creating it if needed.
+
+    Args:
+        offscreen (bool): Whether or not a newly created application should use the offscreen platform,
+            which does not require a display.
+
+    Returns:
+        A QtWidgets.QApplication object.
+    """
+    global _application
+    if _application is None:
+        arguments = ["adjsim", "-platform", "offscreen"] if offscreen else []
+        _application = QtWidgets.QApplication.instance() or QtWidgets.QApplication(arguments)
+
+    return _application
+
+def _agent_brush(color, style):
+    """Obtain the brush used to paint a visual agent.
+
+    Agent colors and styles are stored without Qt types (see the color module), so they are
+    converted here.
+
+    Args:
+        color (str): The agent color.
+        style (int): The agent style.
+
+    Returns:
+        A QtGui.QBrush object.
+    """
+    return QtGui.QBrush(QtGui.QColor(color), style=QtCore.Qt.BrushStyle(int(style)))
 
 class AdjThread(QtCore.QThread):
     """PyQt must run on the main thread, so we use this thread to run the simulation"""
@@ -75,19 +118,26 @@ class AgentEllipseAdapter(QtCore.QObject):
 
 
 class AgentEllipse(QtWidgets.QGraphicsEllipseItem):
-    """The Ellipse that represents the visual agents."""
+    """The Ellipse that represents the visual agents.
 
-    def __init__(self, agent, scene):
+    The ellipse stores the last presented state of its agent, so that changes may be animated.
+    """
+
+    def __init__(self, record, palette):
         QtWidgets.QGraphicsEllipseItem.__init__(self, 0, 0, 0, 0)
 
         # Members.
-        self.agent = agent
+        self.agent_x = float(record["x"])
+        self.agent_y = float(record["y"])
+        self.agent_size = float(record["size"])
+        self.agent_color = palette[record["color"]]
+        self.agent_style = int(record["style"])
         self.exit_animation_complete = False
         self.adapter = AgentEllipseAdapter(self)
 
         # Init visual.
-        self.setBrush(QtGui.QBrush(agent.color, style=agent.style))
-        self.setPos(agent.x, agent.y)
+        self.setBrush(_agent_brush(self.agent_color, self.agent_style))
+        self.setPos(self.agent_x, self.agent_y)
 
     def hoverEnterEvent(self, event):
         # TODO.
@@ -117,6 +167,7 @@ class AdjGraphicsView(QtWidgets.QGraphicsView):
         # Init other member variables.
         self.visual_items = {}
         self.animations = None
+        self.animation_duration = ANIMATION_DURATION
         self.update_semaphore = update_semaphore
 
         # Show.
@@ -125,12 +176,49 @@ class AdjGraphicsView(QtWidgets.QGraphicsView):
     def timestepAnimationCallback(self):
         self.update_semaphore.release(1)
 
+    def clear_items(self):
+        """Remove all graphics items, breaking the reference cycles between ellipses and their adapters.
+
+        Called from the GUI thread before the view is discarded.
+        """
+        for ellipse in self.visual_items.values():
+            self.scene.removeItem(ellipse)
+            ellipse.adapter.target = None
+
+        self.visual_items = {}
+
+    def is_animating(self):
+        """Checks whether or not the animations of the previous update are still running.
+
+        Returns:
+            A bool.
+        """
+        return self.animations is not None and \
+            self.animations.state() == QtCore.QAbstractAnimation.Running
+
+    def _animate(self, target, name, start, end):
+        """Add a property animation to the current update."""
+        animation = QtCore.QPropertyAnimation(target, name)
+        animation.setDuration(self.animation_duration)
+        animation.setStartValue(start)
+        animation.setEndValue(end)
+        self.animations.addAnimation(animation)
+
+    def _exit(self, ellipse):
+        """Begin the exit animation of an ellipse. It is removed upon the next update."""
+        if ellipse.exit_animation_complete:
+            return
+
+        ellipse.exit_animation_complete = True
+        self._animate(ellipse.adapter, b'size', ellipse.agent_size, 0.)
+
     @QtCore.pyqtSlot(object)
-    def update(self, agent_set):
-        """The Visual update method, called after each timestep.
+    def update(self, frame):
+        """The Visual update method, called after each rendered timestep.
 
         Args:
-            agent_set (list): The list of VisualAgent objects that will be rendered.
+            frame (snapshot.Snapshot, snapshot.DeltaSnapshot): The frame to render. Agents absent from a full
+                snapshot are removed, while a delta snapshot only lists the agents that changed.
         """
         # begin update function
         del self.animations
@@ -142,65 +230,647 @@ class AdjGraphicsView(QtWidgets.QGraphicsView):
             if ellipse.exit_animation_complete:
                 self.scene.removeItem(ellipse)
 
+                # Break the reference cycle between the ellipse and its adapter, so that both are freed here on
+                # the GUI thread rather than by the garbage collector on the simulation thread.
+                ellipse.adapter.target = None
+
         self.visual_items = {key: val for key, val in self.visual_items.items()
                              if not val.exit_animation_complete}
 
         # update agent ellipses
-        for agent in agent_set:
-            if not self.visual_items.get(agent.id):
+        palette = frame.palette
+        for record in frame.records:
+            key = int(record["id"])
+            visual_item = self.visual_items.get(key)
+
+            if visual_item is None:
                 # Create graphics item with entrance animation.
-                newEllipse = AgentEllipse(agent, self.scene)
-                self.visual_items[agent.id] = newEllipse
-
-                animation = QtCore.QPropertyAnimation(self.visual_items[agent.id].adapter, b'size')
-                animation.setDuration(ANIMATION_DURATION)
-                animation.setStartValue(0)
-                animation.setEndValue(agent.size)
-                self.animations.addAnimation(animation)
-
-                self.scene.addItem(newEllipse)
-            else:
-                # Move animation.
-                visual_item = self.visual_items[agent.id]
-                if not np.array_equal(agent.pos, visual_item.agent.pos):
-                    animation = QtCore.QPropertyAnimation(visual_item.adapter, b'x')
-                    animation.setDuration(ANIMATION_DURATION)
-                    animation.setStartValue(float(visual_item.agent.x))
-                    animation.setEndValue(float(agent.x))
-                    self.animations.addAnimation(animation)
-
-                    animation = QtCore.QPropertyAnimation(visual_item.adapter, b'y')
-                    animation.setDuration(ANIMATION_DURATION)
-                    animation.setStartValue(float(visual_item.agent.y))
-                    animation.setEndValue(float(agent.y))
-                    self.animations.addAnimation(animation)
-
-                    # Store.
-                    visual_item.agent.pos = agent.pos
+                visual_item = AgentEllipse(record, palette)
+                self.visual_items[key] = visual_item
+                self._animate(visual_item.adapter, b'size', 0., visual_item.agent_size)
+                self.scene.addItem(visual_item)
+                continue
+
+            # Move animation.
+            if record["x"] != visual_item.agent_x or record["y"] != visual_item.agent_y:
+                self._animate(visual_item.adapter, b'x', visual_item.agent_x, float(record["x"]))
+                self._animate(visual_item.adapter, b'y', visual_item.agent_y, float(record["y"]))
+
+                # Store.
+                visual_item.agent_x = float(record["x"])
+                visual_item.agent_y = float(record["y"])
+
+            # Resize animation.
+            if record["size"] != visual_item.agent_size:
+                self._animate(visual_item.adapter, b'size', visual_item.agent_size, float(record["size"]))
+                visual_item.agent_size = float(record["size"])
 
             # Update color.
-            visual_item = self.visual_items[agent.id]
-            if agent.color != visual_item.agent.color or \
-                    agent.style != visual_item.agent.style:
+            color = palette[record["color"]]
+            if color != visual_item.agent_color or record["style"] != visual_item.agent_style:
                 # Paint.
-                visual_item.setBrush(QtGui.QBrush(agent.color, style=agent.style))
+                visual_item.setBrush(_agent_brush(color, record["style"]))
 
                 # Store.
-                visual_item.agent.color = agent.color
-                visual_item.agent.style = agent.style
+                visual_item.agent_color = color
+                visual_item.agent_style = int(record["style"])
+
+        # remove graphics items whose agents are no longer present
+        if isinstance(frame, snapshot.DeltaSnapshot):
+            for key in frame.removed:
+                ellipse = self.visual_items.get(int(key))
+                if ellipse is not None:
+                    self._exit(ellipse)
+        else:
+            present = set(frame.records["id"].tolist())
+            for key, ellipse in self.visual_items.items():
+                if key not in present:
+                    self._exit(ellipse)
 
+        self.animations.start()
 
-        # remove graphics items whose agents are no longer in the agent_set
-        agent_dict = {agent.id: agent for agent in agent_set}
-        for key, val in self.visual_items.items():
-            if not agent_dict.get(key):
-                # destroy object with exit animation
-                val.exit_animation_complete = True
 
-                animation = QtCore.QPropertyAnimation(val.adapter, b'size')
-                animation.setDuration(ANIMATION_DURATION)
-                animation.setStartValue(val.agent.size)
-                animation.setEndValue(0)
-                self.animations.addAnimation(animation)
+class BatchedView(QtWidgets.QWidget):
+    """A view that draws the whole population in a single paint pass, for large populations.
 
-        self.animations.start()
+    Rather than keeping a graphics item and animations per agent, the view accumulates frames into a
+    FrameInterpolator and interpolates every agent at once on each repaint. Agents outside the viewport are
+    culled, and agents smaller than lod_threshold pixels are drawn as points. Points, and ellipses beyond
+    ellipse_budget, are stamped into a single image from cached sprites rather than painted one by one.
+    The view may be zoomed with the mouse wheel and panned by dragging.
+
+    The view has the same interface as AdjGraphicsView, so either may be driven by a VisualSimulation.
+
+    Attributes:
+        lod_threshold (float): The on-screen size in pixels below which agents are drawn as points.
+        ellipse_budget (int): The number of visible ellipses up to which ellipses are painted individually.
+        zoom (float): The number of pixels per world unit.
+        center (np.ndarray): The world position at the center of the viewport.
+    """
+
+    LOD_THRESHOLD = 4
+    ELLIPSE_BUDGET = 2000
+    STAMP_CHUNK = 1 << 22
+    REPAINT_INTERVAL = 16
+    ZOOM_FACTOR = 1.25
+
+    def __init__(self, screen_geometry, update_semaphore):
+        QtWidgets.QWidget.__init__(self)
+
+        # Init window.
+        self.windowHeight = screen_geometry.height() - 100
+        self.windowWidth = screen_geometry.width() - 100
+        self.resize(self.windowWidth, self.windowHeight)
+
+        palette = self.palette()
+        palette.setColor(QtGui.QPalette.Window, QtCore.Qt.white)
+        self.setPalette(palette)
+        self.setAutoFillBackground(True)
+
+        # Init other member variables.
+        self.state = snapshot.FrameInterpolator()
+        self.animation_duration = ANIMATION_DURATION
+        self.update_semaphore = update_semaphore
+        self.lod_threshold = BatchedView.LOD_THRESHOLD
+        self.ellipse_budget = BatchedView.ELLIPSE_BUDGET
+        self.zoom = 1.
+        self.center = np.zeros((2,))
+
+        self._transition_start = None
+        self._drag_origin = None
+        self._sprites = {}
+        self._sprites_palette = ()
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self._tick)
+
+        # Show.
+        self.show()
+
+    def timestepAnimationCallback(self):
+        self.update_semaphore.release(1)
+
+    def clear_items(self):
+        """Discard all presented agents.
+
+        Called from the GUI thread before the view is discarded.
+        """
+        self._timer.stop()
+        self._transition_start = None
+        self.state = snapshot.FrameInterpolator()
+
+    def is_animating(self):
+        """Checks whether or not the transition of the previous update is still running.
+
+        Returns:
+            A bool.
+        """
+        return self._transition_start is not None
+
+    def _alpha(self):
+        """Obtain the fraction of the current transition that is complete."""
+        if self._transition_start is None or self.animation_duration <= 0:
+            return 1.
+
+        elapsed = 1000.*(time.perf_counter() - self._transition_start)
+        return min(elapsed/self.animation_duration, 1.)
+
+    def _tick(self):
+        """Repaint the transition, completing it once its duration has elapsed."""
+        if self._alpha() >= 1.:
+            self._timer.stop()
+            self._transition_start = None
+            self.timestepAnimationCallback()
+
+        QtWidgets.QWidget.update(self)
+
+    @QtCore.pyqtSlot(object)
+    def update(self, frame):
+        """The Visual update method, called after each rendered timestep.
+
+        Args:
+            frame (snapshot.Snapshot, snapshot.DeltaSnapshot): The frame to render.
+        """
+        self.state.apply(frame, self._alpha())
+
+        self._transition_start = time.perf_counter()
+        self._timer.start(BatchedView.REPAINT_INTERVAL)
+        self._tick()
+
+    def world_to_screen(self, positions):
+        """Map world positions to widget pixel coordinates.
+
+        Args:
+            positions (np.ndarray): An (n, 2) array of world positions.
+
+        Returns:
+            An (n, 2) array of pixel coordinates.
+        """
+        return (positions - self.center)*self.zoom + np.array([self.width(), self.height()])/2.
+
+    def paintEvent(self, event):
+        state = self.state
+        if not len(state):
+            return
+
+        # Interpolate and cull.
+        current = state.interpolate(self._alpha())
+        screen = self.world_to_screen(current[:, :2])
+        sizes = current[:, 2]*self.zoom
+
+        visible = (screen[:, 0] + sizes >= 0) & (screen[:, 0] < self.width()) & \
+                  (screen[:, 1] + sizes >= 0) & (screen[:, 1] < self.height()) & (sizes > 0)
+        points = visible & (sizes < self.lod_threshold)
+        ellipses = visible & ~points
+
+        # Few ellipses are painted individually for quality. Many are stamped with the points.
+        painted = ellipses if np.count_nonzero(ellipses) <= self.ellipse_budget else np.zeros_like(ellipses)
+        stamped = visible & ~painted
+
+        painter = QtGui.QPainter(self)
+        try:
+            if np.any(stamped):
+                painter.drawImage(0, 0, self._rasterize(screen[stamped], sizes[stamped], state.color[stamped],
+                                                        state.style[stamped], points[stamped]))
+
+            if np.any(painted):
+                painter.setRenderHint(QtGui.QPainter.Antialiasing)
+                painter.setPen(QtCore.Qt.NoPen)
+                self._draw_ellipses(painter, screen[painted], sizes[painted], state.color[painted],
+                                    state.style[painted])
+        finally:
+            painter.end()
+
+    def _sprite(self, size, color, style, square):
+        """Obtain the pixels of an agent of a given on-screen size, caching them per palette.
+
+        Returns:
+            A (rows, columns, values) tuple of the opaque pixels of the sprite.
+        """
+        key = (size, color, style, square)
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            return sprite
+
+        image = QtGui.QImage(size, size, QtGui.QImage.Format_ARGB32)
+        image.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(image)
+        painter.setPen(QtCore.Qt.NoPen)
+        if square:
+            painter.fillRect(0, 0, size, size, QtGui.QColor(self.state.palette[color]))
+        else:
+            painter.setBrush(_agent_brush(self.state.palette[color], style))
+            painter.drawEllipse(0, 0, size, size)
+        painter.end()
+
+        bits = image.constBits()
+        bits.setsize(image.byteCount())
+        pixels = np.frombuffer(bits, dtype=np.uint32).reshape(size, image.bytesPerLine()//4)[:, :size]
+
+        rows, columns = np.nonzero(pixels >> 24)
+        sprite = (rows, columns, pixels[rows, columns].copy())
+        self._sprites[key] = sprite
+        return sprite
+
+    def _rasterize(self, screen, sizes, colors, styles, square):
+        """Stamp agents into an image, one vectorized pass per distinct sprite."""
+        width, height = self.width(), self.height()
+        pixels = np.zeros((height, width), dtype=np.uint32)
+
+        # Sprites depend on the palette, which only grows, so the cache is reset when it changes.
+        if self._sprites_palette != self.state.palette:
+            self._sprites = {}
+            self._sprites_palette = self.state.palette
+
+        corners = np.floor(screen).astype(np.intp)
+        extents = np.maximum(np.rint(sizes), 1).astype(np.intp)
+        # Group by sprite, packing the sprite parameters into a single key.
+        keys = (extents << 33) | (square.astype(np.intp) << 32) | (colors.astype(np.intp) << 8) | styles
+        unique_keys, groups = np.unique(keys, return_inverse=True)
+
+        for group, key in enumerate(unique_keys.tolist()):
+            size = key >> 33
+            rows, columns, values = self._sprite(size, (key >> 8) & 0xffffff, key & 0xff, bool((key >> 32) & 1))
+            if not len(values):
+                continue
+
+            members = np.flatnonzero(groups == group)
+            targets = corners[members]
+            contained = (targets[:, 0] >= 0) & (targets[:, 0] + size <= width) & \
+                        (targets[:, 1] >= 0) & (targets[:, 1] + size <= height)
+
+            # Sprites within the viewport are stamped through flat indices, in chunks to bound memory use.
+            flat_pixels = pixels.reshape(-1)
+            flat_offsets = rows*width + columns
+            bases = targets[contained, 1]*width + targets[contained, 0]
+            chunk = max(1, BatchedView.STAMP_CHUNK//len(values))
+            for begin in range(0, len(bases), chunk):
+                flat_pixels[bases[begin:begin + chunk, None] + flat_offsets] = values
+
+            # Sprites crossing the viewport edge are clipped per pixel.
+            for x, y in targets[~contained].tolist():
+                inside = (x + columns >= 0) & (x + columns < width) & (y + rows >= 0) & (y + rows < height)
+                pixels[y + rows[inside], x + columns[inside]] = values[inside]
+
+        # The image does not own the buffer, so it is copied before the buffer is released.
+        return QtGui.QImage(pixels.data, width, height, 4*width, QtGui.QImage.Format_ARGB32).copy()
+
+    def _draw_ellipses(self, painter, screen, sizes, colors, styles):
+        """Paint agents as ellipses, setting the brush once per color and style."""
+        keys = (colors.astype(np.intp) << 8) | styles
+        unique_keys, groups = np.unique(keys, return_inverse=True)
+
+        for group, key in enumerate(unique_keys.tolist()):
+            painter.setBrush(_agent_brush(self.state.palette[key >> 8], key & 0xff))
+
+            members = np.flatnonzero(groups == group)
+            for x, y, size in zip(screen[members, 0].tolist(), screen[members, 1].tolist(),
+                                  sizes[members].tolist()):
+                painter.drawEllipse(QtCore.QRectF(x, y, size, size))
+
+    def wheelEvent(self, event):
+        # Zoom about the cursor.
+        anchor = np.array([event.pos().x(), event.pos().y()], dtype=np.float64)
+        world = (anchor - np.array([self.width(), self.height()])/2.)/self.zoom + self.center
+
+        self.zoom *= BatchedView.ZOOM_FACTOR**(event.angleDelta().y()/120.)
+        self.center = world - (anchor - np.array([self.width(), self.height()])/2.)/self.zoom
+        QtWidgets.QWidget.update(self)
+
+    def mousePressEvent(self, event):
+        self._drag_origin = (event.pos().x(), event.pos().y())
+
+    def mouseMoveEvent(self, event):
+        if self._drag_origin is None:
+            return
+
+        x, y = event.pos().x(), event.pos().y()
+        self.center = self.center - np.array([x - self._drag_origin[0], y - self._drag_origin[1]])/self.zoom
+        self._drag_origin = (x, y)
+        QtWidgets.QWidget.update(self)
+
+    def mouseReleaseEvent(self, event):
+        self._drag_origin = None
+
+
+class FramePresenter(QtCore.QObject):
+    """Presents the frames published by a decoupled VisualSimulation at a target frame rate.
+
+    Runs on the GUI thread. On every tick, the latest published frame is drawn unless the previous frame
+    is still animating, in which case it is left pending and may be replaced by a newer one. Animations are
+    shortened to fit within a single frame.
+    """
+
+    def __init__(self, view, simulation, frame_rate):
+        super(FramePresenter, self).__init__()
+
+        self.view = view
+        self.simulation = simulation
+
+        interval = 1000./frame_rate
+        self.view.animation_duration = int(min(ANIMATION_DURATION, interval))
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.present)
+        self.timer.start(max(int(interval), 1))
+
+    def present(self):
+        """Draw the latest published frame, if the view is ready for it."""
+        if self.view.is_animating():
+            return
+
+        frame = self.simulation._take_frame()
+        if frame is not None:
+            self.view.update(frame)
+
+    def stop(self):
+        """Stop presenting frames."""
+        self.timer.stop()
+
+
+class FrameExporter(object):
+    """Writes rendered frames to a PNG sequence or a video file.
+
+    Frames are encoded off the calling thread, so that rendering and simulation may continue meanwhile.
+    PNG frames are encoded by a pool of worker threads. Video frames are piped in order to an ffmpeg process,
+    which encodes them on its own threads.
+
+    Attributes:
+        path (str): The directory of the PNG sequence, or the path of the video file if it has one of
+            VIDEO_EXTENSIONS.
+        frame_rate (float): The frame rate of the video.
+        frame_count (int): The number of frames submitted.
+    """
+
+    VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".webm")
+    FRAME_FILE_FORMAT = "frame_{:06d}.png"
+
+    def __init__(self, path, frame_rate, workers=None):
+        self.path = path
+        self.frame_rate = frame_rate
+        self.frame_count = 0
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        self._is_video = os.path.splitext(path)[1].lower() in FrameExporter.VIDEO_EXTENSIONS
+        self._encoder = None
+        self._pending = collections.deque()
+        self._max_pending = 2*workers
+
+        if self._is_video:
+            self._ffmpeg = shutil.which("ffmpeg")
+            if self._ffmpeg is None:
+                raise utility.ExportException
+
+            # Video frames must be written in order.
+            workers = 1
+        else:
+            os.makedirs(path, exist_ok=True)
+
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, image):
+        """Queue a frame for encoding. Blocks if too many frames are already queued.
+
+        Args:
+            image (QtGui.QImage): The frame.
+        """
+        if self._is_video and self._encoder is None:
+            self._encoder = self._open_encoder(image.width(), image.height())
+
+        while len(self._pending) >= self._max_pending:
+            self._pending.popleft().result()
+
+        self._pending.append(self._pool.submit(self._write, image, self.frame_count))
+        self.frame_count += 1
+
+    def close(self):
+        """Wait for all queued frames to be encoded, and finalize the output."""
+        try:
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self._pool.shutdown()
+
+            if self._encoder is not None:
+                self._encoder.stdin.close()
+                if self._encoder.wait() != 0:
+                    raise utility.ExportException
+
+    def _open_encoder(self, width, height):
+        """Start an ffmpeg process that encodes raw RGBA frames of a given size."""
+        # Common video codecs require even dimensions.
+        command = [self._ffmpeg, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "rgba", "-s", "{}x{}".format(width, height),
+                   "-r", str(self.frame_rate), "-i", "-",
+                   "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", self.path]
+
+        return subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def _write(self, image, index):
+        """Encode a single frame. Called on a worker thread."""
+        if self._is_video:
+            image = image.convertToFormat(QtGui.QImage.Format_RGBA8888)
+            bits = image.constBits()
+            bits.setsize(image.byteCount())
+            self._encoder.stdin.write(bytes(bits))
+        elif not image.save(os.path.join(self.path, FrameExporter.FRAME_FILE_FORMAT.format(index)), "PNG"):
+            raise utility.ExportException
+
+
+def offscreen_view(batched, frame_size):
+    """Create a view that renders offscreen, for exporting frames.
+
+    The view is laid out as if shown, but no window is mapped. Transitions complete immediately, so that
+    grabbed frames show the end state of each update.
+
+    Args:
+        batched (bool): Whether or not to create a BatchedView rather than an AdjGraphicsView.
+        frame_size (tuple): The width and height of the view, in pixels.
+
+    Returns:
+        The view.
+    """
+    app = application(offscreen=True)
+    view_type = BatchedView if batched else AdjGraphicsView
+    view = view_type(app.desktop().screenGeometry(), QtCore.QSemaphore(0))
+
+    view.hide()
+    view.setAttribute(QtCore.Qt.WA_DontShowOnScreen)
+    view.show()
+    view.resize(*frame_size)
+    view.animation_duration = 0
+
+    # Frames are centered on the origin, without scroll bars.
+    if not batched:
+        view.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        view.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        view.centerOn(0, 0)
+
+    return view
+
+
+class ReplayPlayer(QtCore.QObject):
+    """Plays a recording through a view, on the GUI thread.
+
+    The view accepts keyboard controls: space pauses and resumes, left and right seek by one step (ten with
+    shift), home and end seek to the first and last steps, and up and down double and halve the speed.
+    Playback pauses upon reaching the last step.
+
+    Attributes:
+        view (AdjGraphicsView, BatchedView): The view.
+        recording (recording.Recording): The recording.
+        speed (float): The number of steps played per second.
+        stop (int): The step to stop before.
+        index (int): The step currently shown.
+        paused (bool): Whether or not playback is paused.
+    """
+
+    def __init__(self, view, recording, speed, start=0, stop=None,
+                 frame_rate=core.VisualSimulation.DEFAULT_FRAME_RATE):
+        super(ReplayPlayer, self).__init__()
+
+        self.view = view
+        self.recording = recording
+        self.stop = len(recording) if stop is None else min(stop, len(recording))
+        self.index = None
+        self.paused = False
+
+        self._interval = 1000./frame_rate
+        self._progress = 0.
+        self.set_speed(speed)
+        self.seek(start)
+
+        self.view.installEventFilter(self)
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.advance)
+        self.timer.start(max(int(self._interval), 1))
+
+    def set_speed(self, speed):
+        """Set the playback speed, shortening animations to fit within a step.
+
+        Args:
+            speed (float): The number of steps played per second.
+        """
+        self.speed = speed
+        self.view.animation_duration = int(min(ANIMATION_DURATION, 1000./speed))
+
+    def seek(self, index):
+        """Show a given step.
+
+        Args:
+            index (int): The step. Clamped to the played range.
+        """
+        index = max(0, min(index, self.stop - 1))
+
+        self.view.update(self.recording.frame(index))
+        self.index = index
+        self._progress = 0.
+
+    def advance(self):
+        """Show the step due at the current speed, if playback is not paused."""
+        if self.paused:
+            return
+
+        self._progress += self.speed*self._interval/1000.
+        steps = int(self._progress)
+        if not steps:
+            return
+
+        self._progress -= steps
+        target = min(self.index + steps, self.stop - 1)
+        if target == self.index:
+            self.paused = True
+            return
+
+        self.view.update(self.recording.delta(target, since=self.index))
+        self.index = target
+
+    def close(self):
+        """Stop playback."""
+        self.timer.stop()
+        self.view.removeEventFilter(self)
+
+    def eventFilter(self, source, event):
+        if event.type() != QtCore.QEvent.KeyPress:
+            return False
+
+        key = event.key()
+        stride = 10 if event.modifiers() & QtCore.Qt.ShiftModifier else 1
+
+        if key == QtCore.Qt.Key_Space:
+            self.paused = not self.paused
+        elif key == QtCore.Qt.Key_Left:
+            self.seek(self.index - stride)
+        elif key == QtCore.Qt.Key_Right:
+            self.seek(self.index + stride)
+        elif key == QtCore.Qt.Key_Home:
+            self.seek(0)
+        elif key == QtCore.Qt.Key_End:
+            self.seek(self.stop - 1)
+        elif key == QtCore.Qt.Key_Up:
+            self.set_speed(2*self.speed)
+        elif key == QtCore.Qt.Key_Down:
+            self.set_speed(self.speed/2)
+        else:
+            return False
+
+        return True
+
+
+def replay(recording, speed=DEFAULT_REPLAY_SPEED, start=0, stop=None, batched=False, output=None,
+           frame_size=core.VisualSimulation.DEFAULT_FRAME_SIZE,
+           frame_rate=core.VisualSimulation.DEFAULT_FRAME_RATE):
+    """Replay a recording in a window until it is closed, or export it offscreen.
+
+    Exports are rendered by the same views as the window; only the output target differs. Each exported
+    frame covers speed/frame_rate steps, so exported videos play at the given speed.
+
+    Args:
+        recording (recording.Recording): The recording.
+        speed (float): The number of steps played per second.
+        start (int): The step to start from.
+        stop (int): The step to stop before. Defaults to the end of the recording.
+        batched (bool): Whether or not to draw with the batched view.
+        output (str): The directory or video file to export frames to instead of opening a window.
+        frame_size (tuple): The width and height of exported frames, in pixels.
+        frame_rate (float): The number of frames presented or exported per second.
+    """
+    if speed <= 0 or frame_rate <= 0:
+        raise ValueError("Speed and frame rate must be positive.")
+
+    stop = len(recording) if stop is None else min(stop, len(recording))
+    if not 0 <= start < stop:
+        raise ValueError("The replayed range of steps is empty.")
+
+    if output is None:
+        app = application()
+        view_type = BatchedView if batched else AdjGraphicsView
+        view = view_type(app.desktop().screenGeometry(), QtCore.QSemaphore(0))
+        player = ReplayPlayer(view, recording, speed, start, stop, frame_rate)
+
+        app.exec_()
+
+        player.close()
+        view.clear_items()
+        view.close()
+        return
+
+    view = offscreen_view(batched, frame_size)
+    exporter = FrameExporter(output, frame_rate)
+    try:
+        previous = None
+        for index in np.arange(start, stop, speed/frame_rate).astype(np.int64).tolist():
+            if previous is None:
+                view.update(recording.frame(index))
+                image = view.grab().toImage()
+            elif index != previous:
+                view.update(recording.delta(index, since=previous))
+                image = view.grab().toImage()
+
+            exporter.submit(image)
+            previous = index
+    finally:
+        exporter.close()
+        view.clear_items()
+        view.close()
@@ -0,0 +1,277 @@
+"""Benchmark runner.
+
+Measures the throughput, peak memory and per-phase timings of the benchmark workloads, optionally saving
+the results as JSON and comparing them against a stored baseline.
+
+Usage:
+    python -m benchmark.run [workload ...] [--quick] [--output results.json] [--baseline baseline.json]
+
+Designed and developed by Sever Topan.
+"""
+
+# Standard.
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import tracemalloc
+
+# Third party.
+import numpy as np
+
+# Local.
+from . import workloads
+
+FORMAT_VERSION = 1
+DEFAULT_REPEATS = 3
+DEFAULT_TOLERANCE = 0.1
+
+@contextlib.contextmanager
+def _isolated():
+    """Silences standard output and runs in a scratch directory, since some models write files upon completion."""
+    cwd = os.getcwd()
+    scratch = tempfile.mkdtemp()
+
+    try:
+        os.chdir(scratch)
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                yield
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def _build(workload, num_agents, seed):
+    """Seed the global random number generators and build a workload simulation."""
+    random.seed(seed)
+    np.random.seed(seed)
+
+    return workload.build(num_agents)
+
+def _time_run(workload, num_agents, num_timesteps, seed):
+    """Simulate a workload, timing the step loop.
+
+    Returns:
+        A (duration, steps, agent_steps) tuple.
+    """
+    simulation = _build(workload, num_agents, seed)
+
+    def count_agents(simulation):
+        count_agents.agent_steps += len(simulation.agents)
+    count_agents.agent_steps = 0
+    simulation.callbacks.simulation_step_started.register(count_agents)
+
+    simulation.start()
+    start = time.perf_counter()
+    simulation.step(num_timesteps)
+    duration = time.perf_counter() - start
+    simulation.end()
+
+    return duration, simulation.time, count_agents.agent_steps
+
+def _profile_run(workload, num_agents, num_timesteps, seed):
+    """Simulate a workload with the profiler and memory tracing enabled.
+
+    Returns:
+        A (profiler, peak_memory) tuple. Peak memory includes the construction of the simulation.
+    """
+    tracemalloc.start()
+    try:
+        simulation = _build(workload, num_agents, seed)
+        simulation.profiler.enable()
+        simulation.simulate(num_timesteps)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return simulation.profiler, peak_memory
+
+def result_key(workload_name, num_agents):
+    """Obtain the key under which a result is stored.
+
+    Args:
+        workload_name (str): The workload name.
+        num_agents (int): The agent count, or None.
+
+    Returns:
+        A string.
+    """
+    return workload_name if num_agents is None else "{}[{}]".format(workload_name, num_agents)
+
+def measure(workload, num_agents=None, num_timesteps=None, repeats=DEFAULT_REPEATS, seed=0):
+    """Benchmark a workload.
+
+    Throughput is taken from the fastest of several unprofiled runs. Peak memory and per-phase timings are
+    taken from an additional run with the profiler and memory tracing enabled.
+
+    Args:
+        workload (workloads.Workload): The workload.
+        num_agents (int): The agent count. Ignored by model workloads.
+        num_timesteps (int): The number of timesteps to simulate. Defaults to the workload's.
+        repeats (int): The number of timed runs.
+        seed (int): The seed for the global random number generators.
+
+    Returns:
+        A dictionary of results.
+    """
+    if num_timesteps is None:
+        num_timesteps = workload.num_timesteps
+
+    with _isolated():
+        runs = [_time_run(workload, num_agents, num_timesteps, seed) for _ in range(repeats)]
+        profiler, peak_memory = _profile_run(workload, num_agents, num_timesteps, seed)
+
+    duration, steps, agent_steps = min(runs)
+    profile = profiler.as_dict()
+    profiled_duration = sum(step["duration"] for step in profile.pop("steps"))
+
+    return {
+        "workload": workload.name,
+        "agents": num_agents,
+        "steps": steps,
+        "duration": duration,
+        "steps_per_sec": steps/duration if duration else 0.,
+        "agent_steps_per_sec": agent_steps/duration if duration else 0.,
+        "peak_memory": peak_memory,
+        "profiled_duration": profiled_duration,
+        "phases": {category: sum(timing["total"] for timing in timings.values())
+                   for category, timings in profile.items()},
+        "profile": profile,
+    }
+
+def run(names=None, quick=False, repeats=DEFAULT_REPEATS):
+    """Benchmark a set of workloads.
+
+    Args:
+        names (list): The names of the workloads to benchmark. Defaults to all workloads.
+        quick (bool): If True, synthetic workloads are only benchmarked at their smallest agent count.
+        repeats (int): The number of timed runs per workload.
+
+    Returns:
+        A dictionary holding machine information and a results dictionary keyed by result_key.
+    """
+    if names is None:
+        names = list(workloads.WORKLOADS)
+
+    results = {}
+    for name in names:
+        workload = workloads.WORKLOADS[name]
+        agent_counts = workload.agent_counts[:1] if quick else workload.agent_counts
+
+        for num_agents in agent_counts:
+            key = result_key(name, num_agents)
+            sys.stdout.write("{}...".format(key))
+            sys.stdout.flush()
+
+            results[key] = measure(workload, num_agents, repeats=repeats)
+
+            sys.stdout.write(" {:.1f} steps/s\n".format(results[key]["steps_per_sec"]))
+
+    return {
+        "format_version": FORMAT_VERSION,
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "results": results,
+    }
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare results against a baseline.
+
+    Args:
+        results (dict): Results, as returned by run.
+        baseline (dict): Baseline results, as returned by run.
+        tolerance (float): The relative throughput loss beyond which a result is considered a regression.
+
+    Returns:
+        A dictionary mapping result keys present in both to their steps_per_sec ratio and regression status.
+    """
+    comparison = {}
+    for key, result in results["results"].items():
+        reference = baseline["results"].get(key)
+        if reference is None or not reference["steps_per_sec"]:
+            continue
+
+        ratio = result["steps_per_sec"]/reference["steps_per_sec"]
+        comparison[key] = {"ratio": ratio, "regression": ratio < 1 - tolerance}
+
+    return comparison
+
+def report(results, comparison=None):
+    """Obtain a human-readable report of benchmark results.
+
+    Args:
+        results (dict): Results, as returned by run.
+        comparison (dict): The comparison against a baseline, as returned by compare.
+
+    Returns:
+        A string.
+    """
+    header = "{:<28} {:>12} {:>16} {:>12} {:>10} {:>10} {:>10}".format(
+        "workload", "steps/s", "agent-steps/s", "peak MiB", "decision", "callback", "baseline")
+    lines = [header, "-"*len(header)]
+
+    for key, result in results["results"].items():
+        phases = result["phases"]
+        total = result["profiled_duration"]
+
+        # Phase shares are relative to the profiled step time. Decision time includes action time.
+        shares = ["{:>9.0%}".format(phases[category]/total if total else 0.) for category in ("decision", "callback")]
+
+        baseline = ""
+        if comparison is not None and key in comparison:
+            baseline = "{:.2f}x{}".format(comparison[key]["ratio"], " !" if comparison[key]["regression"] else "")
+
+        lines.append("{:<28} {:>12.1f} {:>16.1f} {:>12.2f} {} {} {:>10}".format(
+            key, result["steps_per_sec"], result["agent_steps_per_sec"], result["peak_memory"]/2**20,
+            shares[0], shares[1], baseline))
+
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the adjsim engine.")
+    parser.add_argument("workloads", nargs="*",
+                        help="Workloads to benchmark. Defaults to all of: {}.".format(", ".join(workloads.WORKLOADS)))
+    parser.add_argument("--quick", action="store_true", help="Only benchmark the smallest synthetic workloads.")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Timed runs per workload.")
+    parser.add_argument("--output", help="Path of the JSON file to save results to.")
+    parser.add_argument("--baseline", help="Path of a JSON results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative throughput loss beyond which a result is reported as a regression.")
+    args = parser.parse_args(argv)
+
+    for name in args.workloads:
+        if not name in workloads.WORKLOADS:
+            parser.error("unknown workload '{}'".format(name))
+
+    results = run(args.workloads or None, quick=args.quick, repeats=args.repeats)
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+    comparison = None
+    if args.baseline is not None:
+        with open(args.baseline, "r") as baseline_file:
+            comparison = compare(results, json.load(baseline_file), args.tolerance)
+
+    print()
+    print(report(results, comparison))
+
+    # Signal regressions through the exit status.
+    if comparison is not None and any(entry["regression"] for entry in comparison.values()):
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import pytest
+
+def test_measure():
+    from benchmark import run, workloads
+
+    result = run.measure(workloads.WORKLOADS["random_walk"], 10, num_timesteps=3, repeats=1)
+
+    assert result["steps"] == 3
+    assert result["agent_steps_per_sec"] == pytest.approx(10*result["steps_per_sec"])
+    assert result["peak_memory"] > 0
+    assert result["profile"]["decision"]["RandomSingleCastDecision"]["calls"] == 30
+    assert result["phases"]["callback"] > 0
+
+def test_models():
+    from benchmark import run, workloads
+
+    for name in ["tag", "orbital", "comparative_advantage"]:
+        result = run.measure(workloads.WORKLOADS[name], num_timesteps=2, repeats=1)
+        assert result["steps"] == 2
+
+def test_compare(tmpdir):
+    import json
+    from benchmark import run
+
+    baseline_path = str(tmpdir.join("baseline.json"))
+    assert run.main(["tag", "--repeats", "1", "--output", baseline_path]) == 0
+
+    with open(baseline_path, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+
+    results = json.loads(json.dumps(baseline))
+    results["results"]["tag"]["steps_per_sec"] *= 0.5
+
+    comparison = run.compare(results, baseline)
+    assert comparison["tag"]["regression"]
+    assert comparison["tag"]["ratio"] == pytest.approx(0.5)
+
+    assert not run.compare(baseline, baseline)["tag"]["regression"]
+    assert "tag" in run.report(results, comparison)
@@ -0,0 +1,206 @@
+"""Benchmark workloads.
+
+Each workload builds a headless simulation. Model workloads wrap the bundled examples, while synthetic
+workloads are parameterized by agent count.
+
+Designed and developed by Sever Topan.
+"""
+
+# Standard.
+import collections
+
+# Third party.
+import numpy as np
+
+# Local.
+from adjsim import core, decision, ensemble, analysis, index, interaction
+
+class Workload(object):
+    """A benchmark workload.
+
+    Attributes:
+        name (str): The workload name.
+        factory (callable): Callable that takes an agent count (None for model workloads) and returns a Simulation.
+        num_timesteps (int): The number of timesteps to simulate.
+        agent_counts (list): The agent counts to benchmark the workload at. [None] for model workloads.
+    """
+
+    def __init__(self, name, factory, num_timesteps, agent_counts=(None,)):
+        self.name = name
+        self.factory = factory
+        self.num_timesteps = num_timesteps
+        self.agent_counts = list(agent_counts)
+
+    def build(self, num_agents=None):
+        """Build a headless simulation.
+
+        Args:
+            num_agents (int): The agent count. Ignored by model workloads.
+
+        Returns:
+            A Simulation.
+        """
+        return ensemble.headless(self.factory(num_agents))
+
+
+#-------------------------------------------------------------------------------
+# Model workloads
+#-------------------------------------------------------------------------------
+
+def _game_of_life(num_agents):
+    from examples.game_of_life.simulation import GosperGliderGun
+    return GosperGliderGun()
+
+def _game_of_life_lattice(num_agents):
+    from examples.game_of_life.simulation import LatticeGosperGliderGun
+    return LatticeGosperGliderGun()
+
+def _predator_prey(num_agents):
+    from examples.predator_prey.simulation import PredatorPreySimulation
+    return PredatorPreySimulation()
+
+def _bacteria(num_agents):
+    from examples.bacteria.simulation import BasicBacteriaSimulation
+    return BasicBacteriaSimulation()
+
+def _bacteria_qlearning(num_agents):
+    from examples.bacteria.simulation import QLearningBacteriaTrainSimulation
+    return QLearningBacteriaTrainSimulation()
+
+def _orbital(num_agents):
+    from examples.orbital.simulation import JupiterMoonSystemSimulation
+    return JupiterMoonSystemSimulation()
+
+def _tag(num_agents):
+    from examples.tag.simulation import TaggerSimulation
+    return TaggerSimulation()
+
+def _comparative_advantage(num_agents):
+    from examples.comparative_advantage.simulation import TraderSimulation
+
+    traders = [
+            ("England", np.array([1/10, 1/12])),
+            ("Portugal", np.array([1/9, 1/8]))
+        ]
+
+    commodities = ["wine", "cloth"]
+    commodity_conversions = np.array([[1, 1],
+                                      [1, 1]])
+
+    return TraderSimulation(traders, commodities, commodity_conversions, is_training=True)
+
+
+#-------------------------------------------------------------------------------
+# Synthetic workloads
+#-------------------------------------------------------------------------------
+
+WORLD_SIZE = 100
+
+def _move(simulation, source):
+    source.pos = source.pos + np.random.normal(size=2)
+    source.step_complete = True
+
+def _count_neighbours(simulation, source):
+    source.neighbours = len(simulation.indices.grid.get_neighbours(source.pos))
+    source.step_complete = True
+
+def _perception(simulation, source):
+    return tuple(np.round(source.pos/10))
+
+def _loss(simulation, source):
+    return np.sum(np.abs(source.pos))
+
+class _WalkingAgent(core.SpatialAgent):
+    def __init__(self):
+        super().__init__(pos=np.random.uniform(0, WORLD_SIZE, size=2))
+        self.decision = decision.RandomSingleCastDecision()
+        self.actions["move"] = _move
+
+class _SensingAgent(core.SpatialAgent):
+    def __init__(self):
+        super().__init__(pos=np.random.uniform(0, WORLD_SIZE, size=2))
+        self.neighbours = 0
+        self.decision = decision.RandomRepeatedCastDecision()
+        self.actions["move"] = _move
+        self.actions["count_neighbours"] = _count_neighbours
+
+class _LearningAgent(core.SpatialAgent):
+    def __init__(self, learning_decision):
+        super().__init__(pos=np.random.uniform(0, WORLD_SIZE, size=2))
+        self.decision = learning_decision
+        self.move_rho = decision.DecisionMutableFloat(0, 1)
+        self.actions["move"] = _move
+
+def _random_walk(num_agents):
+    simulation = core.Simulation()
+    simulation.trackers["count"] = analysis.AgentCountTracker()
+    simulation.indices.grid.initialize(1)
+    simulation.agents.add_many(_WalkingAgent() for _ in range(num_agents))
+    return simulation
+
+def _neighbour_query(num_agents):
+    simulation = core.Simulation()
+    simulation.indices.grid.initialize(5)
+    simulation.agents.add_many(_SensingAgent() for _ in range(num_agents))
+    return simulation
+
+def _neighbour_query_cell_list(num_agents):
+    simulation = core.Simulation()
+    simulation.indices.grid.initialize(5, engine=index.GridIndex.ENGINE_CELL_LIST, rebuild_per_step=True)
+    simulation.agents.add_many(_SensingAgent() for _ in range(num_agents))
+    return simulation
+
+def _find_contacts(simulation):
+    pairs = simulation.indices.grid.pairs_within(1)
+    contacts = np.bincount(np.concatenate((pairs.i, pairs.j)), minlength=len(pairs.agents))
+    for agent, count in zip(pairs.agents, contacts.tolist()):
+        agent.neighbours = count
+
+def _contact_pairs(num_agents):
+    simulation = core.Simulation()
+    simulation.callbacks.simulation_step_started.register(_find_contacts)
+    simulation.agents.add_many(_WalkingAgent() for _ in range(num_agents))
+    return simulation
+
+def _repel(simulation):
+    agents = list(simulation.agents.of_type(core.SpatialAgent))
+    positions = np.array([agent.pos for agent in agents])
+    positions += np.clip(simulation.interactions.evaluate(agents, positions), -1, 1)
+    for agent, pos in zip(agents, positions):
+        agent.pos = pos
+
+def _interaction(num_agents):
+    simulation = core.Simulation()
+    simulation.interactions["repulsion"] = interaction.Interaction(interaction.Repulsion(), cutoff=5)
+    simulation.callbacks.simulation_step_started.register(_repel)
+    simulation.agents.add_many(core.SpatialAgent(pos=np.random.uniform(0, WORLD_SIZE, size=2))
+                               for _ in range(num_agents))
+    return simulation
+
+def _qlearning(num_agents):
+    simulation = core.Simulation()
+    learning_decision = decision.QLearningDecision(perception=_perception, loss=_loss, simulation=simulation,
+                                                   input_file_name=None, output_file_name=None)
+    simulation.trackers["qlearning"] = analysis.QLearningHistoryTracker(learning_decision)
+    simulation.agents.add_many(_LearningAgent(learning_decision) for _ in range(num_agents))
+    return simulation
+
+
+SYNTHETIC_AGENT_COUNTS = (100, 1000, 10000)
+
+WORKLOADS = collections.OrderedDict((workload.name, workload) for workload in [
+    Workload("game_of_life", _game_of_life, 20),
+    Workload("game_of_life_lattice", _game_of_life_lattice, 20),
+    Workload("predator_prey", _predator_prey, 20),
+    Workload("bacteria", _bacteria, 20),
+    Workload("bacteria_qlearning", _bacteria_qlearning, 20),
+    Workload("orbital", _orbital, 100),
+    Workload("tag", _tag, 50),
+    Workload("comparative_advantage", _comparative_advantage, 100),
+    Workload("random_walk", _random_walk, 10, SYNTHETIC_AGENT_COUNTS),
+    Workload("neighbour_query", _neighbour_query, 10, SYNTHETIC_AGENT_COUNTS),
+    Workload("neighbour_query_cell_list", _neighbour_query_cell_list, 10, SYNTHETIC_AGENT_COUNTS),
+    Workload("contact_pairs", _contact_pairs, 10, SYNTHETIC_AGENT_COUNTS),
+    Workload("interaction", _interaction, 10, SYNTHETIC_AGENT_COUNTS),
+    Workload("qlearning", _qlearning, 10, SYNTHETIC_AGENT_COUNTS),
+])
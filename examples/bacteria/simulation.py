@@ -22,7 +22,9 @@ EAT_DIST_SQUARE = 150
 MOVE_DIST = 20
 
 
-class Bacteria(core.VisualAgent):
+class Bacteria(core.CompactVisualAgent):
+    __slots__ = ("calories", "divide_threshold", "move_rho", "move_theta")
+
     def __init__(self, pos, decision_):
         super().__init__()
 
@@ -44,7 +46,9 @@ class Bacteria(core.VisualAgent):
         self.actions["wait"] = wait
         
 
-class Yogurt(core.VisualAgent):
+class Yogurt(core.CompactVisualAgent):
+    __slots__ = ("calories",)
+
     def __init__(self, pos):
         super().__init__()
 
@@ -67,18 +71,11 @@ class Meta(core.Agent):
 
 
 def find_closest_food(simulation, source):
-    closest_distance = sys.float_info.max
-    nearest_neighbour = None
-    for agent in simulation.agents:
-        if agent.id == source.id or type(agent) == Bacteria:
-            continue
-
-        distance = utility.distance_square(agent, source)
-        if distance < closest_distance:
-            nearest_neighbour = agent
-            closest_distance = distance
+    nearest = simulation.indices.kdtree.nearest(source.pos, type=Yogurt)
+    if not nearest:
+        return (None, sys.float_info.max)
 
-    return (nearest_neighbour, closest_distance)
+    return (nearest[0], utility.distance_square(nearest[0], source))
 
 
 def bacteria_loss(simulation, source):
@@ -136,10 +133,7 @@ def move(simulation, source):
 
 
 def starve(simulation, source):
-    for agent in list(simulation.agents):
-        if type(agent) != Bacteria:
-            continue
-
+    for agent in list(simulation.agents.of_type(Bacteria)):
         if agent.calories <= 0:
             simulation.agents.remove(agent)
         else:
@@ -159,11 +153,7 @@ def wait(simulation, source):
 
 def end_condition(simulation):
     """End if there are no more bacteria."""
-    for agent in simulation.agents:
-        if type(agent) == Bacteria:
-            return False
-
-    return True
+    return simulation.agents.count(Bacteria) == 0
 
 
 class BasicBacteriaSimulation(core.VisualSimulation):
@@ -176,14 +166,11 @@ class BasicBacteriaSimulation(core.VisualSimulation):
         self.bacteria_decision = decision.RandomRepeatedCastDecision()
         
         # create bacteria agents
-        for i in range(5):
-            for j in range(5):
-                self.agents.add(Bacteria(np.array([10*i, 10*j], dtype=np.float), self.bacteria_decision))
+        self.agents.add_many(Bacteria(np.array([10*i, 10*j], dtype=np.float), self.bacteria_decision)
+                             for i in range(5) for j in range(5))
 
         # create yogurt agents
-        for i in range(20):
-            for j in range(20):
-                self.agents.add(Yogurt(np.array([5*i, 5*j + 50], dtype=np.float)))
+        self.agents.add_many(Yogurt(np.array([5*i, 5*j + 50], dtype=np.float)) for i in range(20) for j in range(20))
 
     
 class QLearningBacteriaTrainSimulation(core.Simulation):
@@ -198,14 +185,11 @@ class QLearningBacteriaTrainSimulation(core.Simulation):
             simulation=self, input_file_name=io_file_name, output_file_name=io_file_name)
         
         # create bacteria agents
-        for i in range(5):
-            for j in range(5):
-                self.agents.add(Bacteria(np.array([10*i, 10*j], dtype=np.float), self.bacteria_decision))
+        self.agents.add_many(Bacteria(np.array([10*i, 10*j], dtype=np.float), self.bacteria_decision)
+                             for i in range(5) for j in range(5))
 
         # create yogurt agents
-        for i in range(20):
-            for j in range(20):
-                self.agents.add(Yogurt(np.array([5*i, 5*j + 50], dtype=np.float)))
+        self.agents.add_many(Yogurt(np.array([5*i, 5*j + 50], dtype=np.float)) for i in range(20) for j in range(20))
 
 
 class QLearningBacteriaTestSimulation(core.VisualSimulation):
@@ -221,11 +205,8 @@ class QLearningBacteriaTestSimulation(core.VisualSimulation):
         self.trackers["qlearning"] = analysis.QLearningHistoryTracker(self.bacteria_decision)
         
         # create bacteria agents
-        for i in range(5):
-            for j in range(5):
-                self.agents.add(Bacteria(np.array([10*i, 10*j], dtype=np.float), self.bacteria_decision))
+        self.agents.add_many(Bacteria(np.array([10*i, 10*j], dtype=np.float), self.bacteria_decision)
+                             for i in range(5) for j in range(5))
 
         # create yogurt agents
-        for i in range(20):
-            for j in range(20):
-                self.agents.add(Yogurt(np.array([5*i, 5*j + 50], dtype=np.float)))
+        self.agents.add_many(Yogurt(np.array([5*i, 5*j + 50], dtype=np.float)) for i in range(20) for j in range(20))
@@ -0,0 +1,12 @@
+"""Conway's Game of Life Simulation.
+
+Implementation of Conway's Game of Life (https://en.wikipedia.org/wiki/Conway%27s_Game_of_Life),
+simulated on a lattice.
+"""
+
+from simulation import LatticeGosperGliderGun
+
+if __name__ == "__main__":
+    sim = LatticeGosperGliderGun()
+    sim.batched = True
+    sim.simulate(1000)
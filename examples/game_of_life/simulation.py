@@ -10,7 +10,7 @@ import os
 
 # Third party.
 import numpy as np
-from adjsim import core, utility, decision, analysis, color
+from adjsim import core, utility, decision, analysis, color, index, lattice
 
 
 # Constants.
@@ -18,43 +18,40 @@ CELL_SIZE = 5
 
 def compute(simulation, source):
     """Main game loop."""
+    grid = simulation.indices.grid
+
     # Track neighbours.
+    cells = list(simulation.agents.of_type(Cell))
+    live_coords = {(cell.x, cell.y) for cell in cells}
     global_empty_neighbours = set()
     kill_list = []
     birth_list = []
-    for agent in simulation.agents:
-        if agent == source:
-            continue
-
+    for cell in cells:
         # Add coordinates to global empty list.
-        neighbour_coords = simulation.indices.grid.get_neighbour_coordinates(agent.pos)
-        for coord in neighbour_coords:
-            if not simulation.indices.grid.get_inhabitants(coord):
-                global_empty_neighbours.add((coord[0], coord[1]))
+        for x, y in index.MOORE:
+            coord = (cell.x + x*CELL_SIZE, cell.y + y*CELL_SIZE)
+            if not coord in live_coords:
+                global_empty_neighbours.add(coord)
 
         # Count local neighbours.
-        neighbours = simulation.indices.grid.get_neighbours(agent.pos)
-        
+        num_neighbours = grid.count_neighbours(cell.pos)
+
         # Mark existing cells if needed (can't kill in set iteration). 
-        if len(neighbours) < 2 or len(neighbours) > 3:
-            kill_list.append(agent)
+        if num_neighbours < 2 or num_neighbours > 3:
+            kill_list.append(cell)
 
 
     # Mark new cells for birth if needed.
     for coord in global_empty_neighbours:
         array = np.array(coord)
-        neighbours = simulation.indices.grid.get_neighbours(array)
-
-        if len(neighbours) == 3:
+        if grid.count_neighbours(array) == 3:
             birth_list.append(array)
 
     # Kill agents.
-    for agent in kill_list:
-        simulation.agents.remove(agent)
+    simulation.agents.discard_many(kill_list)
 
     # Birth agents.
-    for array in birth_list:
-        simulation.agents.add(Cell(array))
+    simulation.agents.add_many(Cell(array) for array in birth_list)
         
 
 class Cell(core.VisualAgent):
@@ -90,8 +87,7 @@ class BlockLayingSwitchEngine(core.VisualSimulation):
         self.indices.grid.initialize(CELL_SIZE)
         
         self.agents.add(Meta())
-        for coord in BlockLayingSwitchEngine.INTIAL_COORDINATES:
-            self.agents.add(Cell(np.array(coord) * CELL_SIZE))
+        self.agents.add_many(Cell(np.array(coord) * CELL_SIZE) for coord in BlockLayingSwitchEngine.INTIAL_COORDINATES)
 
 class GosperGliderGun(core.VisualSimulation):
     """Implementation of a gosper glider gun pattern starting condition.
@@ -118,5 +114,29 @@ class GosperGliderGun(core.VisualSimulation):
         self.indices.grid.initialize(CELL_SIZE)
         
         self.agents.add(Meta())
-        for coord in GosperGliderGun.INTIAL_COORDINATES:
-            self.agents.add(Cell(np.array(coord) * CELL_SIZE))
+        self.agents.add_many(Cell(np.array(coord) * CELL_SIZE) for coord in GosperGliderGun.INTIAL_COORDINATES)
+
+
+class LatticeGosperGliderGun(lattice.VisualLatticeSimulation):
+    """The gosper glider gun, simulated on a lattice rather than with agents.
+
+    Cells are held in a NumPy array and updated through vectorized neighbour counts, so the simulation
+    does not slow down as the number of gliders grows.
+    """
+
+    def __init__(self):
+        super().__init__(lattice.Lattice(cell_size=CELL_SIZE))
+
+        self.lattice.size = 5
+        self.lattice.set(GosperGliderGun.INTIAL_COORDINATES)
+        self.trackers["count"] = analysis.LatticeCountTracker()
+
+class LatticeBlockLayingSwitchEngine(lattice.VisualLatticeSimulation):
+    """The block laying switch engine, simulated on a lattice rather than with agents."""
+
+    def __init__(self):
+        super().__init__(lattice.Lattice(cell_size=CELL_SIZE))
+
+        self.lattice.size = 5
+        self.lattice.set(BlockLayingSwitchEngine.INTIAL_COORDINATES)
+        self.trackers["count"] = analysis.LatticeCountTracker()
@@ -12,4 +12,18 @@ def test_gol_block_laying_switch_engine():
 
     sim = BlockLayingSwitchEngine()
     sim._wait_on_visual_init = 0
-    sim.simulate(10)
\ No newline at end of file
+    sim.simulate(10)
+
+def test_gol_lattice_gosper_glider_gun():
+    from examples.game_of_life.simulation import LatticeGosperGliderGun
+
+    sim = LatticeGosperGliderGun()
+    sim._wait_on_visual_init = 0
+    sim.simulate(10)
+
+def test_gol_lattice_block_laying_switch_engine():
+    from examples.game_of_life.simulation import LatticeBlockLayingSwitchEngine
+
+    sim = LatticeBlockLayingSwitchEngine()
+    sim._wait_on_visual_init = 0
+    sim.simulate(10)
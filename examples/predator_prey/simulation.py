@@ -61,18 +61,12 @@ class Prey(core.VisualAgent):
 
 
 def eat(simulation, source):
-    closest_distance = sys.float_info.max
-    nearest_neighbour = None
-    for agent in simulation.agents:
-        if agent.id == source.id or type(agent) == Predator:
-            continue
-
-        distance = utility.distance_square(agent, source)
-        if distance < closest_distance:
-            nearest_neighbour = agent
-            closest_distance = distance
-
-    if closest_distance > EAT_DIST_SQUARE:
+    nearest = simulation.indices.kdtree.nearest(source.pos, type=Prey)
+    if not nearest:
+        return
+
+    nearest_neighbour = nearest[0]
+    if utility.distance_square(nearest_neighbour, source) > EAT_DIST_SQUARE:
         return
 
     source.calories = np.clip(source.calories + nearest_neighbour.calories, 0, CALORIE_UPPER_BOUND_PREDATOR)
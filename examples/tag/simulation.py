@@ -27,21 +27,13 @@ def tag(simulation, source):
         return
 
     # Find nearest neighbour.
-    closest_distance = sys.float_info.max
-    nearest_neighbour = None
-    for agent in simulation.agents:
-        if agent.id == source.id:
-            continue
-
-        distance = utility.distance_square(agent, source)
-        if distance < closest_distance:
-            nearest_neighbour = agent
-            closest_distance = distance
-
-    if closest_distance > TAG_DIST_SQUARE:
+    nearest = simulation.indices.kdtree.nearest(source.pos, exclude=source)
+    if not nearest:
         return
 
-    assert nearest_neighbour
+    nearest_neighbour = nearest[0]
+    if utility.distance_square(nearest_neighbour, source) > TAG_DIST_SQUARE:
+        return
 
     # Perform Tag.
     nearest_neighbour.is_it = True
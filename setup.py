@@ -22,6 +22,11 @@ setup(name='adjsim',
           'Programming Language :: Python :: 3.6',
       ],
       keywords='agent based modelling ABM reinforcement learning',
-      install_requires=['PyQt5==5.9', 'matplotlib==2.0', 'numpy==1.13'],
+      install_requires=['numpy==1.13'],
+      extras_require={
+          'visual': ['PyQt5==5.9'],
+          'analysis': ['matplotlib==2.0'],
+          'all': ['PyQt5==5.9', 'matplotlib==2.0'],
+      },
       python_requires='>=3.5, <3.7',
       )
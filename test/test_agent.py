@@ -2,6 +2,8 @@ import sys
 import os
 import pytest
 
+import numpy as np
+
 from . import common
 
 def test_trivial():
@@ -75,4 +77,153 @@ def test_agent_remove():
 
     common.step_simulate_interpolation(test_sim)
 
-    assert len(test_sim.agents) == 0
\ No newline at end of file
+    assert len(test_sim.agents) == 0
+
+def test_type_registry():
+    from adjsim import core
+
+    class TestAgent(core.Agent):
+        pass
+
+    class TestSpatialAgent(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    plain_agents = [TestAgent() for _ in range(3)]
+    spatial_agents = [TestSpatialAgent() for _ in range(4)]
+    for agent in plain_agents + spatial_agents:
+        test_sim.agents.add(agent)
+
+    spatial_view = test_sim.agents.of_type(core.SpatialAgent)
+    assert spatial_view == set(spatial_agents)
+    assert len(test_sim.agents.of_type(core.SpatialAgent, exact=True)) == 0
+    assert test_sim.agents.count(core.Agent) == 7
+    assert test_sim.agents.count(TestAgent, exact=True) == 3
+    assert set(test_sim.agents.types()) == {TestAgent, TestSpatialAgent}
+
+    # Views are live.
+    test_sim.agents.remove(spatial_agents[0])
+    test_sim.agents.discard(spatial_agents[0])
+    assert len(spatial_view) == 3
+    assert spatial_agents[0] not in spatial_view
+    assert test_sim.agents.count(TestSpatialAgent) == 3
+
+    for agent in plain_agents:
+        test_sim.agents.remove(agent)
+
+    assert test_sim.agents.count(TestAgent) == 0
+    assert test_sim.agents.types() == [TestSpatialAgent]
+    assert test_sim.agents.count(core.VisualAgent) == 0
+
+def test_type_registry_mixin():
+    from adjsim import core
+
+    class Food(object):
+        pass
+
+    class Yogurt(Food, core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    test_sim.indices.grid.initialize(1)
+    yogurt = Yogurt(pos=np.array([1., 1.]))
+    test_sim.agents.add(yogurt)
+    test_sim.agents.add(core.SpatialAgent(pos=np.array([2., 2.])))
+
+    # Mixins are indexed, so type-filtered queries agree with isinstance.
+    assert test_sim.agents.of_type(Food) == {yogurt}
+    assert test_sim.agents.count(Food) == 1
+    assert test_sim.indices.kdtree.nearest(np.array([2., 2.]), type=Food) == [yogurt]
+    assert test_sim.indices.grid.get_within(np.array([2., 2.]), 5, type=Food) == [yogurt]
+    assert test_sim.agents.count(object) == 0
+
+    test_sim.agents.remove(yogurt)
+    assert test_sim.agents.count(Food) == 0
+
+def test_compact_agent():
+    from adjsim import core, decision
+
+    def move(env, source):
+        source.x += 1
+        source.steps += 1
+
+    class TestAgent(core.CompactVisualAgent):
+        __slots__ = ("steps",)
+
+        def __init__(self):
+            super().__init__()
+            self.steps = 0
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+
+    agents = [TestAgent() for _ in range(10)]
+
+    # Integer ids are unique and increasing.
+    ids = [agent.id for agent in agents]
+    assert all(type(agent_id) == int for agent_id in ids)
+    assert ids == sorted(set(ids))
+
+    # No instance dictionary, and a single shared action suite.
+    assert not hasattr(agents[0], "__dict__")
+    assert agents[0].actions is agents[1].actions
+    with pytest.raises(AttributeError):
+        agents[0].undeclared = True
+
+    test_sim = core.Simulation()
+    test_sim.indices.grid.initialize(1)
+    for agent in agents:
+        test_sim.agents.add(agent)
+
+    common.step_simulate_interpolation(test_sim)
+
+    assert all(agent.steps == common.INTERPOLATION_NUM_TIMESTEP for agent in agents)
+    assert len(test_sim.snapshots.full()) == len(ids)
+
+def test_compact_action_suite_per_simulation():
+    from adjsim import core, profiling
+
+    def move(env, source):
+        source.step_complete = True
+
+    def wait(env, source):
+        source.step_complete = True
+
+    class TestAgent(core.CompactAgent):
+        __slots__ = ()
+
+        def __init__(self):
+            super().__init__()
+            self.actions["move"] = move
+
+    simulations = [core.Simulation(), core.Simulation()]
+    agents = [[TestAgent() for _ in range(3)] for _ in simulations]
+    for simulation, simulation_agents in zip(simulations, agents):
+        simulation.agents.add_many(simulation_agents)
+
+    # Agents share a suite within a simulation, but not across simulations.
+    assert all(agent.actions is agents[0][0].actions for agent in agents[0])
+    assert not agents[0][0].actions is agents[1][0].actions
+
+    agents[0][0].actions["wait"] = wait
+    assert all("wait" in agent.actions for agent in agents[0])
+    assert not any("wait" in agent.actions for agent in agents[1])
+    assert not "wait" in TestAgent().actions
+
+    # Profiling one simulation does not wrap the actions of another.
+    simulations[0].profiler.enable()
+    assert isinstance(agents[0][0].actions["move"], profiling._ProfiledCallable)
+    assert agents[1][0].actions["move"] is move
+    assert TestAgent().actions["move"] is move
+    simulations[0].profiler.disable()
+
+def test_compact_subclass_without_slots():
+    from adjsim import core
+
+    class TestAgent(core.CompactAgent):
+        def __init__(self):
+            super().__init__()
+            self.name = "test"
+
+    agent = TestAgent()
+    assert agent.name == "test"
+    assert type(agent.id) == int
@@ -85,4 +85,96 @@ def test_agent_move():
     assert move_callback.count == 4*common.INTERPOLATION_NUM_TIMESTEP # 2 agents * 2 updates per move
 
 
-# test core ended 
\ No newline at end of file
+def test_agent_move_batch():
+    from adjsim import core, utility
+
+    def move_callback(agent):
+        move_callback.count += 1
+    move_callback.count = 0
+
+    def batch_move_callback(agents):
+        batch_move_callback.calls.append(len(agents))
+    batch_move_callback.calls = []
+
+    test_sim = core.Simulation()
+    test_sim.indices.grid.initialize(1)
+    test_sim.callbacks.agent_moved.register(move_callback)
+    test_sim.callbacks.agent_moved.register_batch(lambda agent: None, batch_move_callback)
+
+    agents = [core.SpatialAgent(pos=np.array([i, 0])) for i in range(5)]
+    test_sim.agents.add_many(agents)
+    move_callback.count = 0
+
+    positions = np.array([[i, 10.] for i in range(5)])
+    test_sim.agents.move_many(agents, positions)
+
+    assert move_callback.count == 5
+    assert batch_move_callback.calls == [5]
+    assert np.array_equal([agent.pos for agent in agents], positions)
+    assert not agents[0].pos.flags.writeable
+    assert test_sim.indices.grid.get_inhabitants(np.array([2, 10])) == [agents[2]]
+
+    # Positions are copied.
+    positions[:] = 0
+    assert agents[3].pos[0] == 3
+
+    with pytest.raises(TypeError):
+        test_sim.agents.move_many(agents, np.zeros((4, 2)))
+
+    with pytest.raises(utility.InvalidAgentException):
+        test_sim.agents.move_many([core.Agent()], np.zeros((1, 2)))
+
+# test core ended 
+def test_agent_batch():
+    from adjsim import core
+
+    def addition_callback(agent):
+        addition_callback.count += 1
+    addition_callback.count = 0
+
+    def removal_callback(agent):
+        removal_callback.count += 1
+    removal_callback.count = 0
+
+    def batch_addition_callback(agents):
+        batch_addition_callback.calls.append(len(agents))
+    batch_addition_callback.calls = []
+
+    def batch_addition_fallback(agent):
+        raise AssertionError("Batched subscribers must not be called per agent.")
+
+    test_sim = core.Simulation()
+    test_sim.callbacks.agent_added.register(addition_callback)
+    test_sim.callbacks.agent_added.register_batch(batch_addition_fallback, batch_addition_callback)
+    test_sim.callbacks.agent_removed.register(removal_callback)
+
+    agents = [core.Agent() for _ in range(10)]
+    test_sim.agents.add_many(agents)
+
+    assert addition_callback.count == 10
+    assert batch_addition_callback.calls == [10]
+
+    removed = test_sim.agents.discard_where(lambda agent: agent in agents[:4])
+    assert set(removed) == set(agents[:4])
+    assert removal_callback.count == 4
+    assert all(not agent._exists for agent in removed)
+
+    test_sim.agents.discard_many(agents[4:])
+    assert removal_callback.count == 10
+    assert len(test_sim.agents) == 0
+
+    test_sim.callbacks.agent_added.unregister(batch_addition_fallback)
+    assert not test_sim.callbacks.agent_added.batch_subscriptions
+
+def test_agent_batch_invalid():
+    from adjsim import core, utility
+
+    test_sim = core.Simulation()
+
+    with pytest.raises(utility.InvalidAgentException):
+        test_sim.agents.add_many([core.Agent(), {"I'm not valid!"}])
+
+    assert len(test_sim.agents) == 0
+
+    with pytest.raises(utility.InvalidCallbackException):
+        test_sim.callbacks.agent_added.register_batch(lambda agent: None, None)
@@ -0,0 +1,176 @@
+import sys
+import os
+import pytest
+import random
+
+import numpy as np
+
+from . import common
+
+from adjsim import core, analysis, decision
+
+def _move(env, source):
+    source.pos = source.pos + np.random.normal(size=2)
+    source.steps += 1
+
+def _divide(env, source):
+    if random.random() < 0.1:
+        env.agents.add(_CheckpointAgent())
+
+class _CheckpointAgent(core.VisualAgent):
+    def __init__(self):
+        super().__init__(pos=np.zeros(2))
+        self.steps = 0
+        self.move_rho = decision.DecisionMutableFloat(0, 1)
+        self.decision = decision.RandomSingleCastDecision()
+        self.actions["move"] = _move
+        self.actions["divide"] = _divide
+
+def _noop(env, source):
+    source.step_complete = True
+
+class _CompactCheckpointAgent(core.CompactAgent):
+    __slots__ = ()
+
+class _Unpicklable(object):
+    def __reduce__(self):
+        raise RecursionError("maximum recursion depth exceeded")
+
+def _build_simulation(simulation_type=core.Simulation):
+    test_sim = simulation_type()
+    test_sim.trackers["count"] = analysis.AgentCountTracker()
+    test_sim.indices.grid.initialize(1)
+    test_sim.population.register_attribute("steps")
+    test_sim.population.initialize()
+
+    for _ in range(5):
+        test_sim.agents.add(_CheckpointAgent())
+
+    return test_sim
+
+def _state(simulation):
+    return sorted((tuple(agent.pos), agent.steps) for agent in simulation.agents)
+
+def test_checkpoint_resume(tmpdir):
+    path = str(tmpdir.join("sim.ckpt"))
+
+    random.seed(0)
+    np.random.seed(0)
+    test_sim = _build_simulation()
+    test_sim.start()
+    test_sim.step(3)
+    test_sim.checkpoint(path)
+    test_sim.step(3)
+    expected_state = _state(test_sim)
+    expected_count = list(test_sim.trackers["count"].data)
+
+    restored_sim = core.Simulation.restore(path)
+    assert restored_sim.time == 3
+    restored_sim.step(3)
+    restored_sim.end()
+
+    assert _state(restored_sim) == expected_state
+    assert restored_sim.trackers["count"].data == expected_count
+
+    # Indices and the population store follow the restored agents.
+    for agent in restored_sim.agents:
+        assert np.shares_memory(agent.pos, restored_sim.population.positions)
+        assert agent in restored_sim.indices.grid.get_inhabitants(np.floor(agent.pos))
+
+def test_checkpoint_visual(tmpdir):
+    path = str(tmpdir.join("sim.ckpt"))
+
+    test_sim = _build_simulation(core.VisualSimulation)
+    test_sim._wait_on_visual_init = 0
+    test_sim.start()
+    test_sim.step(2)
+    test_sim.checkpoint(path)
+    test_sim.end()
+
+    restored_sim = core.VisualSimulation.restore(path)
+    restored_sim.step(2)
+    restored_sim.end()
+
+    assert restored_sim.time == 4
+
+def test_checkpoint_rotation(tmpdir):
+    prefix = str(tmpdir.join("sim.ckpt"))
+
+    test_sim = _build_simulation()
+    test_sim.checkpoint_periodically(prefix, 2, keep=2)
+    common.step_simulate_interpolation(test_sim)
+
+    assert sorted(os.listdir(str(tmpdir))) == ["sim.ckpt.6", "sim.ckpt.8"]
+
+    restored_sim = core.Simulation.restore(prefix + ".8")
+    assert restored_sim.time == 8
+
+    test_sim.checkpoint_periodically(prefix, None)
+    assert not test_sim.callbacks.simulation_step_complete.is_registered(test_sim._checkpoint_on_step_complete)
+
+def test_checkpoint_local_callable(tmpdir):
+    from adjsim import utility
+
+    path = str(tmpdir.join("sim.ckpt"))
+
+    test_sim = _build_simulation()
+    test_sim.end_condition = lambda env: False
+
+    with pytest.raises(utility.CheckpointException) as error_info:
+        test_sim.checkpoint(path)
+
+    # The original pickling error is chained, so its message is not lost.
+    assert error_info.value.__cause__ is not None
+    assert os.listdir(str(tmpdir)) == []
+
+def test_checkpoint_interrupted(tmpdir):
+    path = str(tmpdir.join("sim.ckpt"))
+
+    test_sim = _build_simulation()
+    test_sim.unpicklable = _Unpicklable()
+
+    with pytest.raises(RecursionError):
+        test_sim.checkpoint(path)
+
+    assert os.listdir(str(tmpdir)) == []
+
+def test_checkpoint_compact_ids(tmpdir):
+    from adjsim import core
+
+    path = str(tmpdir.join("sim.ckpt"))
+
+    test_sim = core.Simulation()
+    agents = [core.CompactAgent() for _ in range(3)]
+    for agent in agents:
+        test_sim.agents.add(agent)
+
+    test_sim.checkpoint(path)
+
+    # Simulate a fresh process, where the identifier counter restarts.
+    core._CompactAgentMixin._id_counter = core.itertools.count()
+    restored_sim = core.Simulation.restore(path)
+
+    assert core.CompactAgent().id > max(agent.id for agent in restored_sim.agents)
+
+def test_checkpoint_compact_action_suite(tmpdir):
+    from adjsim import core
+
+    path = str(tmpdir.join("sim.ckpt"))
+
+    test_sim = core.Simulation()
+    for _ in range(3):
+        test_sim.agents.add(_CompactCheckpointAgent())
+
+    test_sim.checkpoint(path)
+    restored_sim = core.Simulation.restore(path)
+
+    # Restored agents share a suite, which agents added to the restored simulation adopt.
+    restored_agents = list(restored_sim.agents)
+    added = _CompactCheckpointAgent()
+    restored_sim.agents.add(added)
+    assert all(agent.actions is added.actions for agent in restored_agents)
+
+    # Actions set on restored agents do not affect the original simulation.
+    added.actions["noop"] = _noop
+    assert all("noop" in agent.actions for agent in restored_agents)
+    assert not any("noop" in agent.actions for agent in test_sim.agents)
@@ -1,6 +1,8 @@
 import sys
 import os
 import pytest
+import copy
+import pickle
 
 import numpy as np
 
@@ -112,4 +114,113 @@ def test_qlearning_perturbative(mutable_min, mutable_max):
     assert agent.decision.q_table[1].action_premise.iterations[0].action_name == "move"
 
 
-    
\ No newline at end of file
+    
+def test_decision_mutable_schema():
+    from adjsim import core, decision
+
+    def move(env, source):
+        move.values.append((source.first.value, getattr(source, "second", None)))
+        source.step_complete = True
+    move.values = []
+
+    class TestAgent(core.Agent):
+        def __init__(self):
+            super().__init__()
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+            self.first = decision.DecisionMutableFloat(0, 1)
+            self.calories = 10
+
+        @property
+        def unavailable(self):
+            raise AttributeError("unavailable")
+
+    test_sim = core.Simulation()
+    agent = TestAgent()
+    test_sim.agents.add(agent)
+
+    assert [name for name, _ in decision._decision_mutables(agent)] == ["first"]
+
+    # Adding or replacing decision mutables invalidates the cached schema.
+    agent.second = decision.DecisionMutableInt(5, 10)
+    assert [name for name, _ in decision._decision_mutables(agent)] == ["first", "second"]
+
+    agent.first = 0.5
+    assert [name for name, _ in decision._decision_mutables(agent)] == ["second"]
+
+    agent.first = decision.DecisionMutableFloat(0, 1)
+    del agent.second
+    assert [name for name, _ in decision._decision_mutables(agent)] == ["first"]
+
+    # Agents of the same class may hold different decision mutables.
+    class MixedAgent(core.Agent):
+        def __init__(self, extra):
+            super().__init__()
+            self.a = decision.DecisionMutableFloat(0, 1)
+            self.b = decision.DecisionMutableBool() if extra else 0
+
+    plain = MixedAgent(False)
+    extra = MixedAgent(True)
+    assert [name for name, _ in decision._decision_mutables(plain)] == ["a"]
+    assert [name for name, _ in decision._decision_mutables(extra)] == ["a", "b"]
+
+    # Plain attributes replaced with decision mutables are found.
+    plain.b = decision.DecisionMutableInt(0, 3)
+    assert decision._decision_mutables(plain) == [("a", plain.a), ("b", plain.b)]
+
+    # Decision mutables added to an agent after its class was first looked up are found.
+    late = MixedAgent(False)
+    late.late = decision.DecisionMutableFloat(0, 1)
+    assert [name for name, _ in decision._decision_mutables(late)] == ["a", "late"]
+    assert [name for name, _ in decision._decision_mutables(plain)] == ["a", "b"]
+
+    # Copied and unpickled agents register the decision mutables they hold, as their attributes are not assigned.
+    late.__dict__["unassigned"] = decision.DecisionMutableBool()
+    copied = copy.copy(late)
+    assert [name for name, _ in decision._decision_mutables(copied)] == ["a", "late", "unassigned"]
+    assert [name for name, _ in decision._decision_mutables(pickle.loads(pickle.dumps(core.Agent())))] == []
+
+    # Slots and class attributes are read from each agent.
+    class SlottedAgent(core.Agent):
+        __slots__ = ("c", "d")
+        shared = decision.DecisionMutableFloat(0, 1)
+
+    slotted = SlottedAgent()
+    slotted.c = decision.DecisionMutableFloat(0, 1)
+    assert [name for name, _ in decision._decision_mutables(slotted)] == ["c", "shared"]
+
+    slotted.d = decision.DecisionMutableFloat(0, 1)
+    slotted.c = 1
+    assert decision._decision_mutables(slotted) == [("d", slotted.d), ("shared", SlottedAgent.shared)]
+
+    common.step_simulate_interpolation(test_sim)
+    assert len(move.values) == common.INTERPOLATION_NUM_TIMESTEP
+    assert all(0 <= first <= 1 and second is None for first, second in move.values)
+
+def test_action_items():
+    from adjsim import core, decision
+
+    def move(env, source):
+        move.count += 1
+        source.step_complete = True
+    move.count = 0
+
+    def wait(env, source):
+        raise AssertionError("Removed actions must not be called.")
+
+    test_sim = core.Simulation()
+    agent = core.Agent()
+    agent.decision = decision.RandomRepeatedCastDecision()
+    agent.actions["wait"] = wait
+    test_sim.agents.add(agent)
+
+    assert decision._action_items(agent) == (("wait", wait),)
+
+    # Changing the action suite invalidates the cached items.
+    agent.actions["move"] = move
+    del agent.actions["wait"]
+    assert decision._action_items(agent) == (("move", move),)
+    assert "wait" not in agent.actions
+
+    common.step_simulate_interpolation(test_sim)
+    assert move.count == common.INTERPOLATION_NUM_TIMESTEP
@@ -0,0 +1,73 @@
+import sys
+import os
+import pytest
+import random
+
+import numpy as np
+
+from . import common
+
+from adjsim import core, decision
+
+def _move(env, source):
+    source.pos = source.pos + np.random.normal(size=2)
+
+def _divide(env, source):
+    if random.random() < 0.2:
+        env.agents.add(_WalkingAgent())
+
+# Tracker data is sent back between processes, so agent types tracked by type must be picklable.
+class _WalkingAgent(core.VisualAgent):
+    def __init__(self):
+        super().__init__(pos=np.zeros(2))
+        self.decision = decision.RandomSingleCastDecision()
+        self.actions["move"] = _move
+        self.actions["divide"] = _divide
+
+def _random_walk_simulation():
+    from adjsim import analysis
+
+    test_sim = core.VisualSimulation()
+    test_sim.trackers["count"] = analysis.AgentCountTracker()
+    test_sim.trackers["type_count"] = analysis.AgentTypeCountTracker()
+    test_sim.agents.add(_WalkingAgent())
+
+    return test_sim
+
+def _ending_simulation():
+    from adjsim import core, analysis
+
+    test_sim = core.Simulation()
+    test_sim.trackers["count"] = analysis.AgentCountTracker()
+    test_sim.end_condition = lambda env: env.time >= 2 + random.randint(0, 3)
+
+    return test_sim
+
+def test_stacked_and_reproducible():
+    from adjsim import ensemble
+
+    seeds = [1, 2, 3, 4]
+    parallel = ensemble.run(_random_walk_simulation, 5, seeds, workers=2)
+    serial = ensemble.run(_random_walk_simulation, 5, seeds, workers=1)
+
+    assert parallel["count"].shape == (len(seeds), 6)
+    assert np.array_equal(parallel["count"], serial["count"])
+    assert np.all(parallel["count"][:, 0] == 1)
+
+    assert np.array_equal(parallel["type_count"][_WalkingAgent], parallel["count"])
+
+def test_ragged_padding():
+    from adjsim import ensemble
+
+    result = ensemble.run(_ending_simulation, 10, range(6), workers=1)
+
+    assert result["count"].shape[0] == 6
+    lengths = np.sum(~np.isnan(result["count"]), axis=1)
+    assert len(set(lengths)) > 1
+    assert np.all(result["count"][~np.isnan(result["count"])] == 0)
+
+def test_invalid_workers():
+    from adjsim import ensemble
+
+    with pytest.raises(ValueError):
+        ensemble.run(_ending_simulation, 1, [0], workers=0)
@@ -264,3 +264,395 @@ def test_grid_move(grid_size):
     assert len(test_sim.indices.grid.get_neighbours(np.array([0,2])*grid_size)) == 2
 
     test_sim.end()
+
+def test_grid_batch():
+    from adjsim import core
+
+    test_sim = core.Simulation()
+    test_sim.indices.grid.initialize(5)
+    test_sim.population.initialize()
+
+    agents = [core.SpatialAgent(pos=np.array([i, 0])) for i in range(20)]
+    test_sim.agents.add_many(agents)
+
+    assert len(test_sim.population) == 20
+    assert len(test_sim.indices.grid.get_inhabitants(np.array([0, 0]))) == 5
+    assert len(test_sim.indices.grid.get_inhabitants(np.array([15, 0]))) == 5
+
+    test_sim.agents.discard_where(lambda agent: agent.x < 10)
+
+    assert len(test_sim.population) == 10
+    assert test_sim.indices.grid.get_inhabitants(np.array([0, 0])) == []
+    assert len(test_sim.indices.grid.get_inhabitants(np.array([10, 0]))) == 5
+
+
+def _brute_nearest(agents, pos, k):
+    return sorted(agents, key=lambda agent: np.sum((agent.pos - pos)**2))[:k]
+
+def test_kdtree_nearest():
+    from adjsim import core
+
+    class OtherAgent(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    agents = [core.SpatialAgent(pos=np.random.uniform(-100, 100, size=2)) for _ in range(500)]
+    others = [OtherAgent(pos=np.random.uniform(-100, 100, size=2)) for _ in range(100)]
+    test_sim.agents.add_many(agents + others)
+    test_sim.agents.add(core.Agent())
+
+    for _ in range(20):
+        pos = np.random.uniform(-120, 120, size=2)
+        assert test_sim.indices.kdtree.nearest(pos, k=5) == _brute_nearest(agents + others, pos, 5)
+        assert test_sim.indices.kdtree.nearest(pos, type=OtherAgent) == _brute_nearest(others, pos, 1)
+
+        nearest = _brute_nearest(agents + others, pos, 1)[0]
+        assert test_sim.indices.kdtree.nearest(pos, exclude=nearest) == _brute_nearest(agents + others, pos, 2)[1:]
+        assert test_sim.indices.kdtree.nearest(pos, k=3, exclude=[nearest]) == \
+            _brute_nearest(agents + others, pos, 4)[1:]
+
+    assert len(test_sim.indices.kdtree.nearest(np.array([0, 0]), k=1000)) == 600
+
+    with pytest.raises(TypeError):
+        test_sim.indices.kdtree.nearest((0, 0))
+
+def test_kdtree_within():
+    from adjsim import core
+
+    test_sim = core.Simulation()
+    agents = [core.SpatialAgent(pos=np.random.uniform(-100, 100, size=2)) for _ in range(500)]
+    test_sim.agents.add_many(agents)
+
+    for radius in (0, 5, 20, 300):
+        pos = np.random.uniform(-100, 100, size=2)
+        expected = {agent for agent in agents if np.sum((agent.pos - pos)**2) <= radius**2}
+        found = test_sim.indices.kdtree.within(pos, radius)
+
+        assert len(found) == len(expected)
+        assert set(found) == expected
+
+    assert test_sim.indices.kdtree.within(agents[0].pos, 0, exclude=agents[0]) == []
+
+def test_kdtree_update():
+    from adjsim import core
+
+    test_sim = core.Simulation()
+    agents = [core.SpatialAgent(pos=np.array([i, 0])) for i in range(200)]
+    test_sim.agents.add_many(agents)
+
+    assert test_sim.indices.kdtree.nearest(np.array([50, 1])) == [agents[50]]
+
+    # Moves, additions and removals are reflected whether changed agents are buffered or built into levels.
+    for count in (1, 100):
+        for agent in agents[:count]:
+            agent.y = 10
+
+        added = core.SpatialAgent(pos=np.array([-50, 0]))
+        test_sim.agents.add(added)
+        test_sim.agents.remove(agents[150])
+
+        assert test_sim.indices.kdtree.nearest(np.array([0, 11])) == [agents[0]]
+        assert test_sim.indices.kdtree.nearest(np.array([-40, 0])) == [added]
+        assert set(test_sim.indices.kdtree.nearest(np.array([150.1, 0]), k=2)) == {agents[149], agents[151]}
+        assert not agents[150] in test_sim.indices.kdtree.within(np.array([150, 0]), 5)
+
+        test_sim.agents.remove(added)
+        agents.remove(agents[150])
+
+def test_kdtree_simulate():
+    from adjsim import core, decision
+
+    def move(simulation, source):
+        source.pos = source.pos + np.random.normal(size=2)
+        source.nearest = simulation.indices.kdtree.nearest(source.pos, exclude=source)[0]
+        source.step_complete = True
+
+    class TestAgent(core.SpatialAgent):
+        def __init__(self):
+            super().__init__(pos=np.random.uniform(0, 50, size=2))
+            self.nearest = None
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+
+    test_sim = core.Simulation()
+    agents = [TestAgent() for _ in range(100)]
+    test_sim.agents.add_many(agents)
+
+    common.step_simulate_interpolation(test_sim)
+
+    assert all(agent.nearest in agents and not agent.nearest is agent for agent in agents)
+
+    pos = np.array([25., 25.])
+    assert test_sim.indices.kdtree.nearest(pos, k=10) == _brute_nearest(agents, pos, 10)
+
+def test_kdtree_rebuilds(monkeypatch):
+    from adjsim import core, decision, index
+
+    builds = []
+
+    class CountingEntry(index._KDTreeEntry):
+        def __init__(self, agents, step):
+            builds.append(step)
+            super().__init__(agents, step)
+
+    monkeypatch.setattr(index, "_KDTreeEntry", CountingEntry)
+
+    def move(simulation, source):
+        # Queries interleaved with moves reflect current positions.
+        source.pos = source.pos + np.random.normal(size=2)
+        nearest = simulation.indices.kdtree.nearest(source.pos, k=2)
+        assert nearest[0] is source
+        assert nearest[1] is _brute_nearest(agents, source.pos, 2)[1]
+        source.step_complete = True
+
+    class TestAgent(core.SpatialAgent):
+        def __init__(self):
+            super().__init__(pos=np.random.uniform(0, 100, size=2))
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+
+    test_sim = core.Simulation()
+    agents = [TestAgent() for _ in range(300)]
+    test_sim.agents.add_many(agents)
+
+    test_sim.start()
+    for _ in range(3):
+        test_sim.step()
+    test_sim.end()
+
+    # The tree is built at most once per step.
+    assert len(builds) == len(set(builds)) == 3
+
+    # Outside of steps, changes are held in smaller trees rather than rebuilding.
+    for agent in agents:
+        agent.pos = agent.pos + 1
+
+    pos = np.array([50., 50.])
+    assert test_sim.indices.kdtree.nearest(pos, k=10) == _brute_nearest(agents, pos, 10)
+    assert len(builds) == 3
+
+@pytest.mark.parametrize("grid_size", [1, 3, 10])
+def test_grid_within(grid_size):
+    from adjsim import core
+
+    class OtherAgent(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    agents = [core.SpatialAgent(pos=np.random.uniform(-50, 50, size=2)) for _ in range(300)]
+    others = [OtherAgent(pos=np.random.uniform(-50, 50, size=2)) for _ in range(100)]
+    test_sim.agents.add_many(agents + others)
+    test_sim.indices.grid.initialize(grid_size)
+
+    for radius in (0.5, 4, 15, 200):
+        pos = np.random.uniform(-50, 50, size=2)
+        expected = [agent for agent in agents + others if np.sum((agent.pos - pos)**2) <= radius**2]
+        found = test_sim.indices.grid.get_within(pos, radius)
+
+        assert len(found) == len(expected)
+        assert set(found) == set(expected)
+        assert set(test_sim.indices.grid.get_within(pos, radius, type=OtherAgent)) == set(expected) & set(others)
+
+    # The query position's own cell is included.
+    assert test_sim.indices.grid.get_within(agents[0].pos, 0) == [agents[0]]
+
+    # Moved agents are found at their new positions.
+    agents[0].pos = np.array([1000., 1000.])
+    assert test_sim.indices.grid.get_within(np.array([1000.5, 1000.5]), 1) == [agents[0]]
+
+    with pytest.raises(TypeError):
+        test_sim.indices.grid.get_within((0, 0), 1)
+
+def test_grid_pairs_within():
+    from adjsim import core
+
+    class OtherAgent(core.SpatialAgent):
+        pass
+
+    def brute_force(agents, partners, radius):
+        positions = np.array([agent.pos for agent in agents])
+        partner_positions = np.array([partner.pos for partner in partners])
+        inside = np.sum((positions[:, np.newaxis] - partner_positions)**2, axis=2) <= radius**2
+        return {(agents[i], partners[j]) for i, j in zip(*np.nonzero(inside)) if agents[i] is not partners[j]}
+
+    test_sim = core.Simulation()
+    agents = [core.SpatialAgent(pos=np.random.uniform(-50, 50, size=2)) for _ in range(200)]
+    others = [OtherAgent(pos=np.random.uniform(-50, 50, size=2)) for _ in range(50)]
+    test_sim.agents.add_many(agents + others)
+
+    for radius in (0.5, 4, 15):
+        # Each unordered pair is obtained once.
+        pairs = test_sim.indices.grid.pairs_within(radius)
+        found = [frozenset(pair) for pair in pairs]
+        assert len(found) == len(set(found))
+        assert set(found) == {frozenset(pair) for pair in brute_force(agents + others, agents + others, radius)}
+
+        pairs = test_sim.indices.grid.pairs_within(radius, OtherAgent, core.SpatialAgent)
+        assert len(pairs) == len(pairs.i) == len(pairs.j)
+        assert set(pairs) == brute_force(others, agents + others, radius)
+        assert all(pair == (pairs.agents[i], pairs.partners[j]) for pair, i, j in zip(pairs, pairs.i, pairs.j))
+
+    # Positions are read from the population store when it is initialized.
+    test_sim.population.initialize()
+    others[0].pos = np.array([1000., 1000.])
+    agents[0].pos = np.array([1001., 1000.])
+    pairs = set(test_sim.indices.grid.pairs_within(1, OtherAgent, core.SpatialAgent))
+    assert (others[0], agents[0]) in pairs
+    assert pairs == brute_force(others, agents + others, 1)
+
+    with pytest.raises(ValueError):
+        test_sim.indices.grid.pairs_within(0)
+
+def test_cell_list_matches_dict():
+    from adjsim import core, index
+
+    positions = np.vstack((np.random.uniform(-30, 30, size=(300, 2)), np.random.randint(-5, 5, size=(100, 2))*3.))
+
+    simulations = []
+    for engine in (index.GridIndex.ENGINE_DICT, index.GridIndex.ENGINE_CELL_LIST):
+        test_sim = core.Simulation()
+        test_sim.test_agents = [core.SpatialAgent(pos=pos.copy()) for pos in positions]
+        test_sim.agents.add_many(test_sim.test_agents)
+        test_sim.indices.grid.initialize(3, engine=engine)
+        simulations.append(test_sim)
+
+    def query(test_sim, method, *args):
+        # Agents are identified by position, since each simulation holds its own agents.
+        return sorted(tuple(agent.pos) for agent in getattr(test_sim.indices.grid, method)(*args))
+
+    for _ in range(3):
+        for pos in np.vstack((np.random.uniform(-40, 40, size=(20, 2)), positions[::40])):
+            cell = np.floor(pos/3)*3
+            for method, args in (("get_inhabitants", (cell,)), ("get_neighbours", (pos,)),
+                                 ("get_inhabitants", (test_sim.indices.grid.get_neighbour_coordinates(pos),)),
+                                 ("get_within", (pos, 7))):
+                assert query(simulations[0], method, *args) == query(simulations[1], method, *args)
+
+        # Changes are reflected upon the next query.
+        for test_sim in simulations:
+            test_sim.agents.remove(test_sim.test_agents.pop(0))
+            for agent in test_sim.test_agents[:50]:
+                agent.pos = agent.pos + 1
+
+    # Sparse agents are numbered through a mapping rather than the bounding box.
+    for test_sim in simulations:
+        test_sim.agents.add(core.SpatialAgent(pos=np.array([1e6, 1e6])))
+
+    assert query(simulations[0], "get_within", np.array([1e6, 1e6]), 1) == \
+        query(simulations[1], "get_within", np.array([1e6, 1e6]), 1) == [(1e6, 1e6)]
+    assert simulations[1].indices.grid._cell_list.cell_mapping is not None
+
+@pytest.mark.parametrize("rebuild_per_step", [False, True])
+def test_cell_list_step(rebuild_per_step):
+    from adjsim import core, decision, index
+
+    def move(simulation, source):
+        # If rebuilding per step, agents observe the positions as of the first query of the step.
+        source.seen = len(simulation.indices.grid.get_within(np.array([0, 0]), 1))
+        source.x += 10
+        source.step_complete = True
+
+    class TestAgent(core.SpatialAgent):
+        def __init__(self):
+            super().__init__(pos=np.array([0, 0]))
+            self.seen = None
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+
+    test_sim = core.Simulation()
+    agents = [TestAgent() for _ in range(5)]
+    test_sim.agents.add_many(agents)
+    test_sim.indices.grid.initialize(1, engine=index.GridIndex.ENGINE_CELL_LIST, rebuild_per_step=rebuild_per_step)
+
+    test_sim.start()
+    test_sim.step()
+    if rebuild_per_step:
+        assert all(agent.seen == 5 for agent in agents)
+    else:
+        assert sorted(agent.seen for agent in agents) == [1, 2, 3, 4, 5]
+
+    test_sim.step()
+    assert all(agent.seen == 0 for agent in agents)
+    test_sim.end()
+
+    # Outside of steps, queries always reflect current positions.
+    agents[0].pos = np.array([0, 0])
+    assert test_sim.indices.grid.get_within(np.array([0, 0]), 1) == [agents[0]]
+
+    with pytest.raises(ValueError):
+        test_sim.indices.grid.initialize(1, engine="unknown")
+
+def test_counting_sort():
+    from adjsim import index
+
+    for num_keys in (1, 1000, 1 << 16, (1 << 16) + 1, 1 << 40):
+        keys = np.random.randint(0, num_keys, size=5000).astype(np.int64)
+        assert np.array_equal(index._counting_sort(keys, num_keys), np.argsort(keys, kind="mergesort"))
+
+def test_cell_list_population():
+    from adjsim import core, index
+
+    test_sim = core.Simulation()
+    test_sim.population.initialize()
+    test_sim.indices.grid.initialize(5, engine=index.GridIndex.ENGINE_CELL_LIST)
+
+    agents = [core.SpatialAgent(pos=np.array([i, 0])) for i in range(20)]
+    test_sim.agents.add_many(agents)
+
+    assert len(test_sim.indices.grid.get_inhabitants(np.array([0, 0]))) == 5
+    assert len(test_sim.indices.grid.get_neighbours(np.array([5, 0]))) == 10
+
+    test_sim.agents.discard_where(lambda agent: agent.x < 10)
+    agents[19].x = 0
+
+    assert test_sim.indices.grid.get_inhabitants(np.array([0, 0])) == [agents[19]]
+    assert len(test_sim.indices.grid.get_inhabitants(np.array([10, 0]))) == 5
+
+def test_stencil():
+    from adjsim import index
+
+    assert len(index.MOORE) == 8
+    assert set(index.MOORE) == {tuple(offset) for offset in index.GridIndex.NEIGHBOUR_ITERATION_LIST}
+    assert set(index.VON_NEUMANN) == {(1, 0), (0, 1), (-1, 0), (0, -1)}
+
+    assert len(index.Stencil.moore(2)) == 24
+    assert len(index.Stencil.moore(2, include_center=True)) == 25
+    assert len(index.Stencil.von_neumann(2)) == 12
+    assert list(index.Stencil([(0, 0), (2, 1)])) == [(0, 0), (2, 1)]
+
+@pytest.mark.parametrize("engine", ["dict", "cell_list"])
+def test_count_neighbours(engine):
+    from adjsim import core, index
+
+    class OtherAgent(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    agents = [core.SpatialAgent(pos=np.random.randint(-5, 5, size=2)*2.) for _ in range(100)]
+    others = [OtherAgent(pos=np.random.uniform(-10, 10, size=2)) for _ in range(50)]
+    test_sim.agents.add_many(agents + others)
+    test_sim.indices.grid.initialize(2, engine=engine)
+
+    stencils = [None, index.VON_NEUMANN, index.Stencil.moore(2, include_center=True), index.Stencil([(3, -1)])]
+    for pos in np.random.uniform(-10, 10, size=(20, 2)):
+        cell = np.floor(pos/2)
+        for stencil in stencils:
+            offsets = index.MOORE if stencil is None else stencil
+            expected = [agent for agent in agents + others
+                        if tuple(np.floor(agent.pos/2) - cell) in set(offsets)]
+
+            grid = test_sim.indices.grid
+            assert grid.count_neighbours(pos, stencil) == len(expected)
+            assert grid.count_neighbours(pos, stencil, type=OtherAgent) == len(set(expected) & set(others))
+            assert sorted(map(id, grid.iter_neighbours(pos, stencil))) == sorted(map(id, expected))
+            assert set(grid.iter_neighbours(pos, stencil, type=OtherAgent)) == set(expected) & set(others)
+
+        assert test_sim.indices.grid.count_neighbours(pos) == len(test_sim.indices.grid.get_neighbours(pos))
+
+    # Removed agents are not counted.
+    test_sim.agents.remove(agents[0])
+    assert test_sim.indices.grid.count_neighbours(agents[0].pos, index.Stencil([(0, 0)])) == \
+        len([agent for agent in agents[1:] + others if np.all(np.floor(agent.pos/2) == np.floor(agents[0].pos/2))])
+
+    with pytest.raises(TypeError):
+        test_sim.indices.grid.count_neighbours((0, 0))
@@ -0,0 +1,118 @@
+import sys
+import os
+import pytest
+
+import numpy as np
+
+from . import common
+
+def _spring(simulation, agents, positions, velocities):
+    return -positions
+
+def _oscillator(integrator):
+    from adjsim import core
+
+    class Body(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    body = Body(pos=np.array([1., 0.]))
+    body.vel = np.array([0., 0.])
+    test_sim.agents.add(body)
+    test_sim.integrators["oscillator"] = integrator
+
+    common.step_simulate_interpolation(test_sim)
+
+    # Energy is 0.5 at the start.
+    return abs(0.5*np.sum(body.pos**2) + 0.5*np.sum(body.vel**2) - 0.5), body
+
+def test_methods():
+    from adjsim import integration
+
+    euler_error, _ = _oscillator(integration.ExplicitEuler(0.1, acceleration=_spring))
+    symplectic_error, _ = _oscillator(integration.SemiImplicitEuler(0.1, acceleration=_spring))
+    verlet_error, body = _oscillator(integration.VelocityVerlet(0.1, acceleration=_spring))
+
+    assert verlet_error < symplectic_error < euler_error
+    assert np.allclose(body.pos, [np.cos(0.9), 0], atol=1e-3)
+    assert np.allclose(body.vel, [-np.sin(0.9), 0], atol=1e-3)
+
+    # Substeps trade cost for accuracy.
+    substep_error, _ = _oscillator(integration.ExplicitEuler(0.1, 10, acceleration=_spring))
+    assert substep_error < euler_error/5
+
+    assert integration.Leapfrog is integration.VelocityVerlet
+
+    with pytest.raises(ValueError):
+        integration.VelocityVerlet(0)
+
+    with pytest.raises(ValueError):
+        integration.VelocityVerlet(1, substeps=0)
+
+def test_interactions():
+    from adjsim import core, integration, interaction
+
+    class Body(core.SpatialAgent):
+        pass
+
+    class Marker(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    bodies = []
+    for pos, vel, mass in (([0., 0.], [0., -0.1], 10.), ([1., 0.], [0., 1.], 1.)):
+        body = Body(pos=np.array(pos))
+        body.vel = np.array(vel)
+        body.mass = mass
+        test_sim.agents.add(body)
+        bodies.append(body)
+
+    marker = Marker(pos=np.array([5., 5.]))
+    test_sim.agents.add(marker)
+
+    def batch_move_callback(agents):
+        batch_move_callback.calls.append(set(agents))
+    batch_move_callback.calls = []
+    test_sim.callbacks.agent_moved.register_batch(lambda agent: None, batch_move_callback)
+
+    test_sim.interactions["gravity"] = interaction.Interaction(interaction.InverseSquare(softening=0.1), Body)
+    test_sim.integrators["bodies"] = integration.VelocityVerlet(0.01, substeps=4, agent_type=Body)
+
+    common.step_simulate_interpolation(test_sim)
+
+    # Bodies move once per step, through a single batched notification. Other agents stay put.
+    assert batch_move_callback.calls == [set(bodies)]*common.INTERPOLATION_NUM_TIMESTEP
+    assert np.array_equal(marker.pos, [5., 5.])
+    assert not np.allclose(bodies[1].vel, [0., 1.])
+
+    # Momentum is conserved.
+    assert np.allclose(sum(body.mass*body.vel for body in bodies), [0., 0.])
+
+def test_population():
+    from adjsim import core, integration, utility
+
+    class Body(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    test_sim.population.initialize()
+    bodies = []
+    for i in range(10):
+        body = Body(pos=np.array([i, 0.]))
+        body.vel = np.array([0., i])
+        bodies.append(body)
+    test_sim.agents.add_many(bodies)
+
+    test_sim.integrators["bodies"] = integration.SemiImplicitEuler(0.5)
+    common.step_simulate_interpolation(test_sim)
+
+    expected = np.array([[i, 0.5*i*common.INTERPOLATION_NUM_TIMESTEP] for i in range(10)])
+    assert np.allclose([body.pos for body in bodies], expected)
+    assert np.allclose(test_sim.population.positions[[test_sim.population.slot(body) for body in bodies]],
+                       expected)
+
+    with pytest.raises(utility.IntegratorException):
+        test_sim.integrators["invalid"] = lambda simulation: None
+
+    del test_sim.integrators["bodies"]
+    assert len(test_sim.integrators) == 0
@@ -0,0 +1,185 @@
+import sys
+import os
+import pytest
+
+import numpy as np
+
+from . import common
+
+def _brute_force(kernel, agents, partners, cutoff=None):
+    result = np.zeros((len(agents), 2))
+    for row, agent in enumerate(agents):
+        for partner in partners:
+            delta = partner.pos - agent.pos
+            distance = np.sqrt(np.sum(delta**2))
+            if partner is agent or distance == 0 or (cutoff is not None and distance > cutoff):
+                continue
+
+            agent_attributes = {name: np.array([getattr(agent, name)]) for name in kernel.attributes}
+            partner_attributes = {name: np.array([getattr(partner, name)]) for name in kernel.attributes}
+            result[row] += kernel(delta[np.newaxis], np.array([distance]), agent_attributes, partner_attributes)[0]
+
+    return result
+
+def _populate(test_sim, agent_type, count):
+    agents = []
+    for _ in range(count):
+        agent = agent_type()
+        agent.pos = np.random.uniform(-50, 50, 2)
+        agent.mass = np.random.uniform(1, 10)
+        test_sim.agents.add(agent)
+        agents.append(agent)
+
+    return agents
+
+def test_broadcast():
+    from adjsim import core, interaction
+
+    class Body(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    agents = _populate(test_sim, Body, 100)
+
+    for kernel in (interaction.InverseSquare(), interaction.InverseSquare(-2., None, softening=1.),
+                   interaction.Spring(2., 5.), interaction.Repulsion(3., 1.)):
+        test_interaction = interaction.Interaction(kernel)
+        assert np.allclose(test_interaction.evaluate(test_sim, agents), _brute_force(kernel, agents, agents))
+
+    # Chunking does not affect the result.
+    kernel = interaction.InverseSquare()
+    expected = interaction.Interaction(kernel).evaluate(test_sim, agents)
+    interaction.Interaction.BROADCAST_CHUNK = 256
+    try:
+        assert np.allclose(interaction.Interaction(kernel).evaluate(test_sim, agents), expected)
+    finally:
+        interaction.Interaction.BROADCAST_CHUNK = 1 << 20
+
+def test_cutoff():
+    from adjsim import core, interaction
+
+    class Body(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    agents = _populate(test_sim, Body, 200)
+
+    kernel = interaction.Repulsion()
+    for cutoff in (1., 7.5, 200.):
+        test_interaction = interaction.Interaction(kernel, cutoff=cutoff)
+        assert np.allclose(test_interaction.evaluate(test_sim, agents),
+                           _brute_force(kernel, agents, agents, cutoff))
+
+    with pytest.raises(ValueError):
+        interaction.Interaction(kernel, cutoff=0)
+
+def test_kernels():
+    from adjsim import core, interaction
+
+    class Body(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    left = Body(pos=np.array([0., 0.]))
+    right = Body(pos=np.array([2., 0.]))
+    left.mass = 1.
+    right.mass = 4.
+    test_sim.agents.add(left)
+    test_sim.agents.add(right)
+    agents = [left, right]
+
+    result = interaction.Interaction(interaction.InverseSquare()).evaluate(test_sim, agents)
+    assert np.allclose(result, [[1., 0.], [-0.25, 0.]])
+
+    # Springs pull when stretched and push when compressed.
+    result = interaction.Interaction(interaction.Spring(1., 1.)).evaluate(test_sim, agents)
+    assert np.allclose(result, [[1., 0.], [-1., 0.]])
+    result = interaction.Interaction(interaction.Spring(1., 3.)).evaluate(test_sim, agents)
+    assert np.allclose(result, [[-1., 0.], [1., 0.]])
+
+    result = interaction.Interaction(interaction.Repulsion(8., 3.)).evaluate(test_sim, agents)
+    assert np.allclose(result, [[-1., 0.], [1., 0.]])
+
+    # Coincident agents exert no force upon one another.
+    right.pos = np.array([0., 0.])
+    result = interaction.Interaction(interaction.InverseSquare()).evaluate(test_sim, agents)
+    assert np.array_equal(result, np.zeros((2, 2)))
+
+def test_types():
+    from adjsim import core, interaction
+
+    class Heavy(core.SpatialAgent):
+        pass
+
+    class Light(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    heavy = _populate(test_sim, Heavy, 20)
+    light = _populate(test_sim, Light, 30)
+    kernel = interaction.InverseSquare()
+
+    # Light agents are attracted to heavy ones only, and heavy agents are unaffected.
+    test_interaction = interaction.Interaction(kernel, Light, Heavy)
+    result = test_interaction.evaluate(test_sim, heavy + light)
+    assert np.array_equal(result[:20], np.zeros((20, 2)))
+    assert np.allclose(result[20:], _brute_force(kernel, light, heavy))
+
+    test_interaction = interaction.Interaction(kernel, Light, Heavy, cutoff=30.)
+    result = test_interaction.evaluate(test_sim, heavy + light)
+    assert np.allclose(result[20:], _brute_force(kernel, light, heavy, 30.))
+
+    test_interaction = interaction.Interaction(kernel, Light, Heavy)
+
+    # By default, all agents of the agent type are evaluated.
+    assert np.allclose(test_interaction.evaluate(test_sim),
+                       _brute_force(kernel, list(test_sim.agents.of_type(Light)), heavy))
+
+    # Positions may be overridden, and partners among the agents follow them.
+    positions = np.array([agent.pos for agent in heavy + light]) + 1000.
+    result = test_interaction.evaluate(test_sim, heavy + light, positions)
+    for agent, pos in zip(heavy + light, positions):
+        agent.pos = pos
+    assert np.allclose(result[20:], _brute_force(kernel, light, heavy))
+
+def test_simulate():
+    from adjsim import core, interaction, utility
+
+    class Body(core.SpatialAgent):
+        pass
+
+    test_sim = core.Simulation()
+    agents = _populate(test_sim, Body, 50)
+    for agent in agents:
+        agent.vel = np.zeros(2)
+
+    def move(simulation):
+        acc = simulation.interactions.evaluate(agents)
+        for agent, agent_acc in zip(agents, acc):
+            agent.vel += agent_acc*0.01
+            agent.pos = agent.pos + agent.vel*0.01
+
+    test_sim.interactions["gravity"] = interaction.Interaction(interaction.InverseSquare(softening=1.))
+    test_sim.interactions["spring"] = interaction.Interaction(interaction.Spring(0.1, 10.), cutoff=20.)
+    test_sim.callbacks.simulation_step_started.register(move)
+
+    expected = (test_sim.interactions["gravity"].evaluate(test_sim, agents)
+                + test_sim.interactions["spring"].evaluate(test_sim, agents))
+    assert np.allclose(test_sim.interactions.evaluate(agents), expected)
+    assert np.allclose(test_sim.interactions.evaluate(list(test_sim.agents.of_type(core.SpatialAgent))),
+                       test_sim.interactions.evaluate())
+
+    with pytest.raises(utility.InteractionException):
+        test_sim.interactions["invalid"] = interaction.Spring()
+
+    del test_sim.interactions["spring"]
+    assert list(test_sim.interactions) == ["gravity"]
+
+    # Gravity conserves momentum, so the centre of mass stays put.
+    masses = np.array([agent.mass for agent in agents])
+    center = np.dot(masses, [agent.pos for agent in agents])/np.sum(masses)
+
+    common.step_simulate_interpolation(test_sim)
+
+    assert not np.allclose([agent.vel for agent in agents], 0)
+    assert np.allclose(np.dot(masses, [agent.pos for agent in agents])/np.sum(masses), center)
@@ -0,0 +1,128 @@
+import sys
+import os
+import pytest
+
+import numpy as np
+
+from . import common
+
+GLIDER = [(1, 0), (2, 1), (0, 2), (1, 2), (2, 2)]
+
+def _brute_step(live, birth, survive):
+    counts = {}
+    for x, y in live:
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if (dx, dy) != (0, 0):
+                    counts[(x + dx, y + dy)] = counts.get((x + dx, y + dy), 0) + 1
+
+    return {cell for cell, count in counts.items() if count in (survive if cell in live else birth)}
+
+def _live(test_lattice):
+    return {tuple(cell) for cell in test_lattice.cells().tolist()}
+
+def test_glider():
+    from adjsim import lattice
+
+    test_lattice = lattice.Lattice()
+    test_lattice.set(GLIDER)
+
+    assert len(test_lattice) == 5
+
+    for _ in range(4):
+        test_lattice.step()
+
+    assert _live(test_lattice) == {(x + 1, y + 1) for x, y in GLIDER}
+
+    # The window follows the glider rather than growing without bound.
+    for _ in range(400):
+        test_lattice.step()
+
+    assert _live(test_lattice) == {(x + 101, y + 101) for x, y in GLIDER}
+    assert max(test_lattice.state.shape) < 100
+
+def test_random():
+    from adjsim import lattice
+
+    live = {tuple(cell) for cell in np.random.randint(-15, 15, size=(300, 2)).tolist()}
+
+    for rule in ("B3/S23", "B36/S23", "B2/S"):
+        test_lattice = lattice.Lattice(lattice.LifeRule.from_string(rule))
+        test_lattice.set(list(live))
+
+        rule = lattice.LifeRule.from_string(rule)
+        expected = live
+        for _ in range(10):
+            test_lattice.step()
+            expected = _brute_step(expected, rule.birth, rule.survive)
+            assert _live(test_lattice) == expected
+
+def test_boundary():
+    from adjsim import lattice, index
+
+    # Gliders wrap around wrapped lattices.
+    test_lattice = lattice.Lattice(boundary=lattice.BOUNDARY_WRAP, shape=(8, 8))
+    test_lattice.set(GLIDER)
+    for _ in range(32):
+        test_lattice.step()
+
+    assert _live(test_lattice) == set(GLIDER)
+    assert test_lattice.get((9, 8)) == test_lattice.get((1, 0)) == 1
+
+    # Gliders settle into a block at the edge of fixed lattices.
+    test_lattice = lattice.Lattice(boundary=lattice.BOUNDARY_FIXED, shape=(8, 8))
+    test_lattice.set(GLIDER)
+    for _ in range(32):
+        test_lattice.step()
+
+    assert _live(test_lattice) == {(6, 6), (6, 7), (7, 6), (7, 7)}
+    assert test_lattice.get((9, 9)) == 0
+
+    with pytest.raises(IndexError):
+        test_lattice.set([(8, 0)])
+
+    with pytest.raises(ValueError):
+        lattice.Lattice(boundary=lattice.BOUNDARY_WRAP)
+
+    with pytest.raises(ValueError):
+        lattice.LifeRule.from_string("B3")
+
+    # Other stencils.
+    test_lattice = lattice.Lattice(stencil=index.VON_NEUMANN, boundary=lattice.BOUNDARY_WRAP, shape=(5, 5))
+    test_lattice.set([(2, 2)])
+    assert np.array_equal(test_lattice.neighbour_counts()[1:4, 1:4], [[0, 1, 0], [1, 0, 1], [0, 1, 0]])
+
+def test_simulate():
+    from adjsim import lattice, analysis
+
+    test_sim = lattice.LatticeSimulation()
+    test_sim.lattice.set(GLIDER)
+    test_sim.trackers["count"] = analysis.LatticeCountTracker()
+
+    frame = test_sim.snapshots.full()
+    assert len(frame) == 5
+
+    test_sim.start()
+    for _ in range(common.INTERPOLATION_NUM_TIMESTEP):
+        test_sim.step()
+        frame = frame.merge(test_sim.snapshots.delta())
+    test_sim.end()
+
+    # Frames follow the lattice.
+    assert test_sim.lattice.time == common.INTERPOLATION_NUM_TIMESTEP
+    assert test_sim.trackers["count"].data == [5]*(common.INTERPOLATION_NUM_TIMESTEP + 1)
+    assert sorted(zip(frame.records["x"], frame.records["y"])) == sorted(_live(test_sim.lattice))
+    assert np.all(frame.records["id"] < 0)
+
+def test_simulate_visual():
+    from adjsim import lattice, core
+
+    test_sim = lattice.VisualLatticeSimulation(lattice.Lattice(cell_size=5))
+    test_sim.lattice.set(GLIDER)
+    test_sim.agents.add(core.VisualAgent())
+    test_sim._wait_on_visual_init = 0
+
+    common.step_simulate_interpolation(test_sim)
+
+    assert len(test_sim.lattice) == 5
+    assert len(test_sim.snapshots.full()) == 6
@@ -0,0 +1,206 @@
+import sys
+import os
+import pytest
+
+import numpy as np
+
+from . import common
+
+def test_positions_view():
+    from adjsim import core
+
+    test_sim = core.Simulation()
+    agents = [core.SpatialAgent(pos=np.array([i, -i])) for i in range(40)]
+    for agent in agents[:20]:
+        test_sim.agents.add(agent)
+
+    test_sim.population.initialize(capacity=4)
+
+    for agent in agents[20:]:
+        test_sim.agents.add(agent)
+
+    assert len(test_sim.population) == 40
+    assert test_sim.population.positions.shape == (40, 2)
+    assert sorted(test_sim.population.positions[:, 0]) == list(range(40))
+
+    for agent in agents:
+        assert not agent.pos.flags.writeable
+        assert np.shares_memory(agent.pos, test_sim.population.positions)
+
+    with pytest.raises(ValueError):
+        test_sim.population.positions[0, 0] = 1
+
+    agents[3].pos = np.array([100, 200])
+    assert np.array_equal(test_sim.population.positions[test_sim.population.slot(agents[3])], [100, 200])
+
+def test_remove_keeps_rows_dense():
+    from adjsim import core
+
+    test_sim = core.Simulation()
+    test_sim.population.initialize()
+
+    agents = [core.SpatialAgent(pos=np.array([i, 0])) for i in range(10)]
+    for agent in agents:
+        test_sim.agents.add(agent)
+
+    test_sim.agents.remove(agents[2])
+    test_sim.agents.remove(agents[9])
+
+    assert len(test_sim.population) == 8
+    assert agents[2] not in test_sim.population
+    assert np.array_equal(agents[2].pos, [2, 0])
+
+    for agent in test_sim.population.agents:
+        assert np.array_equal(test_sim.population.positions[test_sim.population.slot(agent)], agent.pos)
+
+    assert sorted(test_sim.population.positions[:, 0]) == [0, 1, 3, 4, 5, 6, 7, 8]
+
+def test_registered_attribute():
+    from adjsim import core
+
+    class TestAgent(core.SpatialAgent):
+        def __init__(self, calories):
+            super().__init__()
+            self.calories = calories
+
+    test_sim = core.Simulation()
+    test_sim.population.register_attribute("calories", dtype=np.int_)
+    test_sim.population.initialize()
+
+    agents = [TestAgent(i) for i in range(5)]
+    for agent in agents:
+        test_sim.agents.add(agent)
+
+    agents[1].calories += 10
+    assert agents[1].calories == 11
+    assert sorted(test_sim.population.attribute("calories")) == [0, 2, 3, 4, 11]
+
+    # Data is restored onto removed agents.
+    test_sim.agents.remove(agents[1])
+    assert agents[1].calories == 11
+    assert "calories" in agents[1].__dict__
+    assert sorted(test_sim.population.attribute("calories")) == [0, 2, 3, 4]
+
+    # Agents without the attribute are masked.
+    other = core.SpatialAgent()
+    test_sim.agents.add(other)
+    assert not hasattr(other, "calories")
+    assert test_sim.population.attribute_mask("calories").sum() == 4
+
+def test_simulate_with_store():
+    from adjsim import core, decision
+
+    def move(env, source):
+        source.x += 1
+
+    class TestAgent(core.SpatialAgent):
+        def __init__(self):
+            super().__init__(pos=np.array([0., 0.]))
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+
+    test_sim = core.Simulation()
+    test_sim.population.initialize()
+    test_sim.indices.grid.initialize(1)
+    for _ in range(3):
+        test_sim.agents.add(TestAgent())
+
+    common.step_simulate_interpolation(test_sim)
+
+    assert np.array_equal(test_sim.population.positions[:, 0], [common.INTERPOLATION_NUM_TIMESTEP]*3)
+    assert len(test_sim.indices.grid.get_inhabitants(np.array([common.INTERPOLATION_NUM_TIMESTEP, 0]))) == 3
+
+def test_attribute_descriptor_lifetime():
+    from adjsim import core, population
+
+    class TestAgent(core.SpatialAgent):
+        def __init__(self):
+            super().__init__()
+            self.calories = 1
+
+    outside = TestAgent()
+
+    test_sim = core.Simulation()
+    test_sim.population.register_attribute("calories")
+    test_sim.population.initialize()
+
+    # Descriptors are only installed while agents of the class are stored, and are transparent otherwise.
+    assert not "calories" in TestAgent.__dict__
+    agents = [TestAgent() for _ in range(2)]
+    test_sim.agents.add_many(agents)
+    assert isinstance(TestAgent.__dict__["calories"], population._StoredAttribute)
+
+    outside.calories = 5
+    assert outside.__dict__["calories"] == 5
+
+    other_sim = core.Simulation()
+    other_sim.population.register_attribute("calories")
+    other_sim.population.initialize()
+    other = TestAgent()
+    other_sim.agents.add(other)
+
+    for agent in agents:
+        test_sim.agents.remove(agent)
+
+    # The class is restored once no store holds its agents.
+    assert isinstance(TestAgent.__dict__["calories"], population._StoredAttribute)
+    other_sim.agents.remove(other)
+    assert not "calories" in TestAgent.__dict__
+    assert [agent.calories for agent in agents + [other, outside]] == [1, 1, 1, 5]
+
+def test_attribute_dtype():
+    from adjsim import core
+
+    class TestAgent(core.SpatialAgent):
+        def __init__(self, calories):
+            super().__init__()
+            self.calories = calories
+            self.calories_fixed = calories
+
+    test_sim = core.Simulation()
+    test_sim.population.register_attribute("calories")
+    test_sim.population.register_attribute("calories_fixed", dtype=np.int32)
+    test_sim.population.initialize()
+
+    agents = [TestAgent(i) for i in range(3)]
+    test_sim.agents.add_many(agents)
+
+    # Attributes keep the type of their values, and are widened rather than truncated.
+    assert test_sim.population.attribute("calories").dtype.kind == "i"
+    assert type(agents[0].calories) is int
+
+    agents[1].calories = 2.5
+    assert test_sim.population.attribute("calories").dtype == np.float64
+    assert agents[1].calories == 2.5
+    assert agents[2].calories == 2
+
+    with pytest.raises(TypeError):
+        agents[0].calories = "many"
+
+    # Given dtypes are kept.
+    agents[0].calories_fixed = 3.7
+    assert test_sim.population.attribute("calories_fixed").dtype == np.int32
+    assert agents[0].calories_fixed == 3
+
+def test_position_view_aliasing():
+    from adjsim import core
+
+    test_sim = core.Simulation()
+    test_sim.population.initialize()
+
+    agents = [core.SpatialAgent(pos=np.array([i, 0])) for i in range(3)]
+    test_sim.agents.add_many(agents)
+
+    # A held position view follows the agent's moves.
+    held = agents[2].pos
+    agents[2].pos = np.array([5, 5])
+    assert np.array_equal(held, [5, 5])
+
+    # Once the store compacts, the held view may refer to another agent's row, while a copy is kept intact.
+    kept = agents[2].pos.copy()
+    test_sim.agents.remove(agents[0])
+    added = core.SpatialAgent(pos=np.array([9, 9]))
+    test_sim.agents.add(added)
+
+    assert np.array_equal(held, added.pos)
+    assert np.array_equal(agents[2].pos, kept)
@@ -0,0 +1,119 @@
+import sys
+import os
+import pytest
+
+import numpy as np
+
+from . import common
+
+def _build_simulation():
+    from adjsim import core, decision, analysis
+
+    def move(simulation, source):
+        source.x += 1
+        source.step_complete = True
+
+    def wait(simulation, source):
+        source.step_complete = True
+
+    class TestAgent(core.SpatialAgent):
+        def __init__(self):
+            super().__init__(pos=np.array([0., 0.]))
+            self.decision = decision.RandomRepeatedCastDecision()
+            self.actions["move"] = move
+            self.actions["wait"] = wait
+
+    test_sim = core.Simulation()
+    test_sim.trackers["count"] = analysis.AgentCountTracker()
+    test_sim.indices.grid.initialize(1)
+    for _ in range(5):
+        test_sim.agents.add(TestAgent())
+
+    return test_sim
+
+def test_profiler_records():
+    test_sim = _build_simulation()
+    test_sim.profiler.enable()
+
+    common.step_simulate_interpolation(test_sim)
+
+    profiler = test_sim.profiler
+    num_steps = common.INTERPOLATION_NUM_TIMESTEP
+
+    assert profiler.timings("decision")["RandomRepeatedCastDecision"].calls == 5*num_steps
+    assert sum(timing.calls for timing in profiler.timings("action").values()) == 5*num_steps
+    assert profiler.timings("tracker")["count"].calls == num_steps + 1
+    assert profiler.timings("callback")["agent_moved: GridIndex._update"].calls == \
+        profiler.timings("action")["move"].calls
+
+    assert len(profiler.steps) == num_steps
+    assert all(step["agents"] == 5 for step in profiler.steps)
+    assert [step["time"] for step in profiler.steps] == list(range(1, num_steps + 1))
+
+    data = profiler.as_dict()
+    assert data["decision"]["RandomRepeatedCastDecision"]["calls"] == 5*num_steps
+    assert len(data["steps"]) == num_steps
+
+    report = profiler.report()
+    assert "RandomRepeatedCastDecision" in report
+    assert "agent_moved: GridIndex._update" in report
+
+    profiler.reset()
+    assert profiler.steps == []
+    assert profiler.timings("action") == {}
+
+def test_profiler_disable():
+    from adjsim import core, profiling
+
+    test_sim = _build_simulation()
+    agent = next(iter(test_sim.agents))
+    move = agent.actions["move"]
+
+    test_sim.profiler.enable()
+    assert isinstance(agent.actions["move"], profiling._ProfiledCallable)
+
+    # Agents added while enabled are also profiled.
+    new_agent = core.SpatialAgent()
+    new_agent.actions["move"] = move
+    test_sim.agents.add(new_agent)
+    assert isinstance(new_agent.actions["move"], profiling._ProfiledCallable)
+
+    test_sim.profiler.disable()
+    assert agent.actions["move"] is move
+    assert new_agent.actions["move"] is move
+    assert not test_sim.callbacks.agent_added.is_registered(test_sim.profiler._wrap_agent)
+
+    common.step_simulate_interpolation(test_sim)
+    assert test_sim.profiler.steps == []
+    assert test_sim.profiler.timings("decision") == {}
+
+def test_profiler_functional_decision():
+    from adjsim import core, decision
+
+    def move(simulation, source):
+        source.step_complete = True
+
+    def perception(simulation, source):
+        return 0
+
+    def loss(simulation, source):
+        return 0
+
+    test_sim = core.Simulation()
+    test_decision = decision.QLearningDecision(perception=perception, loss=loss, simulation=test_sim,
+                                               input_file_name=None, output_file_name=None)
+
+    agent = core.Agent()
+    agent.decision = test_decision
+    agent.actions["move"] = move
+    test_sim.agents.add(agent)
+
+    test_sim.profiler.enable()
+    common.step_simulate_interpolation(test_sim)
+
+    assert test_sim.profiler.timings("perception")["QLearningDecision"].calls == common.INTERPOLATION_NUM_TIMESTEP
+    assert test_sim.profiler.timings("loss")["QLearningDecision"].calls > 0
+
+    test_sim.profiler.disable()
+    assert test_decision.perception is perception
+    assert test_decision.loss is loss
@@ -0,0 +1,194 @@
+import sys
+import os
+import pytest
+
+import numpy as np
+
+from . import common
+
+def _state(frame):
+    """Obtain the content of a snapshot, independent of record ids and order."""
+    return sorted((float(record["x"]), float(record["y"]), float(record["size"]), frame.palette[record["color"]],
+                   int(record["style"])) for record in frame.records)
+
+def _build_simulation():
+    from adjsim import core, decision, color
+
+    def move(simulation, source):
+        source.x += 1
+        source.color = color.COLORS[simulation.time % len(color.COLORS)]
+        source.step_complete = True
+
+    def divide(simulation, source):
+        if simulation.time % 3 == 0:
+            simulation.agents.add(TestAgent(source.x, source.y + 1))
+        source.step_complete = True
+
+    def die(simulation, source):
+        if simulation.time % 4 == 0:
+            simulation.agents.remove(source)
+        source.step_complete = True
+
+    class TestAgent(core.VisualAgent):
+        def __init__(self, x, y):
+            super().__init__(pos=np.array([x, y], dtype=float))
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+            self.actions["divide"] = divide
+            self.actions["die"] = die
+
+    test_sim = core.Simulation()
+    test_sim.agents.add_many(TestAgent(i, 0) for i in range(5))
+    return test_sim
+
+def test_record(tmpdir):
+    from adjsim import recording
+
+    path = str(tmpdir.join("run"))
+    test_sim = _build_simulation()
+
+    # Small chunks and keyframe intervals exercise chunk boundaries and reconstruction from keyframes.
+    recorder = recording.Recorder(path, keyframe_interval=4, chunk_size=7)
+    recorder.attach(test_sim)
+
+    states = [_state(test_sim.snapshots.full())]
+    test_sim.start()
+    for _ in range(common.INTERPOLATION_NUM_TIMESTEP):
+        test_sim.step()
+        states.append(_state(test_sim.snapshots.full()))
+    test_sim.end()
+    recorder.close()
+
+    assert recorder.num_steps == common.INTERPOLATION_NUM_TIMESTEP + 1
+    assert not recorder.attached
+
+    # Steps may be read in any order.
+    replay = recording.Recording(path)
+    assert len(replay) == common.INTERPOLATION_NUM_TIMESTEP + 1
+    assert list(replay.times) == list(range(common.INTERPOLATION_NUM_TIMESTEP + 1))
+    for index in reversed(range(len(replay))):
+        assert _state(replay.frame(index)) == states[index]
+
+    # Deltas applied to a frame yield later frames.
+    for since in range(len(replay) - 1):
+        for index in range(since + 1, len(replay)):
+            assert _state(replay.frame(since).merge(replay.delta(index, since))) == states[index]
+
+    # Record ids map to agent ids.
+    ids = set(replay.frame(0).records["id"].tolist())
+    assert len({replay.agent_ids[key] for key in ids}) == 5
+
+    with pytest.raises(IndexError):
+        replay.frame(len(replay))
+
+def test_record_qcolor(tmpdir):
+    from adjsim import core, recording
+    from PyQt5 import QtGui
+
+    path = str(tmpdir.join("run"))
+    test_sim = core.Simulation()
+    test_sim.agents.add(core.VisualAgent(color=QtGui.QColor(10, 20, 30)))
+
+    recorder = recording.Recorder(path)
+    recorder.attach(test_sim)
+    recorder.close()
+
+    # Colors are stored in a form that QColor parses back.
+    palette = recording.Recording(path).frame(0).palette
+    assert list(palette) == ["#ff0a141e"]
+    assert QtGui.QColor(palette[0]) == QtGui.QColor(10, 20, 30)
+
+def test_record_detach(tmpdir):
+    from adjsim import recording
+
+    path = str(tmpdir.join("run"))
+    test_sim = _build_simulation()
+
+    recorder = recording.Recorder(path)
+    recorder.attach(test_sim)
+    common.step_simulate_interpolation(test_sim)
+    recorder.detach()
+    common.step_simulate_interpolation(test_sim)
+
+    # Steps after detaching are not recorded, and the recorder no longer tracks agents.
+    assert recorder.num_steps == common.INTERPOLATION_NUM_TIMESTEP + 1
+    assert not test_sim.callbacks.agent_moved.is_registered(recorder._encoder._on_changed)
+
+    # Recordings are readable before they are closed.
+    assert len(recording.Recording(path)) == recorder.num_steps
+    recorder.close()
+
+def test_record_invalid(tmpdir):
+    from adjsim import recording, utility
+
+    path = str(tmpdir.join("run"))
+    recording.Recorder(path).close()
+
+    # Recordings are never overwritten.
+    with pytest.raises(utility.RecordingException):
+        recording.Recorder(path)
+
+    with pytest.raises(utility.RecordingException):
+        recording.Recording(str(tmpdir.join("missing")))
+
+    with pytest.raises(ValueError):
+        recording.Recorder(str(tmpdir.join("other")), keyframe_interval=0)
+
+def test_replay_export(tmpdir):
+    from adjsim import recording, visual
+
+    path = str(tmpdir.join("run"))
+    test_sim = _build_simulation()
+
+    recorder = recording.Recorder(path)
+    recorder.attach(test_sim)
+    common.step_simulate_interpolation(test_sim)
+    recorder.close()
+
+    # Frames cover speed/frame_rate steps each.
+    for batched in (False, True):
+        output = str(tmpdir.join("frames_{}".format(batched)))
+        recording.main([path, "--speed", "60", "--start", "2", "--output", output, "--frame-size", "100", "100"]
+                       + (["--batched"] if batched else []))
+        assert len(os.listdir(output)) == 4
+
+def test_replay_player(tmpdir):
+    from adjsim import recording, visual
+    from PyQt5 import QtCore, QtGui, QtTest
+
+    path = str(tmpdir.join("run"))
+    test_sim = _build_simulation()
+
+    recorder = recording.Recorder(path)
+    recorder.attach(test_sim)
+    common.step_simulate_interpolation(test_sim)
+    recorder.close()
+
+    replay = recording.Recording(path)
+
+    app = visual.application()
+    view = visual.BatchedView(QtCore.QRect(0, 0, 300, 300), QtCore.QSemaphore(0))
+    player = visual.ReplayPlayer(view, replay, speed=60, start=1)
+    assert player.index == 1
+
+    # Steps advance at the given speed until the end is reached.
+    player.advance()
+    assert player.index == 3
+    for _ in range(10):
+        player.advance()
+    assert player.index == len(replay) - 1
+    assert player.paused
+
+    # Seeking.
+    QtTest.QTest.keyClick(view, QtCore.Qt.Key_Home)
+    assert player.index == 0
+    QtTest.QTest.keyClick(view, QtCore.Qt.Key_Right, QtCore.Qt.ShiftModifier)
+    assert player.index == len(replay) - 1
+    QtTest.QTest.keyClick(view, QtCore.Qt.Key_Left)
+    assert player.index == len(replay) - 2
+    QtTest.QTest.keyClick(view, QtCore.Qt.Key_Up)
+    assert player.speed == 120
+
+    player.close()
+    view.clear_items()
+    view.close()
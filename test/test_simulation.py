@@ -2,6 +2,7 @@ import sys
 import os
 import pytest
 import random
+import time
 
 import numpy as np
 
@@ -87,6 +88,164 @@ def test_visual_color():
 
     common.step_simulate_interpolation(test_sim)
 
+def test_visual_decoupled():
+    from adjsim import core, utility, decision
+
+    def move(env, source):
+        source.x += 10
+
+    class TestAgent(core.VisualAgent):
+        def __init__(self, x, y):
+            super().__init__(pos=np.array([x, y]))
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+
+    test_sim = core.VisualSimulation()
+    test_sim.decoupled = True
+    test_sim.frame_rate = 1000
+    for i in range(5):
+        test_sim.agents.add(TestAgent(0, 10*i))
+
+    # Coupled simulations take at least one animation duration per step.
+    start = time.perf_counter()
+    test_sim.simulate(50)
+    assert time.perf_counter() - start < 5
+
+    assert test_sim.time == 50
+    assert test_sim.dropped_frames <= 50
+    assert not hasattr(test_sim, "_presenter")
+
+def test_visual_render_interval():
+    from adjsim import core, utility, decision
+
+    def move(env, source):
+        source.x += 10
+
+    class TestAgent(core.VisualAgent):
+        def __init__(self):
+            super().__init__(pos=np.array([0, 0]))
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+
+    test_sim = core.VisualSimulation()
+    test_sim._wait_on_visual_init = 0
+    test_sim.render_interval = 3
+    test_sim.agents.add(TestAgent())
+
+    common.step_simulate_interpolation(test_sim)
+    assert test_sim.time == common.INTERPOLATION_NUM_TIMESTEP
+
+    test_sim.render_interval = 0
+    with pytest.raises(ValueError):
+        common.step_simulate_interpolation(test_sim)
+
+def test_visual_batched():
+    from adjsim import core, utility, decision, color
+
+    def move(env, source):
+        source.x += 10
+        source.color = color.RED_DARK
+
+    class TestAgent(core.VisualAgent):
+        def __init__(self, x, y):
+            super().__init__(pos=np.array([x, y]))
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+
+    test_sim = core.VisualSimulation()
+    test_sim._wait_on_visual_init = 0
+    test_sim.batched = True
+    for i in range(100):
+        test_sim.agents.add(TestAgent(i, i))
+
+    common.step_simulate_interpolation(test_sim)
+    assert test_sim.time == common.INTERPOLATION_NUM_TIMESTEP
+
+    test_sim.decoupled = True
+    test_sim.frame_rate = 1000
+    test_sim.simulate(20)
+    assert test_sim.time == 20
+
+def test_visual_batched_paint():
+    from adjsim import core, visual, color
+    from PyQt5 import QtCore, QtGui
+
+    app = visual.application()
+    view = visual.BatchedView(QtCore.QRect(0, 0, 300, 300), QtCore.QSemaphore(0))
+    view.animation_duration = 0
+
+    test_sim = core.Simulation()
+    large = core.VisualAgent(pos=np.array([-50., -50.]), size=20, color=color.RED_DARK)
+    small = core.VisualAgent(pos=np.array([50., 50.]), size=1, color=color.GREEN)
+    hidden = core.VisualAgent(pos=np.array([1000., 1000.]), size=20, color=color.RED_DARK)
+    test_sim.agents.add_many([large, small, hidden])
+
+    view.update(test_sim.snapshots.full())
+    assert not view.is_animating()
+    assert view.update_semaphore.available() == 1
+
+    # Large agents are drawn as ellipses, small ones as points, and agents outside the viewport are culled.
+    image = view.grab().toImage()
+    center = view.world_to_screen(np.array([[-40., -40.], [50., 50.]])).astype(int)
+    assert QtGui.QColor(image.pixel(*center[0])) == QtGui.QColor(color.RED_DARK)
+    assert QtGui.QColor(image.pixel(*center[1])) == QtGui.QColor(color.GREEN)
+
+    # Ellipses beyond the budget are stamped.
+    view.ellipse_budget = 0
+    image = view.grab().toImage()
+    assert QtGui.QColor(image.pixel(*center[0])) == QtGui.QColor(color.RED_DARK)
+    assert QtGui.QColor(image.pixel(*center[1])) == QtGui.QColor(color.GREEN)
+
+    view.clear_items()
+    view.close()
+
+def test_visual_export(tmpdir):
+    from adjsim import core, utility, decision, color
+    from PyQt5 import QtGui
+
+    def move(env, source):
+        source.x += 10
+
+    class TestAgent(core.VisualAgent):
+        def __init__(self, x, y):
+            super().__init__(pos=np.array([x, y]), size=20, color=color.RED_DARK)
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+
+    for batched in (False, True):
+        path = str(tmpdir.join("batched" if batched else "items"))
+
+        test_sim = core.VisualSimulation()
+        test_sim.batched = batched
+        test_sim.output = path
+        test_sim.frame_size = (200, 100)
+        test_sim.render_interval = 2
+        test_sim.agents.add(TestAgent(-100, -10))
+
+        # Frames are exported across steps until the simulation ends.
+        test_sim.start()
+        test_sim.step(3)
+        test_sim.step(3)
+        test_sim.end()
+
+        frames = sorted(os.listdir(path))
+        assert frames == ["frame_{:06d}.png".format(i) for i in range(4)]
+
+        image = QtGui.QImage(os.path.join(path, frames[-1]))
+        assert (image.width(), image.height()) == (200, 100)
+        assert QtGui.QColor(color.RED_DARK).rgb() in {image.pixel(x, y) for x in range(200) for y in range(100)}
+
+def test_visual_export_invalid(tmpdir, monkeypatch):
+    from adjsim import core, utility
+
+    test_sim = core.VisualSimulation()
+    test_sim.output = str(tmpdir.join("video.mp4"))
+
+    # Video export requires ffmpeg.
+    monkeypatch.setenv("PATH", "")
+    with pytest.raises(utility.ExportException):
+        test_sim.simulate(1)
+
 def test_visual_order():
     from adjsim import core, utility, decision
 
@@ -124,4 +283,271 @@ def test_visual_order():
     common.step_simulate_interpolation(test_sim)
 
     assert order_log == [i for i in range(5)]*common.INTERPOLATION_NUM_TIMESTEP
-   
\ No newline at end of file
+   
+def test_headless_import():
+    import subprocess
+
+    # Run in a fresh interpreter so that modules imported by other tests do not interfere.
+    script = "import sys, adjsim; from adjsim import core; core.Simulation().simulate(1); " \
+             "assert 'PyQt5' not in sys.modules; assert 'matplotlib' not in sys.modules"
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    subprocess.check_call([sys.executable, "-c", script], cwd=repo_root)
+
+def test_order_change_mid_step():
+    from adjsim import core, decision
+
+    step_log = []
+
+    def log(env, source):
+        step_log.append(source.name)
+
+    def pass_turn(env, source):
+        # Mimics the tag example: the agent stepping last hands its order to another agent.
+        step_log.append(source.name)
+        if source.order == 1:
+            source.order = 0
+            env.first.order = 1
+
+    class TestAgent(core.Agent):
+        def __init__(self, name, order, action):
+            super().__init__()
+            self.name = name
+            self.order = order
+            self.actions["act"] = action
+            self.decision = decision.RandomSingleCastDecision()
+
+    test_sim = core.Simulation()
+    test_sim.first = TestAgent("a", 0, log)
+    test_sim.agents.add(test_sim.first)
+    test_sim.agents.add(TestAgent("b", 0, log))
+    test_sim.agents.add(TestAgent("c", 1, pass_turn))
+
+    test_sim.start()
+    test_sim.step()
+    assert step_log == ["a", "b", "c"]
+
+    step_log.clear()
+    test_sim.step()
+    assert step_log == ["b", "c", "a"]
+    test_sim.end()
+
+def test_order_schedule_add_remove():
+    from adjsim import core
+
+    test_sim = core.Simulation()
+    agents = [core.Agent() for _ in range(6)]
+    for i, agent in enumerate(agents):
+        agent.order = i % 3
+        test_sim.agents.add(agent)
+
+    assert test_sim._schedule.snapshot() == (agents[0], agents[3], agents[1], agents[4], agents[2], agents[5])
+
+    # The step order is cached until the schedule changes.
+    snapshot = test_sim._schedule.snapshot()
+    buckets = test_sim._schedule.snapshot_buckets()
+    agents[1].order = 1
+    assert test_sim._schedule.snapshot() is snapshot
+    assert test_sim._schedule.snapshot_buckets() is buckets
+
+    test_sim.agents.remove(agents[3])
+    agents[0].order = 2
+    agents[5].order = -1
+
+    assert test_sim._schedule.snapshot() == (agents[5], agents[1], agents[4], agents[2], agents[0])
+    assert test_sim._schedule.snapshot_buckets() == ((agents[5],), (agents[1], agents[4]), (agents[2], agents[0]))
+    assert len(test_sim._schedule) == len(test_sim.agents)
+
+def test_deferral_step():
+    from adjsim import core, decision
+
+    def cull(simulation, source):
+        # Iterating over the live suite is safe while changes are deferred.
+        for agent in simulation.agents:
+            if agent is not source and agent._exists:
+                simulation.agents.remove(agent)
+                simulation.agents.add(core.Agent())
+
+        assert simulation.agents.num_pending > 0
+        source.step_complete = True
+
+    def on_added(agents):
+        on_added.calls.append(len(agents))
+    on_added.calls = []
+
+    test_sim = core.Simulation()
+    test_sim.agents.deferral = test_sim.agents.DEFER_STEP
+    test_sim.callbacks.agent_added.register_batch(lambda agent: None, on_added)
+
+    culler = core.Agent()
+    culler.decision = decision.RandomSingleCastDecision()
+    culler.actions["cull"] = cull
+    test_sim.agents.add(culler)
+
+    victims = [core.Agent() for _ in range(5)]
+    test_sim.agents.add_many(victims)
+
+    test_sim.start()
+    test_sim.step()
+
+    # Removed agents are marked immediately, and all changes are applied as one batch per kind.
+    assert all(not agent._exists for agent in victims)
+    assert not any(agent in test_sim.agents for agent in victims)
+    assert len(test_sim.agents) == 6
+    assert test_sim.agents.num_pending == 0
+    assert on_added.calls == [5, 5]
+
+    # Outside of a step, changes are immediate.
+    test_sim.agents.add(core.Agent())
+    assert len(test_sim.agents) == 7
+
+    test_sim.end()
+
+def test_deferral_request_order():
+    from adjsim import core, decision
+
+    def shuffle(simulation, source):
+        # Re-adding an agent cancels its queued removal, while removing an added agent cancels the addition.
+        simulation.agents.remove(shuffle.kept)
+        simulation.agents.add(shuffle.kept)
+        simulation.agents.add(shuffle.dropped)
+        simulation.agents.discard(shuffle.dropped)
+        simulation.agents.add_many([shuffle.removed])
+        simulation.agents.remove(shuffle.removed)
+        simulation.agents.add(shuffle.removed)
+        assert shuffle.kept._exists
+        source.step_complete = True
+
+    test_sim = core.Simulation()
+    test_sim.agents.deferral = test_sim.agents.DEFER_STEP
+
+    shuffler = core.Agent()
+    shuffler.decision = decision.RandomSingleCastDecision()
+    shuffler.actions["shuffle"] = shuffle
+    test_sim.agents.add(shuffler)
+
+    shuffle.kept = core.Agent()
+    shuffle.dropped = core.Agent()
+    shuffle.removed = core.Agent()
+    test_sim.agents.add_many([shuffle.kept, shuffle.removed])
+
+    common.step_simulate_interpolation(test_sim)
+
+    assert shuffle.kept in test_sim.agents
+    assert shuffle.removed in test_sim.agents
+    assert not shuffle.dropped in test_sim.agents
+    assert len(test_sim.agents) == 3
+    assert test_sim.agents.num_pending == 0
+
+def test_deferral_readd_moved():
+    from adjsim import core, decision
+
+    def relocate(simulation, source):
+        # The agent is dropped from the grid upon moving while removed, and restored upon being re-added.
+        simulation.agents.remove(relocate.target)
+        relocate.target.pos = np.array([5.5, 5.5])
+        simulation.agents.add(relocate.target)
+        source.step_complete = True
+
+    test_sim = core.Simulation()
+    test_sim.agents.deferral = test_sim.agents.DEFER_STEP
+    test_sim.indices.grid.initialize(1)
+
+    mover = core.Agent()
+    mover.decision = decision.RandomSingleCastDecision()
+    mover.actions["relocate"] = relocate
+    test_sim.agents.add(mover)
+
+    relocate.target = core.SpatialAgent(pos=np.array([0.5, 0.5]))
+    test_sim.agents.add(relocate.target)
+
+    common.step_simulate_interpolation(test_sim)
+
+    assert relocate.target in test_sim.agents
+    assert relocate.target in test_sim.indices.grid.get_inhabitants(np.array([5, 5]))
+    assert not relocate.target in test_sim.indices.grid.get_inhabitants(np.array([0, 0]))
+
+def test_deferral_clear():
+    from adjsim import core, decision
+
+    def wipe(simulation, source):
+        simulation.agents.add(core.Agent())
+        simulation.agents.clear()
+        assert len(simulation.agents) == wipe.initial_len
+
+        with pytest.raises(KeyError):
+            simulation.agents.pop()
+
+        source.step_complete = True
+
+    test_sim = core.Simulation()
+    test_sim.agents.deferral = test_sim.agents.DEFER_STEP
+
+    wiper = core.Agent()
+    wiper.decision = decision.RandomSingleCastDecision()
+    wiper.actions["wipe"] = wipe
+    test_sim.agents.add(wiper)
+    test_sim.agents.add_many([core.Agent() for _ in range(4)])
+
+    wipe.initial_len = len(test_sim.agents)
+    test_sim.start()
+    test_sim.step()
+    test_sim.end()
+
+    assert len(test_sim.agents) == 0
+    assert test_sim.agents.num_pending == 0
+
+def test_deferral_order():
+    from adjsim import core, decision
+
+    def spawn(simulation, source):
+        simulation.agents.add(core.Agent())
+        assert len(simulation.agents) == spawn.expected_len
+        source.step_complete = True
+
+    def check(simulation, source):
+        # Changes from the previous order bucket have been applied.
+        assert len(simulation.agents) == spawn.expected_len + 1
+        source.step_complete = True
+
+    test_sim = core.Simulation()
+    test_sim.agents.deferral = test_sim.agents.DEFER_ORDER
+
+    spawner = core.Agent()
+    spawner.decision = decision.RandomSingleCastDecision()
+    spawner.actions["spawn"] = spawn
+    test_sim.agents.add(spawner)
+
+    checker = core.Agent()
+    checker.order = 1
+    checker.decision = decision.RandomSingleCastDecision()
+    checker.actions["check"] = check
+    test_sim.agents.add(checker)
+
+    spawn.expected_len = 2
+    test_sim.start()
+    test_sim.step()
+    test_sim.end()
+
+    assert len(test_sim.agents) == 3
+
+def test_deferral_invalid():
+    from adjsim import core
+
+    test_sim = core.Simulation()
+
+    with pytest.raises(ValueError):
+        test_sim.agents.deferral = "sometimes"
+
+    agent = core.Agent()
+    test_sim.agents.add(agent)
+    test_sim.agents._begin_deferral()
+    test_sim.agents.deferral = test_sim.agents.DEFER_STEP
+    test_sim.agents._begin_deferral()
+
+    test_sim.agents.remove(agent)
+    with pytest.raises(KeyError):
+        test_sim.agents.remove(agent)
+
+    test_sim.agents._end_deferral()
+    assert len(test_sim.agents) == 0
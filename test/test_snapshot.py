@@ -0,0 +1,216 @@
+import sys
+import os
+import pytest
+
+import numpy as np
+
+from . import common
+
+def _ids_by_x(records):
+    return {float(record["x"]): int(record["id"]) for record in records}
+
+def test_full():
+    from adjsim import core, color
+
+    test_sim = core.Simulation()
+    agents = [core.VisualAgent(pos=np.array([i, 2.*i]), size=i + 1, color=color.RED_DARK, style=2)
+              for i in range(3)]
+    test_sim.agents.add_many(agents)
+    test_sim.agents.add(core.SpatialAgent())
+
+    frame = test_sim.snapshots.full()
+    records = np.sort(frame.records, order="x")
+
+    assert len(frame) == 3
+    assert np.array_equal(records["x"], [0., 1., 2.])
+    assert np.array_equal(records["y"], [0., 2., 4.])
+    assert np.array_equal(records["size"], [1., 2., 3.])
+    assert np.all(records["style"] == 2)
+    assert all(frame.palette[index] == color.RED_DARK for index in records["color"])
+    assert len(set(records["id"])) == 3
+
+def test_qcolor():
+    from adjsim import core
+    from PyQt5 import QtGui
+
+    test_sim = core.Simulation()
+    agents = [core.VisualAgent(color=QtGui.QColor(255, 0, 0)), core.VisualAgent(color=QtGui.QColor("#ff0000")),
+              core.VisualAgent(color=QtGui.QColor(0, 0, 255, 128))]
+    test_sim.agents.add_many(agents)
+
+    # Equal colors share a palette entry, which QColor accepts back.
+    frame = test_sim.snapshots.full()
+    assert sorted(frame.palette) == ["#800000ff", "#ffff0000"]
+    assert all(QtGui.QColor(color).isValid() for color in frame.palette)
+
+    # Equal colors set later reuse the palette entry.
+    agents[0].color = QtGui.QColor(0, 0, 255, 128)
+    assert test_sim.snapshots.delta().palette == frame.palette
+
+def test_delta():
+    from adjsim import core, color
+
+    test_sim = core.Simulation()
+    agents = [core.VisualAgent(pos=np.array([i, 0.])) for i in range(4)]
+    test_sim.agents.add_many(agents)
+
+    ids = _ids_by_x(test_sim.snapshots.full().records)
+
+    # No changes.
+    assert len(test_sim.snapshots.delta()) == 0
+
+    agents[0].y = 5
+    agents[1].color = color.GREEN
+    agents[2].size = 3
+    test_sim.agents.remove(agents[3])
+    added = core.VisualAgent(pos=np.array([4., 0.]))
+    test_sim.agents.add(added)
+
+    delta = test_sim.snapshots.delta()
+    records = {int(record["id"]): record for record in delta.records}
+
+    assert len(delta.records) == 4
+    assert records[ids[0]]["y"] == 5
+    assert delta.palette[records[ids[1]]["color"]] == color.GREEN
+    assert records[ids[2]]["size"] == 3
+    assert len(set(records) - set(ids.values())) == 1
+    assert list(delta.removed) == [ids[3]]
+
+    # Changes are only reported once.
+    assert len(test_sim.snapshots.delta()) == 0
+
+def test_delta_transient_agent():
+    from adjsim import core
+
+    test_sim = core.Simulation()
+    test_sim.snapshots.full()
+
+    # Agents that are added and removed between frames are never encoded.
+    agent = core.VisualAgent()
+    test_sim.agents.add(agent)
+    test_sim.agents.remove(agent)
+
+    assert len(test_sim.snapshots.delta()) == 0
+
+def test_merge():
+    from adjsim import core
+
+    test_sim = core.Simulation()
+    agents = [core.VisualAgent(pos=np.array([i, 0.])) for i in range(3)]
+    test_sim.agents.add_many(agents)
+
+    full = test_sim.snapshots.full()
+    ids = _ids_by_x(full.records)
+
+    agents[0].y = 1
+    test_sim.agents.remove(agents[1])
+    added = core.VisualAgent(pos=np.array([3., 0.]))
+    test_sim.agents.add(added)
+    first = test_sim.snapshots.delta()
+
+    agents[0].y = 2
+    test_sim.agents.remove(added)
+    second = test_sim.snapshots.delta()
+
+    # Merged deltas are equivalent to applying both in turn.
+    delta = first.merge(second)
+    assert list(delta.records["id"]) == [ids[0]]
+    assert delta.records[0]["y"] == 2
+    assert ids[1] in delta.removed
+    assert not set(delta.records["id"]) & set(delta.removed)
+
+    # Merging into a full snapshot yields the current state.
+    merged = full.merge(first).merge(second)
+    assert np.array_equal(np.sort(merged.records, order="id"),
+                          np.sort(test_sim.snapshots.full().records, order="id"))
+
+    # A full snapshot supersedes pending changes.
+    assert first.merge(full) is full
+
+def test_simulate():
+    from adjsim import core, decision
+
+    def move(simulation, source):
+        source.x += 1
+        source.size += 1
+        source.step_complete = True
+
+    class TestAgent(core.VisualAgent):
+        def __init__(self):
+            super().__init__(pos=np.array([0., 0.]), size=1)
+            self.decision = decision.RandomSingleCastDecision()
+            self.actions["move"] = move
+
+    test_sim = core.Simulation()
+    test_sim.agents.add_many(TestAgent() for _ in range(5))
+
+    test_sim.start()
+    frame = test_sim.snapshots.full()
+    for _ in range(common.INTERPOLATION_NUM_TIMESTEP):
+        test_sim.step()
+        frame = frame.merge(test_sim.snapshots.delta())
+    test_sim.end()
+
+    assert len(frame) == 5
+    assert np.all(frame.records["x"] == common.INTERPOLATION_NUM_TIMESTEP)
+    assert np.all(frame.records["size"] == common.INTERPOLATION_NUM_TIMESTEP + 1)
+
+def test_appearance_callback():
+    from adjsim import core, color
+
+    changed = []
+
+    test_sim = core.Simulation()
+    test_sim.callbacks.agent_appearance_changed.register(changed.append)
+
+    agent = core.VisualAgent()
+    agent.color = color.RED_DARK
+    assert changed == []
+
+    test_sim.agents.add(agent)
+    agent.size = 4
+    agent.color = color.GREEN
+    agent.style = 2
+
+    assert changed == [agent]*3
+    assert (agent.size, agent.color, agent.style) == (4, color.GREEN, 2)
+
+def test_interpolator():
+    from adjsim import core, snapshot
+
+    test_sim = core.Simulation()
+    agents = [core.VisualAgent(pos=np.array([i, 0.]), size=2) for i in range(3)]
+    test_sim.agents.add_many(agents)
+
+    interpolator = snapshot.FrameInterpolator()
+    interpolator.apply(test_sim.snapshots.full())
+
+    # Added agents grow in place.
+    assert len(interpolator) == 3
+    assert np.array_equal(interpolator.interpolate(0.)[:, 2], [0., 0., 0.])
+    assert np.array_equal(np.sort(interpolator.interpolate(1.)[:, 0]), [0., 1., 2.])
+
+    agents[0].y = 10
+    test_sim.agents.remove(agents[1])
+    interpolator.apply(test_sim.snapshots.delta())
+
+    # Moved agents start from their presented position, and removed agents shrink.
+    current = {float(x): (y, size) for x, y, size in interpolator.interpolate(0.5)}
+    assert current[0.] == (5., 2.)
+    assert current[1.] == (0., 1.)
+    assert current[2.] == (0., 2.)
+    assert np.count_nonzero(interpolator.exiting) == 1
+
+    # Removed agents are dropped upon the next frame, and transitions start from the interpolated state.
+    agents[0].y = 20
+    interpolator.apply(test_sim.snapshots.delta(), 0.5)
+
+    assert len(interpolator) == 2
+    current = {float(x): y for x, y, _ in interpolator.start}
+    assert current[0.] == 5.
+    assert not np.any(interpolator.exiting)
+
+    # Full snapshots remove absent agents.
+    test_sim.agents.remove(agents[2])
+    interpolator.apply(test_sim.snapshots.full())
+    assert np.count_nonzero(interpolator.exiting) == 1